@@ -0,0 +1,59 @@
+"""Export time and file size of a panel with many round holes, SVG against DXF with and without circles.
+
+Plain DXF writes every hole as a polyline of its approximating points, with circles on they become one
+CIRCLE entity each.
+
+Run from the repository root:
+
+    python -m benchmarks.dxf_export [holes]
+"""
+from __future__ import print_function
+import os
+import shutil
+import sys
+import tempfile
+import timeit
+
+from shapely.geometry import Point, Polygon
+
+from src.dxfgenerator import DxfGenerator
+from src.geometryresult import GeometryResult
+from src.svggenerator import SvgGenerator
+
+WRITERS = [
+    ("svg", ".svg", SvgGenerator()),
+    ("dxf", ".dxf", DxfGenerator()),
+    ("dxf circles", ".dxf", DxfGenerator(circles=True)),
+]
+
+
+def create_panel(count, columns=100, radius=2, resolution=32):
+    holes = [Point(6 + (i % columns) * 12, 6 + (i // columns) * 6).buffer(radius, resolution) for i in range(count)]
+    width, height = columns * 12, (count // columns + 1) * 6
+    return Polygon([(0, 0), (width, 0), (width, height), (0, height)], [hole.exterior.coords for hole in holes])
+
+
+def measure(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 10000
+    result = GeometryResult(create_panel(count))
+    # the buffers are shared by all writers, build them outside of the measurement
+    result.buffers()
+
+    directory = tempfile.mkdtemp()
+    try:
+        print("%d holes" % count)
+        print("%11s | %8s | %9s" % ("writer", "time [s]", "size [MB]"))
+        for name, extension, writer in WRITERS:
+            filename = os.path.join(directory, name.replace(" ", "_") + extension)
+            elapsed = measure(lambda: writer.write(result, filename))
+            print("%11s | %8.3f | %9.2f" % (name, elapsed, os.path.getsize(filename) / 1e6))
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    main(sys.argv)
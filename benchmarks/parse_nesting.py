@@ -0,0 +1,58 @@
+"""Parse time against CSG nesting depth, with and without packrat memoization.
+
+Run from the repository root:
+
+    python -m benchmarks.parse_nesting [max_depth]
+"""
+from __future__ import print_function
+import os
+import sys
+import timeit
+
+from src.cadfileparser import get_grammar, ParseContext, enable_packrat
+
+
+def create_nested_source(depth):
+    lines = ["margin = 5;", "difference() {", "rect(300, 300);"]
+
+    for level in range(depth):
+        lines.append("union() {" if level % 2 == 0 else "difference() {")
+        lines.append("for (i%d = [0:1]) {" % level)
+        lines.append("translate((i%d * 10 + (margin - 1)) * 2, ((i%d + 1) * 3))" % (level, level))
+        lines.append("circle(r=(2 + 1) * 3, $fn=(8 * 2));")
+
+    lines.append("}" * (2 * depth))
+    lines.append("}")
+
+    return "\n".join(lines)
+
+
+def measure(source, repeat=3):
+    grammar = get_grammar()
+    devnull = open(os.devnull, 'w')
+    stdout = sys.stdout
+    sys.stdout = devnull
+    try:
+        return min(timeit.repeat(lambda: grammar.parse_string(source, ParseContext()), number=1, repeat=repeat))
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+
+
+def main(argv):
+    max_depth = int(argv[1]) if len(argv) > 1 else 12
+    depths = range(1, max_depth + 1)
+    sources = dict((depth, create_nested_source(depth)) for depth in depths)
+
+    # packrat can't be switched off again, so all plain runs have to come first
+    plain = dict((depth, measure(sources[depth])) for depth in depths)
+    enable_packrat()
+    packrat = dict((depth, measure(sources[depth])) for depth in depths)
+
+    print("%5s | %10s | %11s | %7s" % ("depth", "plain [s]", "packrat [s]", "speedup"))
+    for depth in depths:
+        print("%5d | %10.4f | %11.4f | %6.2fx" % (depth, plain[depth], packrat[depth], plain[depth] / packrat[depth]))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,54 @@
+"""Parse time of the pyparsing grammar against the recursive-descent backend on a generated part file.
+
+Run from the repository root:
+
+    python -m benchmarks.parser_backends [lines]
+"""
+from __future__ import print_function
+import os
+import sys
+import timeit
+
+from src.cadfileparser import get_backend, ParseContext, ParserBackend
+
+
+def create_part_source(lines):
+    result = ["hole_radius = 3;", "spacing = 12;", "margin = 4;", "difference() {", "rect(5000, 5000);", "union() {"]
+
+    for i in range(max(lines - len(result) - 2, 0) // 2):
+        result.append("translate((%d * spacing + margin) / 2, (%d - 1) * spacing + margin)" % (i % 100, i // 100))
+        result.append("circle(r=hole_radius * 1.5, $fn=32);")
+
+    result.append("}")
+    result.append("}")
+
+    return "\n".join(result)
+
+
+def measure(backend, source, repeat):
+    parser = get_backend(backend)
+    devnull = open(os.devnull, 'w')
+    stdout = sys.stdout
+    sys.stdout = devnull
+    try:
+        return min(timeit.repeat(lambda: parser.parse_string(source, ParseContext()), number=1, repeat=repeat))
+    finally:
+        sys.stdout = stdout
+        devnull.close()
+
+
+def main(argv):
+    lines = int(argv[1]) if len(argv) > 1 else 10000
+    source = create_part_source(lines)
+
+    pyparsing_time = measure(ParserBackend.PyParsing, source, 1)
+    recursive_descent_time = measure(ParserBackend.RecursiveDescent, source, 3)
+
+    print("%d lines" % len(source.splitlines()))
+    print("%-17s | %8.4f s" % (ParserBackend.PyParsing, pyparsing_time))
+    print("%-17s | %8.4f s" % (ParserBackend.RecursiveDescent, recursive_descent_time))
+    print("speedup: %.1fx" % (pyparsing_time / recursive_descent_time))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,71 @@
+"""Cost of the profiling instrumentation: generating a program of single statements with profiling off, on
+and on with per node attribution, and the cost of one call of a profiled function that does nothing.
+
+Run from the repository root:
+
+    python -m benchmarks.profiling_overhead [statements]
+"""
+from __future__ import print_function
+import os
+import sys
+import tempfile
+import timeit
+
+from src import profiling
+from src.cadfileparser import FcadParser
+from src.geometrygenerator import GeometryGenerator
+
+
+def create_program(count):
+    """A union of translated and rotated circles, written out one by one, so nothing is batched."""
+    lines = ["union() {"]
+    for i in range(count):
+        lines.append("    translate(%d, %d) rotate(%d, 0, 0) circle(%d);" % (i % 50 * 4, i // 50 * 4, i % 90, 1 + i % 3))
+    lines.append("}")
+    return "\n".join(lines)
+
+
+def measure(func, repeat=5):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def nothing():
+    pass
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 2000
+    handle, filename = tempfile.mkstemp(suffix=".fcad")
+    with os.fdopen(handle, "w") as f:
+        f.write(create_program(count))
+    try:
+        ast, error = FcadParser(filename).parse()
+    finally:
+        os.remove(filename)
+
+    # no subtree cache, every run generates everything
+    generator = GeometryGenerator(800, 600, subtree_cache_size=0)
+    generate = lambda: generator.generate(ast)
+
+    profiling.disable_profiling()
+    disabled = measure(generate)
+    profiling.enable_profiling()
+    enabled = measure(generate)
+    calls = sum(timer["count"] for timer in profiling.get_report()["timers"].values())
+    profiling.enable_profiling(per_node=True)
+    per_node = measure(generate)
+    profiling.disable_profiling()
+
+    print("%d statements, %d timed calls per run" % (count, calls // 5))
+    print("%9s | %8s" % ("profiling", "time [s]"))
+    for name, elapsed in (("off", disabled), ("on", enabled), ("per node", per_node)):
+        print("%9s | %8.4f" % (name, elapsed))
+
+    number = 1000000
+    plain = min(timeit.repeat(nothing, number=number, repeat=3))
+    wrapped = min(timeit.repeat(profiling.profiled("nothing")(nothing), number=number, repeat=3))
+    print("a profiled call while off costs %.3f us more" % ((wrapped - plain) / number * 1e6))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
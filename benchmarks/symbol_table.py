@@ -0,0 +1,59 @@
+"""Symbol table insert and lookup time against the number of globals.
+
+Run from the repository root:
+
+    python -m benchmarks.symbol_table [globals]
+"""
+from __future__ import print_function
+import sys
+import timeit
+
+from src.cadfileparser import SymbolTable, KINDS, get_backend, ParseContext, ParserBackend
+
+
+def fill(count):
+    symtab = SymbolTable()
+    for i in range(count):
+        symtab.insert_global_var("var%d" % i, i)
+    return symtab
+
+
+def lookup_all(symtab, count):
+    for i in range(count):
+        symtab.get_value("var%d" % i, KINDS.GLOBAL_VAR, None)
+
+
+def lookup_nested(symtab, count, depth):
+    scope = symtab
+    for i in range(depth):
+        scope = scope.create_scope()
+        scope.insert_loop_var("i%d" % i, i)
+
+    for i in range(count):
+        scope.get_value("var%d" % i, KINDS.GLOBAL_VAR, None)
+
+
+def create_globals_source(count):
+    lines = ["var0 = 1;"]
+    lines.extend("var%d = var%d + %d;" % (i, i - 1, i) for i in range(1, count))
+    lines.append("circle(var%d);" % (count - 1))
+    return "\n".join(lines)
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 10000
+
+    print("%-28s | %8s" % ("%d globals" % count, "time [s]"))
+    print("%-28s | %8.4f" % ("insert", min(timeit.repeat(lambda: fill(count), number=1, repeat=3))))
+
+    symtab = fill(count)
+    print("%-28s | %8.4f" % ("lookup", min(timeit.repeat(lambda: lookup_all(symtab, count), number=1, repeat=3))))
+    print("%-28s | %8.4f" % ("lookup through 8 scopes", min(timeit.repeat(lambda: lookup_nested(symtab, count, 8), number=1, repeat=3))))
+
+    source = create_globals_source(count)
+    parser = get_backend(ParserBackend.RecursiveDescent)
+    print("%-28s | %8.4f" % ("parse (recursive descent)", min(timeit.repeat(lambda: parser.parse_string(source, ParseContext()), number=1, repeat=3))))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,55 @@
+"""Union time against the number of circles, cascaded union against the old pairwise left fold.
+
+The circles are laid out on a grid and overlap their neighbours, like the holes of a perforated plate.
+The pairwise fold is quadratic, so it only runs up to the given limit.
+
+Run from the repository root:
+
+    python -m benchmarks.union_scaling [pairwise_limit]
+"""
+from __future__ import print_function
+import math
+import sys
+import timeit
+
+from shapely.geometry import Point
+
+from src.geometrygenerator import GeometryGenerator
+
+SIZES = [1000, 10000, 50000]
+
+
+def create_circles(count, radius=6, spacing=10, resolution=8):
+    columns = int(math.ceil(math.sqrt(count)))
+    return [Point((i % columns) * spacing, (i // columns) * spacing).buffer(radius, resolution) for i in range(count)]
+
+
+def pairwise_union(elements):
+    result = elements[0]
+    for elem in elements[1:]:
+        result = result.union(elem)
+    return result
+
+
+def measure(func, repeat=3):
+    return min(timeit.repeat(func, number=1, repeat=repeat))
+
+
+def main(argv):
+    pairwise_limit = int(argv[1]) if len(argv) > 1 else 1000
+    generator = GeometryGenerator(800, 600)
+
+    print("%7s | %12s | %12s | %7s" % ("circles", "cascaded [s]", "pairwise [s]", "speedup"))
+    for size in SIZES:
+        circles = create_circles(size)
+        cascaded = measure(lambda: generator.create_union(circles))
+
+        if size <= pairwise_limit:
+            pairwise = measure(lambda: pairwise_union(circles), repeat=1)
+            print("%7d | %12.4f | %12.4f | %6.2fx" % (size, cascaded, pairwise, pairwise / cascaded))
+        else:
+            print("%7d | %12.4f | %12s | %7s" % (size, cascaded, "-", "-"))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
@@ -0,0 +1,56 @@
+"""Work per repaint against the zoom, for a panel with many holes: rings that overlap the screen, the
+level of detail used for them and the points they are drawn with.
+
+The Qt drawing itself isn't measured, it is proportional to the points drawn.
+
+Run from the repository root:
+
+    python -m benchmarks.viewport_culling [holes]
+"""
+from __future__ import print_function
+import sys
+import timeit
+
+from shapely.geometry import Point, MultiPolygon
+
+from src.geometryresult import GeometryResult
+from src.viewport import Viewport, RingIndex
+
+SCALES = [8, 2, 1, 0.5, 0.1]
+SCREEN = (0, 0, 800, 600)
+
+
+def create_panel(count, columns=100, radius=2, resolution=32):
+    return MultiPolygon([Point(6 + (i % columns) * 12, 6 + (i // columns) * 6).buffer(radius, resolution)
+                         for i in range(count)])
+
+
+def repaint(index, viewport):
+    """The points a repaint draws, tiny rings count as one."""
+    pixel_size = viewport.pixel_size()
+    level = index.level_for(pixel_size)
+    points = 0
+    for position in index.visible(viewport.visible_area(*SCREEN)):
+        points += 1 if index.is_tiny(position, pixel_size) else len(index.outline(level, position))
+    return points
+
+
+def main(argv):
+    count = int(argv[1]) if len(argv) > 1 else 10000
+    result = GeometryResult(create_panel(count))
+    print("%d holes, %d vertices" % (count, len(result.coordinates)))
+
+    index = RingIndex(result)
+    print("%5s | %7s | %5s | %6s | %9s" % ("scale", "visible", "level", "points", "query [ms]"))
+    for scale in SCALES:
+        viewport = Viewport()
+        viewport.zoom_at(0, 0, scale)
+        # the first repaint at a level simplifies it, that happens once per result
+        points = repaint(index, viewport)
+        elapsed = min(timeit.repeat(lambda: index.visible(viewport.visible_area(*SCREEN)), number=1, repeat=5))
+        print("%5g | %7d | %5d | %6d | %9.2f" % (scale, len(index.visible(viewport.visible_area(*SCREEN))),
+                                                 index.level_for(viewport.pixel_size()), points, elapsed * 1000))
+
+
+if __name__ == '__main__':
+    main(sys.argv)
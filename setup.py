@@ -14,7 +14,7 @@ if sys.version_info < (2, 7):
     raise Exception('OpenSCAD2D %s requires Python 2.6 or higher.' % _VERSION)
 
 
-_PACKAGES = find_packages(exclude=["*.test", "*.test.*", "test.*", "test"])
+_PACKAGES = find_packages(exclude=["*.test", "*.test.*", "test.*", "test", "benchmarks", "benchmarks.*"])
 
 _INSTALL_REQUIRES = [
     'pylint>=1.4',
@@ -22,8 +22,7 @@ _INSTALL_REQUIRES = [
     'pylint-common>=0.2.1',
     'requirements-detector>=0.3',
     'setoptconf>=0.2.0',
-    'pyparsing==2.0.3',
-    'pywatch==0.4',
+    'pyparsing==2.4.7',
     'shapely',
     'svgwrite',
 ]
@@ -44,6 +43,8 @@ _CLASSIFIERS = (
 )
 
 _OPTIONAL = {
+    # loops of plain primitives are generated with array operations
+    'vectorized': ['numpy', 'shapely>=2.0'],
 }
 _OPTIONAL['with_everything'] = [req for req_list in _OPTIONAL.values() for req in req_list]
 
@@ -65,6 +66,7 @@ setup(
     entry_points={
         'console_scripts': [
             'openscad = openscad.run:main',
+            'openscad2d-batch = src.batch:main',
         ],
     },
     install_requires=_INSTALL_REQUIRES,
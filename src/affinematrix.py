@@ -0,0 +1,59 @@
+"""3x3 affine matrices as nested tuples, built the same way shapely.affinity builds them."""
+import math
+
+from shapely import affinity
+
+__author__ = 'sven'
+
+IDENTITY = ((1.0, 0.0, 0.0),
+            (0.0, 1.0, 0.0),
+            (0.0, 0.0, 1.0))
+
+
+def translation(x, y):
+    return ((1.0, 0.0, x),
+            (0.0, 1.0, y),
+            (0.0, 0.0, 1.0))
+
+
+def rotation(angle, origin_x, origin_y, use_radians=False):
+    if not use_radians:
+        angle = angle * math.pi / 180.0
+    cos = math.cos(angle)
+    sin = math.sin(angle)
+    # snapped like shapely does, so right angles stay exact
+    if abs(cos) < 2.5e-16:
+        cos = 0.0
+    if abs(sin) < 2.5e-16:
+        sin = 0.0
+
+    return ((cos, -sin, origin_x - origin_x * cos + origin_y * sin),
+            (sin, cos, origin_y - origin_x * sin - origin_y * cos),
+            (0.0, 0.0, 1.0))
+
+
+def scaling(x, y, origin_x, origin_y):
+    return ((x, 0.0, origin_x - origin_x * x),
+            (0.0, y, origin_y - origin_y * y),
+            (0.0, 0.0, 1.0))
+
+
+def multiply(outer, inner):
+    """Matrix applying inner first and outer second."""
+    return tuple(tuple(sum(outer[row][k] * inner[k][column] for k in range(3)) for column in range(3)) for row in range(3))
+
+
+def is_axis_aligned(matrix):
+    """True without rotation or shear, bounding boxes then map onto bounding boxes."""
+    return matrix[0][1] == 0.0 and matrix[1][0] == 0.0
+
+
+def transform_point(matrix, x, y):
+    return (matrix[0][0] * x + matrix[0][1] * y + matrix[0][2],
+            matrix[1][0] * x + matrix[1][1] * y + matrix[1][2])
+
+
+def transform(geom, matrix):
+    if matrix == IDENTITY:
+        return geom
+    return affinity.affine_transform(geom, [matrix[0][0], matrix[0][1], matrix[1][0], matrix[1][1], matrix[0][2], matrix[1][2]])
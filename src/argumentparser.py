@@ -1,4 +1,8 @@
-from src import cadfileparser
+import sys
+from src import cadfileparser, profiling
+
+if sys.version > '3':
+    long = int
 
 __author__ = 'sven'
 
@@ -69,6 +73,7 @@ class ArgumentParser(object):
 
         return result
 
+    @profiling.profiled("ArgumentParser.parse")
     def parse(self, arguments):
         result = [definition["default"] for definition in self.argument_definitions]
 
@@ -0,0 +1,245 @@
+from __future__ import print_function
+import sys
+
+from src import cadfileparser, profiling
+from src.cadfileparser import Statement, Scope, ForLoop, Vector, Assignment, Variable, UnresolvedCalculation, BoolOperand, \
+    KINDS, OPERATORS
+
+if sys.version > '3':
+    long = int
+
+__author__ = 'sven'
+
+
+def is_constant(value):
+    return isinstance(value, (int, long, float)) and not isinstance(value, bool)
+
+
+def structural_key(node):
+    """Hashable description of an AST node, equal for nodes that describe the same thing."""
+    if isinstance(node, Statement):
+        return ("statement", node.type, node.name, structural_key(node.arguments), structural_key(node.modifiers or []))
+    elif isinstance(node, Scope):
+        return ("scope", node.name, structural_key(node.arguments), structural_key(node.children),
+                structural_key(node.modifiers or []))
+    elif isinstance(node, ForLoop):
+        return ("for", node.variable, structural_key(node.loop_range.x), structural_key(node.loop_range.y),
+                structural_key(node.children), structural_key(node.modifiers or []))
+    elif isinstance(node, Assignment):
+        return ("assignment", node.identifier, structural_key(node.value))
+    elif isinstance(node, UnresolvedCalculation):
+        return ("calculation",) + tuple(structural_key(term) for term in node.stack)
+    elif isinstance(node, Variable):
+        return ("variable", node.identifier)
+    elif isinstance(node, BoolOperand):
+        return ("bool", node.value)
+    elif isinstance(node, (list, tuple)):
+        return tuple(structural_key(child) for child in node)
+    elif is_constant(node) or isinstance(node, str):
+        return (type(node).__name__, node)
+    else:
+        return ("object", repr(node))
+
+
+def count_nodes(node):
+    """Number of AST nodes, loop bodies are counted once no matter how many iterations they run."""
+    if isinstance(node, Statement):
+        return 1 + count_nodes(node.arguments) + count_nodes(node.modifiers or [])
+    elif isinstance(node, ForLoop):
+        return 1 + count_nodes([node.loop_range.x, node.loop_range.y]) + count_nodes(node.children) + \
+               count_nodes(node.modifiers or [])
+    elif isinstance(node, Scope):
+        return 1 + count_nodes(node.arguments) + count_nodes(node.children) + count_nodes(node.modifiers or [])
+    elif isinstance(node, Assignment):
+        return 1 + count_nodes(node.value)
+    elif isinstance(node, UnresolvedCalculation):
+        return 1 + count_nodes(node.stack)
+    elif isinstance(node, (list, tuple)):
+        return sum(count_nodes(child) for child in node)
+    elif isinstance(node, Variable):
+        return 1
+    else:
+        return 0
+
+
+class OptimizationReport(object):
+    def __init__(self):
+        self.nodes_before = 0
+        self.nodes_after = 0
+        # calculation nodes replaced by constants
+        self.folded = 0
+        # calculation nodes folded once per loop instead of once per iteration
+        self.hoisted = 0
+        # assign scopes dissolved after their variables were substituted, plus loops that never run
+        self.flattened = 0
+        # primitive calls dropped because an identical one already exists in the same operation
+        self.duplicates = 0
+
+    @property
+    def removed(self):
+        return self.nodes_before - self.nodes_after
+
+    def __repr__(self):
+        return "{OPTIMIZATION: removed " + str(self.removed) + " of " + str(self.nodes_before) + " nodes (folded " + \
+               str(self.folded) + ", hoisted " + str(self.hoisted) + ", flattened " + str(self.flattened) + \
+               ", duplicates " + str(self.duplicates) + ")}"
+
+
+class AstOptimizer(object):
+    """Optimization pass between FcadParser.parse() and GeometryGenerator.generate().
+
+       Calculations are folded into constants as soon as all their variables are known. Loop bodies
+       are folded once with everything that doesn't depend on the loop variable, the loop itself stays
+       symbolic, and identical primitive calls within a union, intersection or the cutters of a
+       difference are dropped. The input AST is left untouched.
+    """
+
+    def __init__(self, symtab=None):
+        self.symtab = symtab
+        self.report = OptimizationReport()
+        self._invariant_cache = {}
+
+    @profiling.profiled("AstOptimizer.optimize")
+    def optimize(self, ast):
+        self.report = OptimizationReport()
+        self._invariant_cache = {}
+
+        self.report.nodes_before = count_nodes(ast)
+        result = self.deduplicate(self.optimize_list(ast, {}, True), 0)
+        self.report.nodes_after = count_nodes(result)
+
+        self._invariant_cache = {}
+        return result
+
+    def fold(self, term, env):
+        if isinstance(term, Variable):
+            if term.identifier in env:
+                return env[term.identifier]
+            if self.symtab is not None and self.symtab.contains(term.identifier, KINDS.GLOBAL_VAR, None):
+                value = self.symtab.get_value(term.identifier, KINDS.GLOBAL_VAR, None)
+                if is_constant(value):
+                    return value
+            return term
+        elif isinstance(term, UnresolvedCalculation):
+            op1, op2, op = term.stack
+            folded1 = self.fold(op1, env)
+            folded2 = self.fold(op2, env)
+
+            if is_constant(folded1) and is_constant(folded2):
+                self.report.folded += 1
+                return OPERATORS[op](folded1, folded2)
+            elif folded1 is op1 and folded2 is op2:
+                return term
+            return UnresolvedCalculation([folded1, folded2, op])
+        elif isinstance(term, Assignment):
+            value = self.fold(term.value, env)
+            return term if value is term.value else Assignment(term.identifier, value)
+        else:
+            return term
+
+    def fold_list(self, terms, env):
+        result = [self.fold(term, env) for term in terms]
+        if all(folded is term for folded, term in zip(result, terms)):
+            return terms
+        return result
+
+    def optimize_statement(self, statement, env):
+        arguments = self.fold_list(statement.arguments, env)
+        modifiers = statement.modifiers
+        if modifiers:
+            modifiers = [self.optimize_statement(modifier, env) for modifier in modifiers]
+            if all(optimized is modifier for optimized, modifier in zip(modifiers, statement.modifiers)):
+                modifiers = statement.modifiers
+
+        if arguments is statement.arguments and modifiers is statement.modifiers:
+            return statement
+        return Statement(statement.type, statement.name, arguments, modifiers)
+
+    def optimize_scope(self, scope, env, flatten):
+        children = self.optimize_list(scope.children, env, flatten)
+        if flatten:
+            children = self.deduplicate(children, 1 if scope.name == "difference" else 0, scope.name)
+        modifiers = [self.optimize_statement(modifier, env) for modifier in scope.modifiers] if scope.modifiers else scope.modifiers
+        return Scope(scope.name, self.fold_list(scope.arguments, env), children, modifiers)
+
+    def optimize_assign(self, scope, env, flatten):
+        bindings = [self.fold(assignment, env) for assignment in scope.arguments]
+        names = set(assignment.identifier for assignment in bindings)
+        outer_env = dict((name, value) for name, value in env.items() if name not in names)
+
+        # everything in the body that doesn't depend on the bindings is folded once per shared body
+        invariant = self.fold_invariant(scope.children, outer_env)
+
+        if not flatten or scope.modifiers or not all(is_constant(assignment.value) for assignment in bindings):
+            return [Scope(scope.name, bindings, invariant, scope.modifiers)]
+
+        self.report.flattened += 1
+        return self.optimize_list(invariant, dict((assignment.identifier, assignment.value) for assignment in bindings), True)
+
+    def optimize_loop(self, loop, env):
+        start = self.fold(loop.loop_range.x, env)
+        end = self.fold(loop.loop_range.y, env)
+        if is_constant(start) and is_constant(end) and start >= end:
+            self.report.flattened += 1
+            return []
+
+        # the loop variable shadows anything of the same name for the body and the modifiers
+        inner_env = dict((name, value) for name, value in env.items() if name != loop.variable)
+        children = self.fold_invariant(loop.children, inner_env)
+        modifiers = [self.optimize_statement(modifier, inner_env) for modifier in loop.modifiers] if loop.modifiers else loop.modifiers
+
+        loop_range = loop.loop_range
+        if start is not loop_range.x or end is not loop_range.y:
+            loop_range = Vector(start, end)
+        return [ForLoop(loop.variable, loop_range, children, modifiers)]
+
+    def fold_invariant(self, children, env):
+        key = (id(children), tuple(sorted(env.items())))
+        cached = self._invariant_cache.get(key)
+        if cached is not None:
+            return cached[1]
+
+        folded, hoisted = self.report.folded, self.report.hoisted
+        result = self.optimize_list(children, env, False)
+        # nested loops already counted their part in the folded delta
+        self.report.hoisted = hoisted + self.report.folded - folded
+
+        # the body is kept alive along with the result, so its id can't be reused while cached
+        self._invariant_cache[key] = (children, result)
+        return result
+
+    def optimize_list(self, nodes, env, flatten):
+        """Folds nodes with env. Without flatten the structure is kept, as needed for shared loop bodies."""
+        result = []
+
+        for node in nodes:
+            if isinstance(node, Statement):
+                result.append(self.optimize_statement(node, env))
+            elif isinstance(node, ForLoop):
+                result.extend(self.optimize_loop(node, env))
+            elif isinstance(node, Scope) and node.name == "assign":
+                result.extend(self.optimize_assign(node, env, flatten))
+            elif isinstance(node, Scope):
+                result.append(self.optimize_scope(node, env, flatten))
+            else:
+                result.append(node)
+
+        return result
+
+    def deduplicate(self, nodes, start, scope_name="union"):
+        if scope_name not in ("union", "intersection", "difference"):
+            return nodes
+
+        result = nodes[:start]
+        seen = set()
+
+        for node in nodes[start:]:
+            if isinstance(node, Statement) and node.type == cadfileparser.StatementType.Primitive:
+                key = structural_key(node)
+                if key in seen:
+                    self.report.duplicates += 1
+                    continue
+                seen.add(key)
+            result.append(node)
+
+        return result
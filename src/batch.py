@@ -0,0 +1,201 @@
+"""Headless batch renderer, turns many .fcad files into SVG and DXF files without loading Qt.
+
+    openscad2d-batch parts/ "jobs/*.fcad" -o out/ -f svg -f dxf -j 8 --summary summary.json
+"""
+from __future__ import print_function
+import argparse
+import glob
+import json
+import os
+import sys
+import time
+
+try:
+    from concurrent.futures import ProcessPoolExecutor
+except ImportError:
+    ProcessPoolExecutor = None
+
+from src import profiling
+from src.astoptimizer import AstOptimizer
+from src.cadfileparser import FcadParser, ParserBackend
+from src.diskcache import DiskCache
+from src.dxfgenerator import DxfGenerator
+from src.geometrygenerator import GeometryGenerator
+from src.svggenerator import SvgGenerator, DEFAULT_PRECISION
+
+__author__ = 'sven'
+
+# same drawing area as the GUI, so batch output matches its export
+SCREEN_SIZE = (800.0, 600.0)
+
+WRITERS = {
+    "svg": lambda options: SvgGenerator(precision=options["precision"], relative=options["relative"]),
+    "dxf": lambda options: DxfGenerator(circles=options["circles"]),
+}
+
+# generator and disk cache of the worker process, reused for every file it renders
+_worker = {}
+
+
+def find_inputs(patterns):
+    """.fcad files of the given files, directories and glob patterns, each one once and in order."""
+    result = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            filenames = sorted(glob.glob(os.path.join(pattern, "*.fcad")))
+        else:
+            filenames = sorted(glob.glob(pattern)) or [pattern]
+
+        for filename in filenames:
+            if filename not in result:
+                result.append(filename)
+    return result
+
+
+def output_filename(filename, output_dir, file_format):
+    base = os.path.splitext(os.path.basename(filename))[0] + "." + file_format
+    return os.path.join(output_dir if output_dir else os.path.dirname(filename), base)
+
+
+def find_collisions(filenames, output_dir, file_formats):
+    """Output files that more than one input would be written to, like a/part.fcad and b/part.fcad with -o."""
+    sources = {}
+    for filename in filenames:
+        for file_format in file_formats:
+            target = os.path.abspath(output_filename(filename, output_dir, file_format))
+            sources.setdefault(target, set()).add(os.path.realpath(filename))
+    return sorted(target for target, inputs in sources.items() if len(inputs) > 1)
+
+
+def get_worker_state(options):
+    if not _worker:
+        _worker["disk_cache"] = DiskCache(options["cache"]) if options["cache"] else None
+        _worker["generator"] = GeometryGenerator(SCREEN_SIZE[0], SCREEN_SIZE[1], disk_cache=_worker["disk_cache"])
+    return _worker["generator"], _worker["disk_cache"]
+
+
+def render_file(filename, options):
+    """Renders one file into every requested format. Returns its summary, errors included instead of raised."""
+    summary = {"file": filename, "outputs": [], "error": None}
+    start = time.time()
+    if options["profile"] and not profiling.is_profiling_enabled():
+        # worker processes that weren't forked from the main process
+        profiling.enable_profiling(options["profile_nodes"])
+
+    try:
+        generator, disk_cache = get_worker_state(options)
+
+        parser = FcadParser(filename, options["backend"], disk_cache=disk_cache)
+        ast, error = parser.parse()
+        summary["parse"] = time.time() - start
+        if error:
+            raise Exception(error)
+
+        step = time.time()
+        if options["optimize"]:
+            ast = AstOptimizer(parser.symtab).optimize(ast)
+        result = generator.generate(ast)
+        summary["generate"] = time.time() - step
+
+        step = time.time()
+        for file_format in options["formats"]:
+            target = output_filename(filename, options["output_dir"], file_format)
+            WRITERS[file_format](options).write(result, target)
+            summary["outputs"].append(target)
+        summary["write"] = time.time() - step
+    except Exception as ex:
+        summary["error"] = str(ex) or type(ex).__name__
+
+    summary["total"] = time.time() - start
+    if options["profile"]:
+        # handed back to the main process with the summary, see main()
+        summary["profile"] = profiling.take_samples()
+    return summary
+
+
+def render_files(filenames, options, workers=None):
+    """Summaries of all files in input order, spread over a process pool unless workers is 1."""
+    if workers == 1 or ProcessPoolExecutor is None or len(filenames) < 2:
+        return [render_file(filename, options) for filename in filenames]
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(render_file, filenames, [options] * len(filenames)))
+
+
+def print_summary(summaries, elapsed, out=None):
+    out = out or sys.stdout
+    width = max([len(summary["file"]) for summary in summaries] + [4])
+    for summary in summaries:
+        status = "ok" if summary["error"] is None else "FAILED " + summary["error"]
+        print("%-*s %8.3fs  %s" % (width, summary["file"], summary["total"], status), file=out)
+
+    failed = sum(1 for summary in summaries if summary["error"] is not None)
+    print("%d files, %d failed, %.3fs" % (len(summaries), failed, elapsed), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="openscad2d-batch", description="Renders .fcad files to SVG and DXF without a GUI.")
+    parser.add_argument("inputs", nargs="+", help=".fcad files, directories or glob patterns")
+    parser.add_argument("-o", "--output-dir", help="directory for the rendered files, next to the input files by default")
+    parser.add_argument("-f", "--format", dest="formats", action="append", choices=sorted(WRITERS.keys()),
+                        help="output format, may be given more than once (default: svg)")
+    parser.add_argument("-j", "--workers", type=int, default=None, help="worker processes (default: one per CPU)")
+    parser.add_argument("--backend", default=ParserBackend.PyParsing,
+                        choices=[ParserBackend.PyParsing, ParserBackend.RecursiveDescent])
+    parser.add_argument("--cache", help="on-disk cache shared between runs and workers")
+    parser.add_argument("--no-optimize", dest="optimize", action="store_false", help="skip the AST optimizer")
+    parser.add_argument("--summary", help="also write the per-file summary as JSON to this file")
+    parser.add_argument("--precision", type=int, default=DEFAULT_PRECISION, help="decimals of SVG coordinates")
+    parser.add_argument("--relative", action="store_true", help="relative SVG path coordinates, smaller files")
+    parser.add_argument("--circles", action="store_true",
+                        help="write circle outlines as DXF circles and arcs instead of polylines")
+    parser.add_argument("--profile", help="write call counts and timings of the render stages as JSON to this file")
+    parser.add_argument("--profile-nodes", action="store_true", help="also time every AST node in the profile")
+    args = parser.parse_args(argv)
+
+    filenames = find_inputs(args.inputs)
+    formats = args.formats or ["svg"]
+    collisions = find_collisions(filenames, args.output_dir, formats)
+    if collisions:
+        # the workers would overwrite each other's files in whatever order they finish
+        parser.error("several inputs would be written to %s" % ", ".join(collisions))
+    if args.output_dir and not os.path.isdir(args.output_dir):
+        os.makedirs(args.output_dir)
+
+    options = {
+        "formats": formats,
+        "output_dir": args.output_dir,
+        "backend": args.backend,
+        "cache": args.cache,
+        "optimize": args.optimize,
+        "precision": args.precision,
+        "relative": args.relative,
+        "circles": args.circles,
+        "profile": args.profile is not None,
+        "profile_nodes": args.profile_nodes,
+    }
+
+    if args.profile:
+        profiling.enable_profiling(args.profile_nodes)
+    try:
+        start = time.time()
+        summaries = render_files(filenames, options, args.workers)
+        elapsed = time.time() - start
+
+        if args.profile:
+            for summary in summaries:
+                profiling.merge_samples(summary.pop("profile"), summary["file"] + ": ")
+            profiling.write_report(args.profile)
+    finally:
+        profiling.disable_profiling()
+
+    print_summary(summaries, elapsed)
+    if args.summary:
+        with open(args.summary, "w") as f:
+            json.dump({"files": summaries, "elapsed": elapsed}, f, indent=2)
+
+    return 1 if any(summary["error"] is not None for summary in summaries) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
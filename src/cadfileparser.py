@@ -1,16 +1,19 @@
 from __future__ import print_function
-import pprint
+import hashlib
 import math
+import os
 import re
+import sys
+import threading
 from pyparsing import lineno, col, line, Suppress, Keyword, oneOf, Literal, infixNotation, opAssoc, Word, alphas, \
     alphanums, nums, CaselessLiteral, Combine, Optional, Forward, ZeroOrMore, delimitedList, FollowedBy, \
-    OneOrMore, restOfLine, cStyleComment, ParseException
-from src.log_exceptions import *
+    OneOrMore, restOfLine, cStyleComment, ParseException, ParserElement
+from src import tracing, profiling
 
 if sys.version > '3':
     long = int
-
-DEBUG = True
+    xrange = range
+    basestring = str
 
 # #########################################################################################
 ##########################################################################################
@@ -21,6 +24,7 @@ class KINDS(object):
     GLOBAL_VAR = "GLOBAL_VAR"
     MODULE = "MODULE"
     PARAMETER = "PARAMETER"
+    LOOP_VAR = "LOOP_VAR"
 
 class StatementType(object):
     Primitive = "primitive"
@@ -42,8 +46,8 @@ class SharedData(object):
 ##########################################################################################
 
 
-class ExceptionSharedData(object):
-    """Class for exception handling data"""
+class ExceptionSharedData(threading.local):
+    """Class for exception handling data, kept per thread so concurrent parses don't mix up positions"""
 
     def __init__(self):
         # position in currently parsed text
@@ -116,10 +120,26 @@ class SymbolTableEntry(object):
         self.parameters = []
 
 
+def value_key(entry):
+    """Comparable form of the value of a symbol table entry, None if there is no entry."""
+    return repr(entry.value) if entry is not None else None
+
+
 class SymbolTable(object):
-    def __init__(self):
-        """Initialization of the symbol table"""
+    def __init__(self, outer=None):
+        """Initialization of the symbol table.
+           outer - enclosing scope, consulted by lookups that miss in this one
+        """
+        self.outer = outer
+        # entries in insertion order, plus an index over (name, kind, parent)
         self.table = []
+        self.index = {}
+        # while not None, the value of every global variable looked up, as it was at the first lookup
+        self.reads = None
+
+    def create_scope(self):
+        """Returns a nested scope, e.g. for module parameters or loop variables"""
+        return SymbolTable(self)
 
     def error(self, text=""):
         """Symbol table error exception. It should happen only if index is out of range while accessing symbol table.
@@ -174,14 +194,17 @@ class SymbolTable(object):
 
     def insert_parameter(self, name, module):
         index = self.insert_id(name, KINDS.PARAMETER, module, None)
-        for entry in self.table:
-            if entry.name == module and entry.kind == KINDS.MODULE:
-                entry.parameters.append(name)
-                break
+        entry = self.find(module, KINDS.MODULE, None)
+        if entry is not None:
+            entry.parameters.append(name)
         return index
 
+    def insert_loop_var(self, name, value):
+        """Loop variables may shadow names of outer scopes, so there is no redefinition check"""
+        return self.insert(name, KINDS.LOOP_VAR, None, value)
+
     def insert_module(self, name):
-        index = self.insert_id(name, KINDS.MODULE, None)
+        index = self.insert_id(name, KINDS.MODULE, None, None)
         return index
 
     def insert_id(self, name, kind, parent, value):
@@ -191,28 +214,32 @@ class SymbolTable(object):
         else:
             raise SemanticException("Redefinition of '%s'" % name)
 
-    def contains(self, name, kind, parent):
-        result = False
-
-        for entry in self.table:
-            if entry.name == name and entry.kind == kind and entry.parent == parent:
-                result = True
-                break
+    def find(self, name, kind, parent):
+        """Returns the innermost entry matching name, kind and parent or None"""
+        key = (name, kind, parent)
+        scope = self
+        entry = None
 
-        return result
+        while scope is not None and entry is None:
+            entry = scope.index.get(key)
+            scope = scope.outer
 
-    def get_value(self, name, kind, parent):
-        result = False
+        if self.reads is not None and kind == KINDS.GLOBAL_VAR and parent is None:
+            self.reads.setdefault(name, value_key(entry))
+        return entry
 
-        for entry in self.table:
-            if entry.name == name and entry.kind == kind and entry.parent == parent:
-                result = entry.value
-                break
+    def contains(self, name, kind, parent):
+        return self.find(name, kind, parent) is not None
 
-        return result
+    def get_value(self, name, kind, parent):
+        entry = self.find(name, kind, parent)
+        return entry.value if entry is not None else False
 
     def insert(self, name, kind, parent, value):
-        self.table.append(SymbolTableEntry(name, kind, parent, value))
+        entry = SymbolTableEntry(name, kind, parent, value)
+        self.table.append(entry)
+        # like the former linear scan, the first entry for a key wins
+        self.index.setdefault((name, kind, parent), entry)
         return len(self.table)
 
 
@@ -237,6 +264,24 @@ class Scope(object):
     def __repr__(self):
         return "{SCOPE: " + self.name + " - " + repr(self.arguments) + " - " + repr(self.children) + " - " + repr(self.modifiers) + "}"
 
+class ForLoop(object):
+    """for loop with a symbolic range, the body is shared by all iterations and expanded only while generating."""
+
+    def __init__(self, variable, loop_range, children, modifiers):
+        self.variable = variable
+        self.loop_range = loop_range
+        self.children = children
+        self.modifiers = modifiers
+
+    def indices(self, start=None, end=None):
+        """Loop variable values, bounds that were unresolved at parse time have to be passed in."""
+        start = self.loop_range.x if start is None else start
+        end = self.loop_range.y if end is None else end
+        return xrange(start, end)
+
+    def __repr__(self):
+        return "{FORLOOP: " + self.variable + " = " + repr(self.loop_range) + " - " + repr(self.children) + " - " + repr(self.modifiers) + "}"
+
 class Statement(object):
     def __init__(self, statement_type, name, arguments, modifiers=None):
         self.type = statement_type
@@ -314,6 +359,21 @@ class BoolNot(object):
 class UnresolvedCalculation(object):
     def __init__(self, stack):
         self.stack = stack
+        self._compiled = None
+
+    def compile(self):
+        """Returns the calculation as a function of a variable lookup (name -> value).
+           It is built on first use and reused afterwards, the stack itself is never touched.
+        """
+        if self._compiled is None:
+            self._compiled = compile_term(self)
+        return self._compiled
+
+    def __getstate__(self):
+        # the compiled function can't be pickled, it is simply built again
+        state = dict(self.__dict__)
+        state["_compiled"] = None
+        return state
 
     def __repr__(self):
         return "{UNRESOLVED_CALCULATION: " + repr(self.stack) + "}"
@@ -322,24 +382,142 @@ class UnresolvedCalculation(object):
 ##########################################################################################
 
 
-class FcadParser(object):
-    def __init__(self, filename):
+OPERATORS = {
+    "+" : ( lambda a,b: a + b ),
+    "-" : ( lambda a,b: a - b ),
+    "*" : ( lambda a,b: a * b ),
+    "/" : ( lambda a,b: a / b ),
+    "^" : ( lambda a,b: a ** b )
+}
+
+
+def compile_term(term):
+    """Turns a calculation term into a closure taking a variable lookup function"""
+    if isinstance(term, Variable):
+        identifier = term.identifier
+        return lambda lookup: lookup(identifier)
+    elif not isinstance(term, UnresolvedCalculation):
+        return lambda lookup: term
+
+    op1, op2, op = term.stack
+    operator = OPERATORS[op]
+
+    # constant operands are bound directly instead of going through another closure
+    if not isinstance(op1, (Variable, UnresolvedCalculation)):
+        evaluate2 = compile_term(op2)
+        return lambda lookup: operator(op1, evaluate2(lookup))
+    elif not isinstance(op2, (Variable, UnresolvedCalculation)):
+        evaluate1 = compile_term(op1)
+        return lambda lookup: operator(evaluate1(lookup), op2)
+    else:
+        evaluate1 = compile_term(op1)
+        evaluate2 = compile_term(op2)
+        return lambda lookup: operator(evaluate1(lookup), evaluate2(lookup))
+
+
+PLAIN_NODES = {
+    "vector": lambda x, y: Vector(x, y),
+    "scope": lambda name, arguments, children, modifiers: Scope(name, arguments, children, modifiers),
+    "for": lambda variable, loop_range, children, modifiers: ForLoop(variable, loop_range, children, modifiers),
+    "statement": lambda statement_type, name, arguments, modifiers: Statement(statement_type, name, arguments, modifiers),
+    "constant": lambda value: Constant([value]),
+    "variable": lambda identifier: Variable(identifier),
+    "assignment": lambda identifier, value: Assignment(identifier, value),
+    "bool": lambda label: BoolOperand([label]),
+    "and": lambda *args: BoolAnd([interleave(args, "and")]),
+    "or": lambda *args: BoolOr([interleave(args, "or")]),
+    "not": lambda arg: BoolNot([["not", arg]]),
+    "calculation": lambda stack: UnresolvedCalculation(stack),
+    "list": lambda *items: list(items),
+    "tuple": lambda *items: tuple(items),
+}
+
+PLAIN_TAGS = {list: "list", tuple: "tuple", Vector: "vector", Scope: "scope", ForLoop: "for", Statement: "statement",
+              Constant: "constant", Variable: "variable", Assignment: "assignment", BoolOperand: "bool", BoolAnd: "and",
+              BoolOr: "or", BoolNot: "not", UnresolvedCalculation: "calculation"}
+
+
+def interleave(operands, operator):
+    result = []
+    for operand in operands:
+        result += [operand, operator]
+    return result[:-1]
+
+
+def to_plain(value):
+    """Plain data form of an AST value, made of numbers, strings and lists only. Nodes and lists become lists
+       starting with a tag from PLAIN_NODES and the fields, so from_plain can build them again.
+    """
+    if value is None or isinstance(value, (bool, int, long, float, basestring)):
+        return value
+    elif isinstance(value, (list, tuple)):
+        fields = value
+    elif isinstance(value, Vector):
+        fields = [value.x, value.y]
+    elif isinstance(value, Scope):
+        fields = [value.name, value.arguments, value.children, value.modifiers]
+    elif isinstance(value, ForLoop):
+        fields = [value.variable, value.loop_range, value.children, value.modifiers]
+    elif isinstance(value, Statement):
+        fields = [value.type, value.name, value.arguments, value.modifiers]
+    elif isinstance(value, Constant):
+        fields = [value.value]
+    elif isinstance(value, Variable):
+        fields = [value.identifier]
+    elif isinstance(value, Assignment):
+        fields = [value.identifier, value.value]
+    elif isinstance(value, BoolOperand):
+        fields = [value.label]
+    elif isinstance(value, BoolBinOp):
+        fields = value.args
+    elif isinstance(value, BoolNot):
+        fields = [value.arg]
+    elif isinstance(value, UnresolvedCalculation):
+        fields = [value.stack]
+    else:
+        raise Exception("No plain data form for %r" % (value,))
+
+    return [PLAIN_TAGS[type(value)]] + [to_plain(field) for field in fields]
+
+
+def from_plain(data):
+    """AST value of the plain data form, raises ValueError if it isn't one."""
+    if not isinstance(data, list):
+        return data
+    if not data or data[0] not in PLAIN_NODES:
+        raise ValueError("Not a plain AST value: %r" % (data,))
+    return PLAIN_NODES[data[0]](*[from_plain(field) for field in data[1:]])
+
+
+def parse_result_to_plain(result, symtab):
+    entries = [[entry.name, entry.kind, entry.parent, to_plain(entry.value), list(entry.parameters)]
+               for entry in symtab.table]
+    return [to_plain(result), entries]
+
+
+def parse_result_from_plain(data):
+    """AST and symbol table of parse_result_to_plain, raises ValueError, TypeError or IndexError for other data."""
+    result, entries = data
+    symtab = SymbolTable()
+    for name, kind, parent, value, parameters in entries:
+        symtab.insert(name, kind, parent, from_plain(value))
+        symtab.table[-1].parameters = list(parameters)
+    return from_plain(result), symtab
+
+
+class ParseContext(object):
+    """State of a single parse run. Kept apart from the grammar so one grammar can serve many parses."""
+
+    def __init__(self, filename=None):
         self.filename = filename
-        self.program = None
-
         self.symtab = SymbolTable()
 
-        self.init_grammar()
-
-        self.operators = {
-            "+" : ( lambda a,b: a + b ),
-            "-" : ( lambda a,b: a - b ),
-            "*" : ( lambda a,b: a * b ),
-            "/" : ( lambda a,b: a / b ),
-            "^" : ( lambda a,b: a ** b )
-        }
-
-        self.exprStack = []
+    def apply_operator(self, op, op1, op2):
+        if isinstance(op1, Variable) or isinstance(op2, Variable) or \
+           isinstance(op1, UnresolvedCalculation) or isinstance(op2, UnresolvedCalculation):
+            return UnresolvedCalculation([op1, op2, op])
+        else:
+            return OPERATORS[op]( op1, op2 )
 
     def evaluateStack(self, s):
         op = s.pop()
@@ -350,11 +528,7 @@ class FcadParser(object):
         if op in "+-*/^":
             op2 = self.evaluateStack( s )
             op1 = self.evaluateStack( s )
-            if isinstance(op1, Variable) or isinstance(op2, Variable) or \
-               isinstance(op1, UnresolvedCalculation) or isinstance(op2, UnresolvedCalculation):
-                return UnresolvedCalculation([op1, op2, op])
-            else:
-                return self.operators[op]( op1, op2 )
+            return self.apply_operator(op, op1, op2)
         elif op == "PI":
             return math.pi
         elif op == "E":
@@ -369,11 +543,48 @@ class FcadParser(object):
         else:
             return float( op )
 
-    def pushFirst( self, str, loc, toks ):
-        self.exprStack.append( toks[0] )
 
-    def calculate(self, text, loc, toks):
-        return self.evaluateStack(self.exprStack)
+##########################################################################################
+##########################################################################################
+
+
+class FcadGrammar(object):
+    """The compiled pyparsing grammar. It is built once per process (see get_grammar) and
+       holds no per-parse state, the parse actions work on the ParseContext of the running thread.
+    """
+
+    def __init__(self, tracing_enabled=False):
+        self._local = threading.local()
+        self.tracing_enabled = tracing_enabled
+        self.program = None
+
+        self.init_grammar()
+
+    @property
+    def context(self):
+        return self._local.context
+
+    def action(self, func):
+        """Parse actions are only wrapped when the grammar is built for tracing."""
+        return tracing.traced(func) if self.tracing_enabled else func
+
+    # The calculation actions only reduce their own tokens and never touch shared state,
+    # so they stay correct under backtracking and packrat caching.
+    def operand_action(self, text, loc, toks):
+        # e is only the constant as a whole word, identifiers like edge start with it as well
+        return self.context.evaluateStack(["E" if toks[0] in ("e", "E") else toks[0]])
+
+    def left_operation_action(self, text, loc, toks):
+        result = toks[0]
+        for i in range(1, len(toks), 2):
+            result = self.context.apply_operator(toks[i], result, toks[i + 1])
+        return result
+
+    def right_operation_action(self, text, loc, toks):
+        result = toks[-1]
+        for i in range(len(toks) - 2, 0, -2):
+            result = self.context.apply_operator(toks[i], toks[i - 1], result)
+        return result
 
     # noinspection PyPep8Naming,PyShadowingBuiltins
     def init_grammar(self):
@@ -412,224 +623,656 @@ class FcadParser(object):
         number = ( integer | floatnumber )
 
         calculation = Forward()
-        atom = ( ( e | floatnumber | integer | identifier ).setParseAction( self.pushFirst ) |
-                 ( LPAR + calculation.suppress() + RPAR )
+        atom = ( ( floatnumber | integer | identifier ).setParseAction( self.action(self.operand_action) ) |
+                 ( LPAR + calculation + RPAR )
                )
 
         factor = Forward()
-        factor << atom + ZeroOrMore( ( exp_operator + factor ).setParseAction( self.pushFirst ) )
+        factor << ( atom + ZeroOrMore( exp_operator + factor ) ).setParseAction( self.action(self.right_operation_action) )
 
-        term = factor + ZeroOrMore( ( mul_operator + factor ).setParseAction( self.pushFirst ) )
-        calculation << term + ZeroOrMore( ( add_operator + term ).setParseAction( self.pushFirst ) )
-        calculation.setParseAction(self.calculate)
+        term = ( factor + ZeroOrMore( mul_operator + factor ) ).setParseAction( self.action(self.left_operation_action) )
+        calculation << ( term + ZeroOrMore( add_operator + term ) ).setParseAction( self.action(self.left_operation_action) )
 
 
-        constant = number.setParseAction(self.constant_action)
+        constant = number.setParseAction(self.action(self.constant_action))
         modifier_name = ( Keyword("translate") | Keyword("rotate") | Keyword("scale") | Keyword("simplify") )
 
-        use = (USE + identifier("name") + SEMI).setParseAction(self.use_action)
+        use = (USE + identifier("name") + SEMI).setParseAction(self.action(self.use_action))
 
         expression = Forward()
 
-        arguments = delimitedList(expression("exp").setParseAction(self.argument_action))
-        module_call = ((identifier("name") + FollowedBy("(")).setParseAction(self.module_call_prepare_action) +
+        arguments = delimitedList(expression("exp"))
+        module_call = ((identifier("name") + FollowedBy("(")) +
                        LPAR + Optional(arguments)("args") + RPAR)
-        module_call_statement = (module_call + SEMI).setParseAction(self.module_call_action)
+        module_call_statement = (module_call + SEMI).setParseAction(self.action(self.module_call_action))
 
         primitive_argument_assignment_value = (calculation | boolExpr)
 
-        primitive_argument_assignment = (identifier("variable") + EQUAL + primitive_argument_assignment_value).setParseAction(self.primitive_argument_assignment_action)
+        primitive_argument_assignment = (identifier("variable") + EQUAL + primitive_argument_assignment_value).setParseAction(self.action(self.primitive_argument_assignment_action))
         primitive_argument = (primitive_argument_assignment | expression("exp"))
-        primitive_argument_list = delimitedList(primitive_argument.setParseAction(self.argument_action))
+        primitive_argument_list = delimitedList(primitive_argument)
 
-        modifier = ( (modifier_name + FollowedBy("(")).setParseAction(self.primitive_modifier_prepare_action) +
-                              LPAR + Optional(primitive_argument_list)("args") + RPAR).setParseAction(self.primitive_modifier_action)
+        modifier = ( (modifier_name + FollowedBy("(")).setParseAction(self.action(self.primitive_modifier_prepare_action)) +
+                              LPAR + Optional(primitive_argument_list)("args") + RPAR).setParseAction(self.action(self.primitive_modifier_action))
 
-        primitive_call_statement = ( ZeroOrMore(modifier)("modifiers") + (identifier("name") + FollowedBy("(")).setParseAction(self.primitive_call_prepare_action) +
-                                    LPAR + Optional(primitive_argument_list)("args") + RPAR + SEMI).setParseAction(self.primitive_call_action)
+        primitive_call_statement = ( ZeroOrMore(modifier)("modifiers") + (identifier("name") + FollowedBy("(")).setParseAction(self.action(self.primitive_call_prepare_action)) +
+                                    LPAR + Optional(primitive_argument_list)("args") + RPAR + SEMI).setParseAction(self.action(self.primitive_call_action))
 
-        expression << (boolExpr | calculation).setParseAction(self.debug_action)#.setParseAction(lambda x: x[0])
+        expression << (boolExpr | calculation)
 
         statement = Forward()
 
-        assign_statement = (identifier("variable") + EQUAL + expression("expression") + SEMI).setParseAction(self.assign_action)
+        assign_statement = (identifier("variable") + EQUAL + expression("expression") + SEMI).setParseAction(self.action(self.assign_action))
 
-        modifier_scope = ( (ZeroOrMore(modifier)("modifiers") + identifier("name") + LPAR + Optional(primitive_argument_list)("args") + RPAR + FollowedBy("{")).setParseAction(self.modifier_scope_prepare_action) +
-                            LBRACE + ZeroOrMore(statement) + RBRACE ).setParseAction(self.modifier_scope_action)
+        modifier_scope = ( (ZeroOrMore(modifier)("modifiers") + identifier("name") + LPAR + Optional(primitive_argument_list)("args") + RPAR + FollowedBy("{")).setParseAction(self.action(self.modifier_scope_prepare_action)) +
+                            LBRACE + ZeroOrMore(statement) + RBRACE ).setParseAction(self.action(self.modifier_scope_action))
 
-        vector = (LBRACK + calculation + COLON + calculation + RBRACK).setParseAction(self.vector_action)
+        vector = (LBRACK + calculation + COLON + calculation + RBRACK).setParseAction(self.action(self.vector_action))
 
-        for_loop_scope = ( ZeroOrMore(modifier)("modifiers") + ( FOR + LPAR + identifier("index") + EQUAL + vector("loop_range") + RPAR + FollowedBy("{") ).setParseAction(self.begin_for_loop_scope) +
-                         LBRACE + ZeroOrMore(statement)("body") + RBRACE ).setParseAction(self.for_loop_scope_action)
+        for_loop_scope = ( ZeroOrMore(modifier)("modifiers") + ( FOR + LPAR + identifier("index") + EQUAL + vector("loop_range") + RPAR + FollowedBy("{") ).setParseAction(self.action(self.begin_for_loop_scope)) +
+                         LBRACE + ZeroOrMore(statement)("body") + RBRACE ).setParseAction(self.action(self.for_loop_scope_action))
 
         statement << ( for_loop_scope | primitive_call_statement | module_call_statement | Suppress(assign_statement) | modifier_scope )
 
         body = OneOrMore(statement)
 
-        self.program = (ZeroOrMore(use) + body).setParseAction(self.program_end_action)
+        self.program = (ZeroOrMore(use) + body)
 
-    @log_exceptions(log_if=DEBUG)
-    def debug_action(self, text, loc, stuff):
-        return stuff
+        singleLineComment = "//" + restOfLine
+        self.program.ignore(singleLineComment)
+        self.program.ignore(cStyleComment)
+        self.program.streamline()
 
-    @log_exceptions(log_if=DEBUG)
     def vector_action(self, text, loc, tokens):
-        if DEBUG:
-            print("vector_action:", tokens)
-            self.symtab.display()
         return Vector(tokens[0], tokens[1])
 
-    @log_exceptions(log_if=DEBUG)
     def begin_for_loop_scope(self, text, loc, tokens):
-        if DEBUG:
-            print("begin_for_loop_scope:", tokens)
-            self.symtab.display()
-
         return [tokens.index, tokens.loop_range]
 
-    @log_exceptions(log_if=DEBUG)
     def for_loop_scope_action(self, text, loc, tokens):
+        modifiers = list(tokens.modifiers)
+        variable, loop_range = tokens[len(modifiers)], tokens[len(modifiers) + 1]
+        return ForLoop(variable, loop_range, list(tokens.body), modifiers)
 
-        if DEBUG:
-            print("for_loop_scope_action:", tokens)
-            self.symtab.display()
-
-        result = []
-        variable = tokens[0]
-        loop_range = tokens[1]
-        for i in range(loop_range.x, loop_range.y):
-            assignment = Assignment(variable, i)
-            assignment_scope = Scope("assign", [assignment], tokens.body, [])
-            result.append(assignment_scope)
-
-        return result
-
-    @log_exceptions(log_if=DEBUG)
     def lookup_id_action(self, text="", loc=-1, var=None):
         """Code executed after recognising an identificator in expression"""
         
         varname = text if not var else var.name
         exshared.setpos(loc, text)
-        if DEBUG:
-            print("EXP_VAR:", var)
-            self.symtab.display()
 
-        if not self.symtab.contains(varname, KINDS.GLOBAL_VAR, None):
+        if not self.context.symtab.contains(varname, KINDS.GLOBAL_VAR, None):
             raise SemanticException("'%s' undefined" % varname)
         return [Variable(varname)]
 
-    @log_exceptions(log_if=DEBUG)
     def constant_action(self, text, loc, const):
         """Code executed after recognising a constant"""
         exshared.setpos(loc, text)
-        if DEBUG:
-            print("CONST:", const)
-            self.symtab.display()
         return Constant(const)
 
-    @log_exceptions(log_if=DEBUG)
     def assign_action(self, text, loc, assign):
-        if DEBUG:
-            print("ASSIGN:", assign)
-            self.symtab.display()
-
-        self.symtab.insert_global_var(assign.variable, assign.expression)
+        self.context.symtab.insert_global_var(assign.variable, assign.expression)
         return None
 
-    @log_exceptions(log_if=DEBUG)
     def use_action(self, text, loc, use):
-        if DEBUG:
-            print("use_action")
         return "use_token"
 
-    @log_exceptions(log_if=DEBUG)
-    def argument_action(self, text, loc, argument):
-        if DEBUG:
-            print("argument_action",loc, argument)
-
-    @log_exceptions(log_if=DEBUG)
-    def module_call_prepare_action(self, text, loc, argument):
-        if DEBUG:
-            print("module_call_prepare_action")
-
-    @log_exceptions(log_if=DEBUG)
     def module_call_action(self, text, loc, call_name):
-        if DEBUG:
-            print("module_call_action")
         return call_name[0]
 
-    @log_exceptions(log_if=DEBUG)
     def primitive_call_prepare_action(self, text, loc, call_name):
-        if DEBUG:
-            print("primitive_call_prepare_action",loc, call_name)
         return call_name[0]
 
-    @log_exceptions(log_if=DEBUG)
     def primitive_argument_assignment_action(self, text, loc, assignment):
-        if DEBUG:
-            print("primitive_argument_assignment_action", assignment)
         return Assignment(assignment[0], assignment[1])
 
-    @log_exceptions(log_if=DEBUG)
     def primitive_call_action(self, text, loc, call):
-        if DEBUG:
-            print("primitive_call_action",loc, call)
         modifiers = list(filter(lambda c: isinstance(c, Statement) and c.type == StatementType.Modifier, call))
         name = call[len(modifiers)]
         arguments = call[len(modifiers)+1:]
         return Statement(StatementType.Primitive, name, arguments, modifiers)
 
-    @log_exceptions(log_if=DEBUG)
     def primitive_modifier_prepare_action(self, text, loc, modifier):
-        if DEBUG:
-            print("primitive_modifier_prepare_action",loc, modifier)
         return modifier[0]
 
-    @log_exceptions(log_if=DEBUG)
     def primitive_modifier_action(self, text, loc, modifier):
-        if DEBUG:
-            print("primitive_modifier_action",loc, modifier)
         arguments = modifier[1:]
         return Statement(StatementType.Modifier, modifier[0], arguments)
 
-    @log_exceptions(log_if=DEBUG)
     def modifier_scope_prepare_action(self, text, loc, scope):
-        if DEBUG:
-            print("modifier_scope_prepare_action",loc, scope)
+        return Scope(scope.name, list(scope.args), [], list(scope.modifiers))
 
-        return Scope(scope.name, scope.args, [], scope.modifiers)
-
-    @log_exceptions(log_if=DEBUG)
     def modifier_scope_action(self, text, loc, scope):
-        if DEBUG:
-            print("modifier_scope_action",loc, scope)
-
         result = scope[0]
-        result.children = scope[1:]
+        result.children = list(scope[1:])
+        return result
+
+    def parse_string(self, text, context):
+        self._local.context = context
+        try:
+            return self.program.parseString(text, parseAll=True)
+        finally:
+            self._local.context = None
+
+    def parse_file(self, filename, context):
+        with open(filename, 'r') as f:
+            return self.parse_string(f.read(), context)
+
+
+class ParserBackend(object):
+    PyParsing = "pyparsing"
+    RecursiveDescent = "recursive_descent"
+
+
+class TokenType(object):
+    Number = "number"
+    Identifier = "identifier"
+    Symbol = "symbol"
+    End = "end"
+
+
+_TOKEN_PATTERN = re.compile(r"""
+      (?P<skip>\s+|//[^\n]*|/\*.*?\*/)
+    | (?P<number>[0-9]+(?:\.[0-9]*)?(?:[eE][-+]?[0-9]+)?)
+    | (?P<identifier>[$a-zA-Z_][a-zA-Z0-9_]*)
+    | (?P<symbol>[-+*/^()\[\]{};,=:])
+""", re.VERBOSE | re.DOTALL)
+
+MODIFIER_NAMES = frozenset(["translate", "rotate", "scale", "simplify"])
+
+# binding power and right associativity of the calculation operators
+OPERATOR_PRECEDENCE = {
+    "+": (1, False),
+    "-": (1, False),
+    "*": (2, False),
+    "/": (2, False),
+    "^": (3, True)
+}
+
+
+def tokenize(text):
+    """Splits fcad source into (type, text, location) tuples, dropping whitespace and comments."""
+    tokens = []
+    location = 0
+    end = len(text)
+    match = _TOKEN_PATTERN.match
+
+    while location < end:
+        token = match(text, location)
+        if token is None:
+            raise ParseException(text, location, "Unexpected character")
+
+        kind = token.lastgroup
+        if kind != "skip":
+            tokens.append((kind, token.group(kind), location))
+        location = token.end()
+
+    tokens.append((TokenType.End, "", end))
+    return tokens
+
+
+class RecursiveDescentParser(object):
+    """Hand-written alternative to FcadGrammar. A regex tokenizer feeds a recursive-descent statement
+       parser with precedence climbing for calculations; the resulting AST is the same as the one
+       built by the pyparsing actions.
+    """
+
+    def parse_string(self, text, context):
+        return _RecursiveDescentRun(text, tokenize(text), context).parse_program()
+
+    def parse_file(self, filename, context):
+        with open(filename, 'r') as f:
+            return self.parse_string(f.read(), context)
+
+
+class _RecursiveDescentRun(object):
+    def __init__(self, text, tokens, context):
+        self.text = text
+        self.tokens = tokens
+        self.index = 0
+        self.context = context
+
+    def error(self, expected):
+        raise ParseException(self.text, self.tokens[self.index][2], "Expected " + expected)
+
+    def peek(self, offset=0):
+        return self.tokens[min(self.index + offset, len(self.tokens) - 1)][1]
+
+    def expect(self, symbol):
+        kind, text, location = self.tokens[self.index]
+        if kind != TokenType.Symbol or text != symbol:
+            self.error("'" + symbol + "'")
+        self.index += 1
+
+    def expect_identifier(self):
+        kind, text, location = self.tokens[self.index]
+        if kind != TokenType.Identifier:
+            self.error("identifier")
+        self.index += 1
+        return text
+
+    def parse_program(self):
+        result = []
+
+        while self.peek() == "use" and self.tokens[self.index + 1][0] == TokenType.Identifier and self.peek(2) == ";":
+            self.index += 3
+            result.append("use_token")
+
+        self.parse_statement(result)
+        while self.tokens[self.index][0] != TokenType.End:
+            self.parse_statement(result)
+
         return result
 
-    @log_exceptions(log_if=DEBUG)
-    def program_end_action(self, text, loc, scope):
-        if DEBUG:
-            print("program_end_action")
+    def parse_statements(self):
+        result = []
+        self.expect("{")
+        while self.peek() != "}":
+            if self.tokens[self.index][0] == TokenType.End:
+                self.error("'}'")
+            self.parse_statement(result)
+        self.index += 1
+        return result
+
+    def parse_statement(self, result):
+        location = self.tokens[self.index][2]
+
+        modifiers = []
+        while self.peek() in MODIFIER_NAMES and self.peek(1) == "(":
+            modifiers.append(self.parse_modifier())
+
+        name = self.peek()
+        if name == "for" and self.peek(1) == "(":
+            result.append(self.parse_for_loop(modifiers))
+        elif self.tokens[self.index][0] == TokenType.Identifier and self.peek(1) == "(":
+            self.index += 1
+            arguments = self.parse_arguments()
+            if self.peek() == "{":
+                result.append(Scope(name, arguments, self.parse_statements(), modifiers))
+            else:
+                self.expect(";")
+                result.append(Statement(StatementType.Primitive, name, arguments, modifiers))
+        elif not modifiers and self.tokens[self.index][0] == TokenType.Identifier and self.peek(1) == "=":
+            self.index += 2
+            value = self.parse_expression()
+            self.expect(";")
+            exshared.setpos(location, self.text)
+            self.context.symtab.insert_global_var(name, value)
+        elif len(modifiers) == 1 and self.peek() == ";" and \
+                not any(isinstance(a, Assignment) for a in modifiers[0].arguments):
+            # a lone modifier call is a module call, as in the pyparsing grammar
+            self.index += 1
+            result.append(modifiers[0].name)
+        else:
+            self.error("statement")
+
+    def parse_modifier(self):
+        name = self.tokens[self.index][1]
+        self.index += 1
+        return Statement(StatementType.Modifier, name, self.parse_arguments())
+
+    def parse_for_loop(self, modifiers):
+        self.index += 2
+        variable = self.expect_identifier()
+        self.expect("=")
+        self.expect("[")
+        start = self.parse_calculation()
+        self.expect(":")
+        end = self.parse_calculation()
+        self.expect("]")
+        self.expect(")")
+        body = self.parse_statements()
+
+        return ForLoop(variable, Vector(start, end), body, modifiers)
+
+    def parse_arguments(self):
+        arguments = []
+        self.expect("(")
+
+        if self.peek() != ")":
+            arguments.append(self.parse_argument())
+            while self.peek() == ",":
+                self.index += 1
+                arguments.append(self.parse_argument())
+
+        self.expect(")")
+        return arguments
+
+    def parse_argument(self):
+        if self.tokens[self.index][0] == TokenType.Identifier and self.peek(1) == "=":
+            name = self.tokens[self.index][1]
+            self.index += 2
+            start = self.index
+            try:
+                value = self.parse_calculation()
+            except ParseException:
+                self.index = start
+                value = self.parse_bool_expression()
+            return Assignment(name, value)
+
+        return self.parse_expression()
+
+    def parse_expression(self):
+        if self.peek() in ("true", "false", "not", "("):
+            start = self.index
+            try:
+                return self.parse_bool_expression()
+            except ParseException:
+                self.index = start
+
+        return self.parse_calculation()
+
+    def parse_calculation(self, min_precedence=1):
+        result = self.parse_operand()
+
+        while True:
+            kind, text, location = self.tokens[self.index]
+            if kind != TokenType.Symbol or text not in OPERATOR_PRECEDENCE:
+                return result
+
+            precedence, right_associative = OPERATOR_PRECEDENCE[text]
+            if precedence < min_precedence:
+                return result
+
+            self.index += 1
+            operand = self.parse_calculation(precedence if right_associative else precedence + 1)
+            result = self.context.apply_operator(text, result, operand)
+
+    def parse_operand(self):
+        kind, text, location = self.tokens[self.index]
+
+        if kind == TokenType.Number:
+            self.index += 1
+            return self.context.evaluateStack([text])
+        elif kind == TokenType.Identifier:
+            self.index += 1
+            return self.context.evaluateStack(["E" if text in ("e", "E") else text])
+        elif text in ("+", "-"):
+            # signed number literal, the sign has to be attached to the digits
+            next_kind, next_text, next_location = self.tokens[self.index + 1]
+            if next_kind == TokenType.Number and next_location == location + 1:
+                self.index += 2
+                return self.context.evaluateStack([text + next_text])
+        elif text == "(":
+            self.index += 1
+            result = self.parse_calculation()
+            self.expect(")")
+            return result
+
+        self.error("calculation")
+
+    def parse_bool_expression(self):
+        return self.parse_bool_operation("or", BoolOr, self.parse_bool_and)
+
+    def parse_bool_and(self):
+        return self.parse_bool_operation("and", BoolAnd, self.parse_bool_not)
+
+    def parse_bool_operation(self, operator, operation_type, parse_operand):
+        operands = [parse_operand()]
+
+        while self.peek() == operator:
+            start = self.index
+            self.index += 1
+            try:
+                operands.extend([operator, parse_operand()])
+            except ParseException:
+                self.index = start
+                break
+
+        if len(operands) == 1:
+            return operands[0]
+        return operation_type([operands])
+
+    def parse_bool_not(self):
+        text = self.peek()
+
+        if text == "not":
+            self.index += 1
+            return BoolNot([["not", self.parse_bool_not()]])
+        elif text in ("true", "false"):
+            self.index += 1
+            return BoolOperand([text])
+        elif text == "(":
+            self.index += 1
+            result = self.parse_bool_expression()
+            self.expect(")")
+            return result
+
+        self.error("boolean expression")
+
+
+_grammars = {}
+_grammar_lock = threading.Lock()
+
+DEFAULT_PACKRAT_CACHE_SIZE = 1024
+
+
+def enable_packrat(cache_size_limit=DEFAULT_PACKRAT_CACHE_SIZE):
+    """Turns on packrat memoization for all following parses. pyparsing keeps the cache
+       process wide, so this can't be switched off again; the cache holds at most
+       cache_size_limit entries.
+    """
+    ParserElement.enablePackrat(cache_size_limit)
+
+
+def get_grammar():
+    """Returns the process wide FcadGrammar, building it on first use. Grammars with and
+       without tracing are kept apart, so switching tracing off restores the unwrapped actions.
+    """
+    tracing_enabled = tracing.is_tracing_enabled()
+    grammar = _grammars.get(tracing_enabled)
+
+    if grammar is None:
+        with _grammar_lock:
+            grammar = _grammars.get(tracing_enabled)
+            if grammar is None:
+                grammar = _grammars[tracing_enabled] = FcadGrammar(tracing_enabled)
+
+    return grammar
+
+
+_recursive_descent_parser = RecursiveDescentParser()
+
 
+def get_backend(backend=ParserBackend.PyParsing):
+    if backend == ParserBackend.PyParsing:
+        return get_grammar()
+    elif backend == ParserBackend.RecursiveDescent:
+        return _recursive_descent_parser
+    else:
+        raise Exception("Unknown parser backend '" + backend + "'")
+
+
+def split_statements(text):
+    """Source spans (start, end) of the top level statements, None if the text can't even be tokenized.
+
+       Leading use statements are kept together with the statement following them, the grammar doesn't
+       accept them on their own.
+    """
+    try:
+        tokens = tokenize(text)
+    except ParseException:
+        return None
+
+    spans = []
+    depth = 0
+    start, first = None, None
+    for kind, token, location in tokens[:-1]:
+        if start is None:
+            start = location
+        if first is None:
+            first = token
+
+        if kind == TokenType.Symbol:
+            if token in "([{":
+                depth += 1
+            elif token in ")]}":
+                depth -= 1
+                if depth < 0:
+                    return None
+
+            if depth == 0 and token == ";" and first == "use":
+                first = None
+            elif depth == 0 and token in ";}":
+                spans.append((start, location + 1))
+                start, first = None, None
+
+    if start is not None:
+        spans.append((start, len(text)))
+    return spans
+
+
+def used_files(filename):
+    """Existing files the leading use statements of filename refer to, <name>.fcad next to it, and the files
+       those use in turn.
+    """
+    result = []
+    pending = [os.path.realpath(filename)]
+    while pending:
+        current = pending.pop(0)
+        try:
+            with open(current, 'r') as f:
+                tokens = tokenize(f.read())
+        except (IOError, OSError, ParseException):
+            continue
+
+        index = 0
+        while tokens[index][1] == "use" and tokens[index + 1][0] == TokenType.Identifier and tokens[index + 2][1] == ";":
+            used = os.path.join(os.path.dirname(current), tokens[index + 1][1] + ".fcad")
+            if os.path.isfile(used) and used not in result and used != os.path.realpath(filename):
+                result.append(used)
+                pending.append(used)
+            index += 3
+    return result
+
+
+class ParsedStatement(object):
+    """AST of one top level statement together with the global variables it read and defined."""
+
+    def __init__(self, result, reads, definitions):
+        self.result = result
+        self.reads = reads
+        self.definitions = definitions
+
+    def is_valid(self, symtab):
+        """True if every global variable it read still has the same value."""
+        return all(value_key(symtab.find(name, KINDS.GLOBAL_VAR, None)) == value
+                   for name, value in self.reads.items())
+
+    def replay(self, symtab):
+        for entry in self.definitions:
+            symtab.insert(entry.name, entry.kind, entry.parent, entry.value)
+
+
+class StatementCache(object):
+    """ASTs of the top level statements of the last parse, keyed by hashes of their text.
+
+       Kept between parses of a file, so after an edit only the statements that changed, or that read a
+       global variable whose value changed, are parsed again.
+    """
+
+    def __init__(self):
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return "{STATEMENT CACHE: " + str(len(self.entries)) + " statements, " + \
+               str(self.hits) + " hits, " + str(self.misses) + " misses}"
+
+
+class FcadParser(object):
+    def __init__(self, filename, backend=ParserBackend.PyParsing, disk_cache=None, statement_cache=None):
+        self.filename = filename
+        self.backend_name = backend
+        self.backend = get_backend(backend)
+        self.disk_cache = disk_cache
+        self.statement_cache = statement_cache
+        self.program = getattr(self.backend, "program", None)
+        self.context = ParseContext(filename)
+
+    @property
+    def symtab(self):
+        return self.context.symtab
+
+    def evaluateStack(self, s):
+        return self.context.evaluateStack(s)
+
+    @profiling.profiled("FcadParser.parse")
     def parse(self):
         result, error = None, None
-        #f = open(self.filename, 'r')
-        #text = f.read()
-        #f.close()
-
-        #print(text)
+        self.context = ParseContext(self.filename)
+
+        with open(self.filename, 'r') as f:
+            text = f.read()
+
+        key = None
+        if self.disk_cache is not None:
+            key = self.disk_cache.key("ast", self.backend_name, hashlib.sha1(text.encode("utf-8")).hexdigest())
+            cached = self.disk_cache.load_data(key)
+            if cached is not None:
+                try:
+                    result, self.context.symtab = parse_result_from_plain(cached)
+                    tracing.trace("parse_result_cached", data=result)
+                    return result, error
+                except (ValueError, TypeError, IndexError):
+                    # not written by this version, parsed again and replaced
+                    result = None
+
+        if self.statement_cache is not None:
+            try:
+                result = self.parse_statements(text)
+            except (SemanticException, ParseException):
+                # parsed again as a whole, so the error refers to the right location
+                self.context = ParseContext(self.filename)
 
         try:
-            singleLineComment = "//" + restOfLine
-            self.program.ignore(singleLineComment)
-            self.program.ignore(cStyleComment)
-            result = self.program.parseFile(self.filename, parseAll=True)
-            pprint.pprint(result)
+            if result is None:
+                result = list(self.backend.parse_string(text, self.context))
+            tracing.trace("parse_result", data=result)
+            if key is not None:
+                self.disk_cache.store_data(key, parse_result_to_plain(result, self.context.symtab))
         except SemanticException as ex:
             error = "failed to parse input. " + repr(ex)
         except ParseException as ex:
             error = "failed to parse input. " + repr(ex)
 
         return result, error
+
+    def parse_statements(self, text):
+        """Parses the top level statements one by one, reusing the cached ones that are still valid.
+           Returns None if the text can't be split into statements.
+        """
+        spans = split_statements(text)
+        if not spans:
+            return None
+
+        cache = self.statement_cache
+        symtab = self.context.symtab
+        entries = {}
+        result = []
+        for start, end in spans:
+            statement = text[start:end]
+            key = hashlib.sha1(statement.encode("utf-8")).hexdigest()
+            entry = entries.get(key) or cache.entries.get(key)
+
+            if entry is not None and entry.is_valid(symtab):
+                cache.hits += 1
+                entry.replay(symtab)
+            else:
+                cache.misses += 1
+                first = len(symtab.table)
+                symtab.reads = {}
+                try:
+                    parsed = list(self.backend.parse_string(statement, self.context))
+                finally:
+                    reads, symtab.reads = symtab.reads, None
+                entry = ParsedStatement(parsed, reads, symtab.table[first:])
+
+            entries[key] = entry
+            result.extend(entry.result)
+
+        cache.entries = entries
+        return result
@@ -0,0 +1,177 @@
+"""Parse results and generated geometry kept on disk, shared between runs and processes.
+
+Everything lives in one sqlite database: the primary key on the entry keys is the index, geometry is
+stored as WKB and parse results as compressed JSON of plain data, so loading an entry never runs code
+from the file. Writers in several processes are serialized by sqlite, entries are only ever replaced
+as a whole, so a reader sees either the old or the new value.
+"""
+import hashlib
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+
+from shapely import wkb
+
+from src.__pkginfo__ import __version__
+
+__author__ = 'sven'
+
+DEFAULT_DISK_CACHE_SIZE = 256 * 1024 * 1024
+
+# eviction removes the least recently used entries until the cache is down to this fraction of its size,
+# so it doesn't have to run again on the very next store
+EVICTION_TARGET = 0.8
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS entries (key TEXT PRIMARY KEY, data BLOB NOT NULL, size INTEGER NOT NULL, "
+    "last_used REAL NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS entries_last_used ON entries (last_used)",
+    "CREATE TABLE IF NOT EXISTS totals (id INTEGER PRIMARY KEY CHECK (id = 0), size INTEGER NOT NULL)",
+    "INSERT OR IGNORE INTO totals (id, size) VALUES (0, 0)",
+)
+
+
+def default_path():
+    return os.path.join(os.path.expanduser("~"), ".cache", "openscad2d", "cache.sqlite")
+
+
+class DiskCache(object):
+    """sqlite backed cache with a size limit in bytes, the least recently used entries are evicted first."""
+
+    def __init__(self, path=None, max_size=DEFAULT_DISK_CACHE_SIZE, timeout=30.0):
+        self.path = path or default_path()
+        self.max_size = max_size
+        self.timeout = timeout
+        self.hits = 0
+        self.misses = 0
+        # connection of each thread and the process it was opened in
+        self._local = threading.local()
+
+    @property
+    def connection(self):
+        # sqlite connections must not be shared with other threads or forked worker processes
+        local = self._local
+        if getattr(local, "connection", None) is None or local.pid != os.getpid():
+            directory = os.path.dirname(self.path)
+            if directory and not os.path.isdir(directory):
+                try:
+                    os.makedirs(directory)
+                except OSError:
+                    if not os.path.isdir(directory):
+                        raise
+
+            connection = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            with Transaction(connection) as cursor:
+                for statement in SCHEMA:
+                    cursor.execute(statement)
+            local.connection, local.pid = connection, os.getpid()
+        return local.connection
+
+    def transaction(self):
+        return Transaction(self.connection)
+
+    def key(self, *parts):
+        """Entry key of parts, including the tool and python version so other builds never see the entry."""
+        digest = hashlib.sha1(repr((__version__, sys.version_info[0]) + parts).encode("utf-8"))
+        return digest.hexdigest()
+
+    def load(self, key):
+        """Stored bytes of key, None if there are none."""
+        connection = self.connection
+        row = connection.execute("SELECT data FROM entries WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        connection.execute("UPDATE entries SET last_used = ? WHERE key = ?", (time.time(), key))
+        return bytes(row[0])
+
+    def store(self, key, data):
+        with self.transaction() as cursor:
+            row = cursor.execute("SELECT size FROM entries WHERE key = ?", (key,)).fetchone()
+            cursor.execute("INSERT OR REPLACE INTO entries (key, data, size, last_used) VALUES (?, ?, ?, ?)",
+                           (key, sqlite3.Binary(data), len(data), time.time()))
+            cursor.execute("UPDATE totals SET size = size + ? WHERE id = 0", (len(data) - (row[0] if row else 0),))
+            total = cursor.execute("SELECT size FROM totals WHERE id = 0").fetchone()[0]
+            if total > self.max_size:
+                self.evict(cursor, total)
+
+    def evict(self, cursor, total):
+        target = self.max_size * EVICTION_TARGET
+        removed = []
+        for key, size in cursor.execute("SELECT key, size FROM entries ORDER BY last_used").fetchall():
+            if total <= target:
+                break
+            removed.append((key,))
+            total -= size
+
+        cursor.executemany("DELETE FROM entries WHERE key = ?", removed)
+        cursor.execute("UPDATE totals SET size = ? WHERE id = 0", (total,))
+
+    def load_geometry(self, key):
+        data = self.load(key)
+        return wkb.loads(data) if data is not None else None
+
+    def store_geometry(self, key, geom):
+        self.store(key, wkb.dumps(geom))
+
+    def load_data(self, key):
+        """Stored numbers, strings, lists and dicts of key, None if there are none or they can't be read."""
+        data = self.load(key)
+        if data is None:
+            return None
+        try:
+            return json.loads(zlib.decompress(data).decode("utf-8"))
+        except (zlib.error, ValueError):
+            return None
+
+    def store_data(self, key, value):
+        self.store(key, zlib.compress(json.dumps(value, separators=(",", ":")).encode("utf-8")))
+
+    def size(self):
+        return self.connection.execute("SELECT size FROM totals WHERE id = 0").fetchone()[0]
+
+    def clear(self):
+        with self.transaction() as cursor:
+            cursor.execute("DELETE FROM entries")
+            cursor.execute("UPDATE totals SET size = 0 WHERE id = 0")
+        self.hits = 0
+        self.misses = 0
+
+    def close(self):
+        """Closes the connection of the calling thread."""
+        local = self._local
+        if getattr(local, "connection", None) is not None and local.pid == os.getpid():
+            local.connection.close()
+        local.connection = None
+
+    def __len__(self):
+        return self.connection.execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+
+    def __repr__(self):
+        return "{DISK CACHE: " + self.path + ", " + str(self.hits) + " hits, " + str(self.misses) + " misses}"
+
+
+class Transaction(object):
+    """Write transaction taking the database lock up front, so concurrent writers wait instead of failing
+       when they try to upgrade a read lock.
+    """
+
+    def __init__(self, connection):
+        self.cursor = connection.cursor()
+
+    def __enter__(self):
+        self.cursor.execute("BEGIN IMMEDIATE")
+        return self.cursor
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.cursor.execute("COMMIT" if exc_type is None else "ROLLBACK")
+        self.cursor.close()
+        return False
@@ -1,12 +1,248 @@
+"""Calls back when the content of watched documents changes.
+
+On Linux the directories of the documents are watched with inotify, so the watcher sleeps until something
+is written and catches editors that save by renaming a temporary file over the document. Elsewhere it falls
+back to polling modification times. Either way a change only counts if the content hash differs, saving
+unchanged content or touching a file doesn't call back.
+"""
 from __future__ import print_function
-import pywatch
+import ctypes
+import ctypes.util
+import errno
+import hashlib
+import os
+import select
+import struct
+import sys
+import threading
+
+__author__ = 'sven'
+
+# seconds between two looks at the modification times when polling
+POLL_INTERVAL = 1.0
+
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+# written and closed, or renamed into place, a file that was just created has no content yet
+WATCH_MASK = IN_CLOSE_WRITE | IN_MOVED_TO | IN_ONLYDIR
+
+EVENT = struct.Struct("iIII")
+
+
+def file_digest(filename):
+    """sha1 of the file content, None if it can't be read, which happens while some editors save."""
+    try:
+        with open(filename, 'rb') as f:
+            return hashlib.sha1(f.read()).hexdigest()
+    except (IOError, OSError):
+        return None
+
+
+def file_stamp(filename):
+    try:
+        stat = os.stat(filename)
+        return stat.st_mtime, stat.st_size
+    except OSError:
+        return None
+
+
+class Inotify(object):
+    """Minimal inotify binding through ctypes, so no extra package is needed."""
+
+    _libc = None
+
+    @classmethod
+    def libc(cls):
+        if cls._libc is None:
+            cls._libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        return cls._libc
+
+    @classmethod
+    def is_available(cls):
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            return hasattr(cls.libc(), "inotify_init1")
+        except OSError:
+            return False
+
+    def __init__(self):
+        self.fd = self.libc().inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+
+    def add_watch(self, path, mask=WATCH_MASK):
+        if not isinstance(path, bytes):
+            path = path.encode(sys.getfilesystemencoding())
+        wd = self.libc().inotify_add_watch(self.fd, path, mask)
+        if wd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+        return wd
+
+    def remove_watch(self, wd):
+        self.libc().inotify_rm_watch(self.fd, wd)
 
+    def read_events(self):
+        """(wd, mask, name) of the queued events."""
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except OSError as ex:
+            if ex.errno == errno.EAGAIN:
+                return []
+            raise
 
-class DocumentWatcher(pywatch.Watcher):
-    def __init__(self, document, callback):
-        pywatch.Watcher.__init__(self, [document])
+        events = []
+        offset = 0
+        while offset + EVENT.size <= len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            name = data[offset + EVENT.size:offset + EVENT.size + length].rstrip(b"\0")
+            if not isinstance(name, str):
+                name = name.decode(sys.getfilesystemencoding())
+            events.append((wd, mask, name))
+            offset += EVENT.size + length
+        return events
 
+    def close(self):
+        os.close(self.fd)
+
+
+class DocumentWatcher(object):
+    def __init__(self, documents, callback, polling=None, interval=POLL_INTERVAL):
+        """documents - a filename or a list of them
+           callback - called on the watcher thread after the content of one of them changed
+           polling - poll modification times even where inotify is available
+        """
         self.callback = callback
+        self.polling = polling if polling is not None else not Inotify.is_available()
+        self.interval = interval
+
+        self.lock = threading.Lock()
+        self.documents = []
+        self.digests = {}
+        self.stamps = {}
+        self.inotify = None
+        self.watches = {}
+        self.thread = None
+        self.stopped = threading.Event()
+        self.wakeup = None
+
+        self.set_documents(documents)
+
+    def set_documents(self, documents):
+        """Replaces the watched documents, the current content of new ones is the reference for changes."""
+        if not isinstance(documents, (list, tuple)):
+            documents = [documents]
+        documents = [os.path.realpath(document) for document in documents]
+
+        with self.lock:
+            for document in documents:
+                if document not in self.digests:
+                    self.digests[document] = file_digest(document)
+                    self.stamps[document] = file_stamp(document)
+            for document in set(self.digests) - set(documents):
+                del self.digests[document]
+                del self.stamps[document]
+            self.documents = documents
+            if self.inotify is not None:
+                self.update_watches()
+
+    def update_watches(self):
+        directories = set(os.path.dirname(document) for document in self.documents)
+        for directory in set(self.watches) - directories:
+            self.inotify.remove_watch(self.watches.pop(directory))
+        for directory in directories - set(self.watches):
+            try:
+                self.watches[directory] = self.inotify.add_watch(directory)
+            except OSError as ex:
+                print("[error] can't watch " + directory + ": " + str(ex))
+
+    def monitor(self):
+        if self.thread is not None and self.thread.is_alive():
+            return
+
+        self.stopped.clear()
+        if not self.polling:
+            with self.lock:
+                self.inotify = Inotify()
+                self.update_watches()
+            self.wakeup = os.pipe()
+        self.thread = threading.Thread(target=self.watch_polling if self.polling else self.watch_inotify,
+                                       name="DocumentWatcher")
+        self.thread.daemon = True
+        self.thread.start()
+
+    def stop_monitor(self):
+        if self.thread is None:
+            return
+
+        self.stopped.set()
+        if self.wakeup is not None:
+            os.write(self.wakeup[1], b"x")
+        if self.thread is not threading.current_thread():
+            self.thread.join()
+        self.thread = None
+
+    def watch_inotify(self):
+        try:
+            while not self.stopped.is_set():
+                # blocks without a timeout, an idle watcher costs no CPU
+                readable = select.select([self.inotify.fd, self.wakeup[0]], [], [])[0]
+                if self.inotify.fd not in readable:
+                    continue
+
+                candidates = set()
+                with self.lock:
+                    directories = dict((wd, directory) for directory, wd in self.watches.items())
+                    for wd, mask, name in self.inotify.read_events():
+                        if mask & IN_Q_OVERFLOW:
+                            candidates.update(self.documents)
+                        elif mask & IN_IGNORED:
+                            # the directory is gone, it is watched again once set_documents sees it
+                            self.watches.pop(directories.get(wd), None)
+                        elif wd in directories and name:
+                            candidates.add(os.path.join(directories[wd], name))
+                self.check(candidates)
+        finally:
+            with self.lock:
+                self.inotify.close()
+                self.inotify = None
+                self.watches = {}
+            for fd in self.wakeup:
+                os.close(fd)
+            self.wakeup = None
+
+    def watch_polling(self):
+        previous = {}
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                current = dict((document, file_stamp(document)) for document in self.documents)
+                # a changed file is only read once it stayed the same for an interval, not in the middle of a save
+                candidates = [document for document, stamp in current.items()
+                              if stamp != self.stamps[document] and stamp == previous.get(document)]
+            previous = current
+            self.check(candidates)
+
+    def check(self, candidates):
+        """Calls back once if the content of any watched candidate changed."""
+        changed = False
+        with self.lock:
+            for document in candidates:
+                if document not in self.digests:
+                    continue
+                self.stamps[document] = file_stamp(document)
+                digest = file_digest(document)
+                if digest is not None and digest != self.digests[document]:
+                    self.digests[document] = digest
+                    changed = True
+
+        if changed:
+            self.execute()
+        return changed
 
     def execute(self):
         if self.callback is not None:
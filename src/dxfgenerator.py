@@ -0,0 +1,265 @@
+"""Streaming DXF writer, rings become POLYLINE entities in the ENTITIES section of an R12 file.
+
+R12 needs neither handles nor the TABLES, BLOCKS and OBJECTS sections, and is what laser and CNC software
+reads most reliably.
+
+With circles on, the outlines circle primitives leave behind are written as what they approximate: whole
+rings as CIRCLE entities, the arcs left of them after boolean operations as bulged POLYLINE segments.
+That needs numpy, without it every ring stays a plain polyline.
+"""
+import math
+
+from src import vectorized, profiling
+from src.geometryresult import GeometryResult
+
+__author__ = 'sven'
+
+HEADER = "0\nSECTION\n2\nHEADER\n9\n$ACADVER\n1\nAC1009\n9\n$INSUNITS\n70\n4\n0\nENDSEC\n0\nSECTION\n2\nENTITIES\n"
+FOOTER = "0\nENDSEC\n0\nEOF\n"
+
+LAYER = "0"
+# 66 announces the VERTEX entities that follow, 10/20/30 is the unused elevation point
+POLYLINE = "0\nPOLYLINE\n8\n%s\n66\n1\n10\n0.0\n20\n0.0\n30\n0.0\n70\n%d\n"
+VERTEX = "0\nVERTEX\n8\n%s\n10\n" % LAYER
+SEQEND = "0\nSEQEND\n8\n%s\n" % LAYER
+
+# characters of entities collected before they are written to the file
+CHUNK_SIZE = 1 << 20
+
+# consecutive points are only taken for an arc if they are at most this far apart around its center,
+# so polygons whose corners happen to lie on a circle, like rectangles, stay polygons
+MAX_ARC_STEP = math.radians(30)
+# arcs need at least this many segments
+MIN_ARC_SEGMENTS = 3
+# relative tolerance of centers and radii
+ARC_TOLERANCE = 1e-6
+
+
+def closed_rings(coordinates, offsets):
+    """Whether each ring of the buffers repeats its first point at the end."""
+    firsts, lasts = offsets[:-1], offsets[1:] - 1
+    if not len(coordinates):
+        return lasts > firsts
+    return (lasts > firsts) & (coordinates[firsts % len(coordinates)] == coordinates[lasts]).all(axis=1)
+
+
+class ArcVertices(object):
+    """For every point of the coordinate buffers the circle through it and its neighbours on the ring,
+       whether it lies on an arc and whether the next point lies on the same one.
+       Computed for all rings at once, closing points and open rings are never on an arc.
+    """
+
+    def __init__(self, coordinates, offsets):
+        numpy = vectorized.numpy
+        count = len(coordinates)
+        firsts, ends = offsets[:-1], offsets[1:]
+        sizes = ends - firsts
+        self.closed = closed_rings(coordinates, offsets)
+        self.lasts = ends - 1 - self.closed
+
+        # arcs need MIN_ARC_SEGMENTS segments and one more point off them
+        usable = self.closed & (self.lasts - firsts >= MIN_ARC_SEGMENTS)
+        ring = numpy.repeat(numpy.arange(len(sizes)), sizes)
+        index = numpy.arange(count)
+        valid = usable[ring] & (index <= self.lasts[ring])
+
+        previous, following = index - 1, index + 1
+        previous[firsts[usable]] = self.lasts[usable]
+        following[self.lasts[usable]] = firsts[usable]
+        previous[previous < 0] = 0
+        following[following >= count] = 0
+
+        a = coordinates[previous] - coordinates
+        c = coordinates[following] - coordinates
+        with vectorized.ignore_float_errors():
+            d = 2.0 * (a[:, 0] * c[:, 1] - a[:, 1] * c[:, 0])
+            a2 = (a ** 2).sum(axis=1)
+            c2 = (c ** 2).sum(axis=1)
+            offset = numpy.column_stack(((c[:, 1] * a2 - a[:, 1] * c2) / d, (a[:, 0] * c2 - c[:, 0] * a2) / d))
+            self.centers = coordinates + offset
+            self.radii = numpy.hypot(offset[:, 0], offset[:, 1])
+
+            # the angle of the longer chord to a neighbour, around the circle through them
+            longest = numpy.sqrt(numpy.maximum(a2, c2))
+            steps = 2.0 * numpy.arcsin(numpy.minimum(longest / (2.0 * self.radii), 1.0))
+            self.on_arc = valid & numpy.isfinite(self.radii) & (steps <= MAX_ARC_STEP)
+
+            tolerance = ARC_TOLERANCE * self.radii
+            self.linked = self.on_arc & self.on_arc[following] & \
+                (numpy.hypot(*(self.centers[following] - self.centers).T) <= tolerance) & \
+                (numpy.abs(self.radii[following] - self.radii) <= tolerance)
+
+        # per ring the number of linked points, and the sums of their centers and radii for whole circles
+        self.link_counts = numpy.zeros(len(sizes), dtype=int)
+        self.center_sums = numpy.zeros((len(sizes), 2))
+        self.radius_sums = numpy.zeros(len(sizes))
+        nonempty = numpy.nonzero(sizes > 0)[0]
+        if len(nonempty):
+            # points that are not linked, closing points among them, may have no circle at all
+            starts = firsts[nonempty]
+            self.link_counts[nonempty] = numpy.add.reduceat(self.linked.astype(int), starts)
+            self.center_sums[nonempty] = numpy.add.reduceat(numpy.where(self.linked[:, None], self.centers, 0.0), starts)
+            self.radius_sums[nonempty] = numpy.add.reduceat(numpy.where(self.linked, self.radii, 0.0), starts)
+
+    def circle(self, i, first):
+        """Center and radius if all points of ring i lie on one circle, else None."""
+        points = int(self.lasts[i]) - first + 1
+        if self.link_counts[i] != points:
+            return None
+        return (float(self.center_sums[i, 0]) / points, float(self.center_sums[i, 1]) / points), \
+            float(self.radius_sums[i]) / points
+
+    def arc_runs(self, i, first):
+        """(center, radius, first, last) of the arcs of ring i, indices into the ring without its closing point.
+           Points first to last lie on the arc, indices wrap around.
+        """
+        if not self.link_counts[i]:
+            return []
+        end = int(self.lasts[i]) + 1
+        count = end - first
+        on_arc = self.on_arc[first:end].tolist()
+        linked = self.linked[first:end].tolist()
+
+        # walk the ring starting after a break, so no run wraps around the start
+        start = linked.index(False) + 1
+        runs = []
+        j = 0
+        while j < count:
+            vertex = (start + j) % count
+            if not on_arc[vertex]:
+                j += 1
+                continue
+
+            length = 1
+            while j + length < count and linked[(vertex + length - 1) % count]:
+                length += 1
+            j += length
+            if length + 1 < MIN_ARC_SEGMENTS:
+                # any three points lie on some circle, it takes more of them to make an arc
+                continue
+
+            # the arc vertices plus their neighbours on both sides lie on the circle
+            run = (vertex + vectorized.numpy.arange(length)) % count + first
+            runs.append([(float(self.centers[run, 0].mean()), float(self.centers[run, 1].mean())),
+                         float(self.radii[run].mean()), (vertex - 1) % count, (vertex + length) % count])
+
+        # two arcs meeting without a point in between share a chord, it goes to the first of them
+        for previous, run in zip(runs[-1:] + runs[:-1], runs):
+            if len(runs) > 1 and (previous[3] - run[2]) % count == 1:
+                run[2] = previous[3]
+        return [tuple(run) for run in runs if (run[3] - run[2]) % count >= MIN_ARC_SEGMENTS]
+
+
+def swept_angle(center, points):
+    """Signed angle the points sweep around center, counterclockwise positive."""
+    numpy = vectorized.numpy
+    angles = numpy.unwrap(numpy.arctan2(points[:, 1] - center[1], points[:, 0] - center[0]))
+    return float(angles[-1] - angles[0])
+
+
+class DxfGenerator(object):
+    def __init__(self, circles=False):
+        """circles - write circle outlines as CIRCLE entities and arcs as bulges"""
+        self.circles = circles and vectorized.is_available()
+
+    @profiling.profiled("DxfGenerator.write")
+    def write(self, result, filename):
+        """Writes a GeometryResult, or plain shapely geometry."""
+        if not isinstance(result, GeometryResult):
+            result = GeometryResult(result)
+
+        with open(filename, 'w') as f:
+            f.write(HEADER)
+
+            chunk, length = [], 0
+            for entity in self.iterate_entities(result):
+                chunk.append(entity)
+                length += len(entity)
+                if length >= CHUNK_SIZE:
+                    f.write("".join(chunk))
+                    chunk, length = [], 0
+
+            f.write("".join(chunk))
+            f.write(FOOTER)
+
+    def iterate_entities(self, result):
+        coordinates, offsets = result.buffers()[:2]
+        if vectorized.is_available() and not vectorized.is_array(coordinates):
+            # lines in the result, the rings are listed one by one but can still be written from arrays
+            numpy = vectorized.numpy
+            coordinates = numpy.array(coordinates, dtype=float).reshape(-1, 2)
+            offsets = numpy.array(offsets, dtype=numpy.int64)
+
+        if not vectorized.is_array(coordinates):
+            for i in range(len(offsets) - 1):
+                points = [(x, -y) for x, y in coordinates[offsets[i]:offsets[i + 1]]]
+                closed = len(points) > 1 and points[0] == points[-1]
+                if closed:
+                    points = points[:-1]
+                if points:
+                    yield self.polyline([value for point in points for value in point], None, closed)
+            return
+
+        # DXF has its y axis pointing up, the generated geometry uses screen coordinates
+        coordinates = coordinates * (1.0, -1.0) + 0.0
+        arcs = ArcVertices(coordinates, offsets) if self.circles else None
+        closed = (arcs.closed if arcs else closed_rings(coordinates, offsets)).tolist()
+        offsets = offsets.tolist()
+
+        for i in range(len(offsets) - 1):
+            first, end = offsets[i], offsets[i + 1] - closed[i]
+            if end <= first:
+                continue
+
+            if arcs and closed[i]:
+                circle = arcs.circle(i, first)
+                if circle:
+                    yield self.circle(*circle)
+                    continue
+                runs = arcs.arc_runs(i, first)
+                if runs:
+                    yield self.polyline(*self.bulged_vertices(coordinates[first:end], runs), closed=True)
+                    continue
+            yield self.polyline(coordinates[first:end].ravel().tolist(), None, closed[i])
+
+    def bulged_vertices(self, points, runs):
+        """Vertex values and bulges of a ring whose arcs are each replaced by one bulged segment."""
+        count = len(points)
+        arcs = dict((first, (center, last)) for center, radius, first, last in runs)
+        values, bulges = [], []
+
+        # start on the first arc, then follow the ring once around
+        start = vertex = runs[0][2]
+        while True:
+            values.extend((float(points[vertex][0]), float(points[vertex][1])))
+            if vertex in arcs:
+                center, last = arcs[vertex]
+                span = (last - vertex) % count
+                arc = points[(vertex + vectorized.numpy.arange(span + 1)) % count]
+                bulges.append(math.tan(swept_angle(center, arc) / 4.0))
+                vertex = last
+            else:
+                bulges.append(0.0)
+                vertex = (vertex + 1) % count
+            if vertex == start:
+                break
+        return values, bulges
+
+    def polyline(self, values, bulges, closed):
+        header = POLYLINE % (LAYER, 1 if closed else 0)
+        if not bulges:
+            # "0\nVERTEX\n8\n0\n10\nx\n20\ny\n" for every vertex, joined at once
+            values = list(map(repr, values))
+            return header + VERTEX + ("\n" + VERTEX).join(map("\n20\n".join, zip(values[0::2], values[1::2]))) + \
+                "\n" + SEQEND
+
+        lines = [header]
+        for j, bulge in enumerate(bulges):
+            lines.append("%s%r\n20\n%r\n" % (VERTEX, values[2 * j], values[2 * j + 1]))
+            if bulge:
+                lines.append("42\n%r\n" % bulge)
+        lines.append(SEQEND)
+        return "".join(lines)
+
+    def circle(self, center, radius):
+        return "0\nCIRCLE\n8\n%s\n10\n%r\n20\n%r\n40\n%r\n" % (LAYER, center[0], center[1], radius)
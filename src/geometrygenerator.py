@@ -1,19 +1,63 @@
 from __future__ import print_function
+import sys
 
-from PySide.QtCore import QPointF
-from PySide.QtGui import QPolygonF
 from shapely import affinity
-from shapely.geometry import Point, MultiPoint, Polygon
+from shapely.geometry import Point, Polygon, MultiPolygon
 from shapely.geometry.base import BaseMultipartGeometry
+from shapely.ops import unary_union
+from shapely.prepared import prep
+from shapely.strtree import STRtree
 
-from src import cadfileparser
+from src import cadfileparser, vectorized, affinematrix, profiling
 from src.argumentparser import ArgumentParser
+from src.geometryresult import GeometryResult
+from src.primitivecache import PrimitiveCache, DEFAULT_PRIMITIVE_CACHE_SIZE, create_circle_outline, create_rect_outline
+from src.subtreecache import SubtreeCache, SubtreeHasher, DEFAULT_SUBTREE_CACHE_SIZE, split_chunks
 from src.unresolvedtermresolver import UnresolvedTermResolver
 
+if sys.version > '3':
+    long = int
+
+# loop bodies made only of these can be generated with array operations
+BATCH_PRIMITIVES = ("circle", "rect")
+BATCH_MODIFIERS = ("translate", "rotate", "scale")
+
+
+def query_nearby(tree, geometries, geom):
+    """Geometries of the tree whose envelope overlaps the envelope of geom, in their original order."""
+    hits = tree.query(geom)
+    # shapely 2 returns indices, older versions the geometries themselves
+    if len(hits) and not hasattr(hits[0], "geom_type"):
+        return [geometries[i] for i in sorted(hits)]
+    return list(hits)
+
+
+def node_labels(ast, prefix=""):
+    """Path of every node in the AST by id() of the node, like "difference[0]/for[2]/circle[0]", for the per
+       node profile.
+    """
+    labels = {}
+    for index, node in enumerate(ast):
+        name = "for" if isinstance(node, cadfileparser.ForLoop) else getattr(node, "name", type(node).__name__)
+        label = labels[id(node)] = "%s%s[%d]" % (prefix, name, index)
+        labels.update(node_labels(getattr(node, "children", None) or [], label + "/"))
+    return labels
+
+
+class GenerationCancelled(Exception):
+    """Raised inside generate() once its cancelled callback returns True."""
+
 
 class GeometryGenerator(object):
-    def __init__(self, screen_width, screen_height):
+    def __init__(self, screen_width, screen_height, primitive_cache_size=DEFAULT_PRIMITIVE_CACHE_SIZE,
+                 subtree_cache_size=DEFAULT_SUBTREE_CACHE_SIZE, disk_cache=None):
         self.default_resolution = 64
+        self.primitive_cache = PrimitiveCache(primitive_cache_size)
+        # kept between generate() calls, so after an edit only the changed subtrees are generated again,
+        # the optional disk cache keeps them between runs as well
+        self.subtree_cache = SubtreeCache(subtree_cache_size, disk_cache)
+        self.hasher = None
+        self.cancelled = None
 
         self.current_position = [0.0, 0.0]
         self.screen_width = screen_width
@@ -116,17 +160,21 @@ class GeometryGenerator(object):
             "index": 1
         }])
 
+    @profiling.profiled("GeometryGenerator.create_circle")
     def create_circle(self, arguments):
+        """Outline at the origin, shared with every other circle of the same size."""
         radius, resolution = self.circle_argument_parser.parse(arguments)
 
-        return Point(self.current_position[0], self.current_position[1]).buffer(radius, resolution)
+        return self.primitive_cache.get(("circle", radius, resolution), lambda: create_circle_outline(radius, resolution))
 
+    @profiling.profiled("GeometryGenerator.create_rect")
     def create_rect(self, arguments):
+        """Outline at the origin, shared with every other rect of the same size."""
         w, h = self.rect_argument_parser.parse(arguments)
-        x, y = self.current_position
-        return MultiPoint([(x, y), (x, y + h), (x + w, y + h), (x + w, y)]).convex_hull
+        return self.primitive_cache.get(("rect", w, h), lambda: create_rect_outline(w, h))
 
-    def create_primitive(self, primitive):
+    @profiling.profiled("GeometryGenerator.create_primitive", node_argument=1)
+    def create_primitive(self, primitive, matrix=affinematrix.IDENTITY):
 
         if primitive.name == "circle":
             result = self.create_circle(primitive.arguments)
@@ -135,28 +183,79 @@ class GeometryGenerator(object):
         else:
             raise Exception("invalid primitive name '" + primitive.name + "'")
 
-        if primitive.modifiers:
-            for modifier in primitive.modifiers:
-                result = self.apply_modifier(result, modifier)
-
-        return result
+        # moving the outline into place is part of the one transformation at the end
+        placement = affinematrix.translation(self.current_position[0], self.current_position[1])
+        return self.apply_modifiers(result, primitive.modifiers or [], matrix, placement)
 
+    @profiling.profiled("GeometryGenerator.apply_translation")
     def apply_translation(self, geom, translation):
         x, y = self.translate_argument_parser.parse(translation.arguments)
         return affinity.translate(geom, x, y)
 
+    @profiling.profiled("GeometryGenerator.apply_rotation")
     def apply_rotation(self, geom, translation):
         angle, origin_x, origin_y, use_radians = self.rotate_argument_parser.parse(translation.arguments)
         return affinity.rotate(geom, angle, Point(origin_x, origin_y), use_radians)
 
+    @profiling.profiled("GeometryGenerator.apply_scale")
     def apply_scale(self, geom, translation):
         x, y = self.scale_argument_parser.parse(translation.arguments)
         return affinity.scale(geom, x, y)
 
+    @profiling.profiled("GeometryGenerator.apply_simplify")
     def apply_simplify(self, geom, translation):
         tolerance, preserve_topology = self.simplify_argument_parser.parse(translation.arguments)
         return geom.simplify(tolerance, preserve_topology)
 
+    def modifier_matrix(self, modifier, geom=None, matrix=affinematrix.IDENTITY):
+        """Matrix of a modifier applied after matrix, or None if it needs the actual geometry.
+
+           simplify always does. scale works around the center of the bounding box, which is only known
+           up front for a geom whose pending matrix has no rotation.
+        """
+        if modifier.name == "translate":
+            x, y = self.translate_argument_parser.parse(modifier.arguments)
+            return affinematrix.translation(x, y)
+        elif modifier.name == "rotate":
+            angle, origin_x, origin_y, use_radians = self.rotate_argument_parser.parse(modifier.arguments)
+            if origin_x is None or origin_y is None:
+                return None
+            return affinematrix.rotation(angle, origin_x, origin_y, use_radians)
+        elif modifier.name == "scale":
+            if geom is None or geom.is_empty or not affinematrix.is_axis_aligned(matrix):
+                return None
+            x, y = self.scale_argument_parser.parse(modifier.arguments)
+            min_x, min_y, max_x, max_y = geom.bounds
+            origin_x, origin_y = affinematrix.transform_point(matrix, (min_x + max_x) / 2.0, (min_y + max_y) / 2.0)
+            return affinematrix.scaling(x, y, origin_x, origin_y)
+        return None
+
+    def split_modifiers(self, modifiers):
+        """Leading affine part of the modifiers of a scope, which can be pushed down to its children."""
+        matrix = affinematrix.IDENTITY
+        for index, modifier in enumerate(modifiers):
+            modifier_matrix = self.modifier_matrix(modifier)
+            if modifier_matrix is None:
+                return matrix, modifiers[index:]
+            matrix = affinematrix.multiply(modifier_matrix, matrix)
+        return matrix, []
+
+    @profiling.profiled("GeometryGenerator.apply_modifiers")
+    def apply_modifiers(self, geom, modifiers, matrix=affinematrix.IDENTITY, pending=affinematrix.IDENTITY):
+        """Applies pending, the modifiers and then matrix, with one pass over the coordinates for each run of affine
+           modifiers.
+        """
+        for modifier in modifiers:
+            modifier_matrix = self.modifier_matrix(modifier, geom, pending)
+            if modifier_matrix is None:
+                geom = self.apply_modifier(affinematrix.transform(geom, pending), modifier)
+                pending = affinematrix.IDENTITY
+            else:
+                pending = affinematrix.multiply(modifier_matrix, pending)
+
+        return affinematrix.transform(geom, affinematrix.multiply(matrix, pending))
+
+    @profiling.profiled("GeometryGenerator.apply_modifier")
     def apply_modifier(self, geom, modifier):
         result = geom
 
@@ -173,30 +272,89 @@ class GeometryGenerator(object):
 
         return result
 
+    @profiling.profiled("GeometryGenerator.create_union")
     def create_union(self, elements):
-        result = elements[0]
-        for elem in elements[1:]:
-            result = result.union(elem)
-        return result
+        """Cascaded union, merging all elements at once instead of growing one result element by element."""
+        elements = list(elements)
+        if len(elements) < 2:
+            return elements[0] if elements else None
 
-    def create_difference(self, elements):
-        result = elements[0]
-        for elem in elements[1:]:
-            result = result.difference(elem)
-        return result
+        result = vectorized.disjoint_union(elements) if vectorized.is_available() else None
+        return result if result is not None else unary_union(elements)
 
+    @profiling.profiled("GeometryGenerator.create_difference")
+    def create_difference(self, elements):
+        """Subtracts from every part of the first element only the cutters that overlap its envelope."""
+        elements = iter(elements)
+        result = next(elements, None)
+        cutters = [elem for elem in elements if not elem.is_empty]
+        if result is None or result.is_empty or not cutters:
+            return result
+
+        tree = STRtree(cutters)
+        parts = result.geoms if isinstance(result, BaseMultipartGeometry) else [result]
+        pieces = []
+        for part in parts:
+            cutter = self.create_union(query_nearby(tree, cutters, part))
+            if cutter is None:
+                pieces.append(part)
+            else:
+                pieces.append(self.punch_holes(part, cutter) or part.difference(cutter))
+
+        if len(pieces) == 1:
+            return pieces[0]
+
+        # the parts were disjoint and only got smaller, so they can be collected without another overlay
+        polygons = []
+        for piece in pieces:
+            if isinstance(piece, Polygon):
+                polygons.append(piece)
+            elif isinstance(piece, MultiPolygon):
+                polygons.extend(piece.geoms)
+            else:
+                return unary_union(pieces)
+        return MultiPolygon([polygon for polygon in polygons if not polygon.is_empty])
+
+    def punch_holes(self, part, cutter):
+        """Difference for cutters that lie strictly inside the part, their outlines simply become new interiors.
+
+           Returns None if that doesn't apply.
+        """
+        if not isinstance(part, Polygon) or not isinstance(cutter, (Polygon, MultiPolygon)):
+            return None
+
+        holes = cutter.geoms if isinstance(cutter, MultiPolygon) else [cutter]
+        if vectorized.is_available():
+            return vectorized.punch_holes(part, holes)
+        inside = prep(part)
+        if any(hole.interiors or not inside.contains_properly(hole) for hole in holes):
+            return None
+        return Polygon(part.exterior, [interior for interior in part.interiors] + [hole.exterior for hole in holes])
+
+    @profiling.profiled("GeometryGenerator.create_intersection")
     def create_intersection(self, elements):
+        elements = list(elements)
+        if not elements:
+            return None
+
         result = elements[0]
-        for elem in elements[1:]:
+        others = elements[1:]
+        # an element that doesn't even overlap the envelope of the first one empties the whole intersection
+        if others and len(query_nearby(STRtree(others), others, result)) < len(others):
+            return Polygon()
+
+        for elem in others:
+            if result.is_empty:
+                break
             result = result.intersection(elem)
         return result
 
+    @profiling.profiled("GeometryGenerator.apply_temporary_assignments", node_argument=1)
     def apply_temporary_assignments(self, scope):
-        for assignment in scope.arguments:
-            self.termResolver.assignment_stack.append(assignment)
+        self.termResolver.push_assignments(scope.arguments)
 
     def resolve_temporary_assignments(self):
-        self.termResolver.assignment_stack.pop()
+        self.termResolver.pop_assignments()
 
     def being_scope(self, scope):
         if scope.name == "union":
@@ -207,8 +365,6 @@ class GeometryGenerator(object):
             pass
         elif scope.name == "combine":
             pass
-        elif scope.name == "assign":
-            self.apply_temporary_assignments(scope)
         else:
             raise Exception("Unknown Scope '" + scope.name + "'")
 
@@ -221,62 +377,282 @@ class GeometryGenerator(object):
             result = self.create_difference(primitives)
         elif scope.name == "intersection":
             result = self.create_intersection(primitives)
-        elif scope.name == "assign":
-            self.resolve_temporary_assignments()
         else:
             raise Exception("Unknown Scope '" + scope.name + "'")
 
         return result
 
-    def create_scope(self, scope):
+    @profiling.profiled("GeometryGenerator.create_scope", node_argument=1)
+    def create_scope(self, scope, matrix=affinematrix.IDENTITY):
+        """Affine modifiers are moved to the leaves, union, difference and intersection don't change under them."""
         self.being_scope(scope)
-        result = self.extract_primitives(scope.children)
-        result = self.end_scope(scope, result)
-
-        if scope.modifiers:
-            for modifier in scope.modifiers:
-                result = self.apply_modifier(result, modifier)
 
-        return result
+        key = self.subtree_key("scope", [scope], matrix)
+        if key is None:
+            return self.build_scope(scope, matrix)
+        return self.subtree_cache.get(key, lambda: self.build_scope(scope, matrix))
+
+    def build_scope(self, scope, matrix):
+        inner, modifiers = self.split_modifiers(scope.modifiers or [])
+
+        if not modifiers:
+            return self.end_scope(scope, self.extract_operands(scope.name, scope.children, affinematrix.multiply(matrix, inner)))
+
+        result = self.end_scope(scope, self.extract_operands(scope.name, scope.children, inner))
+        return self.apply_modifiers(result, modifiers, matrix)
+
+    def subtree_key(self, kind, nodes, matrix):
+        """Cache key of the geometry of nodes, None if caching is off or a variable can't be resolved."""
+        if self.hasher is None:
+            return None
+
+        names = set()
+        for node in nodes:
+            names |= self.hasher.free_variables(node)
+        try:
+            environment = tuple((name, self.termResolver.lookup(name)) for name in sorted(names))
+        except cadfileparser.SemanticException:
+            return None
+
+        return (kind, tuple(self.hasher.digest(node) for node in nodes), environment, matrix, tuple(self.current_position))
+
+    def extract_operands(self, name, children, matrix):
+        """Like extract_primitives, but with the subtree cache on, the operands are combined in chunks that are
+           cached on their own. An edit then only recomputes the chunk it is in and the final combination.
+        """
+        if self.hasher is None or name not in ("union", "difference", "intersection"):
+            for result in self.extract_primitives(children, matrix):
+                yield result
+            return
+
+        if name == "difference":
+            # the first operand has to stay first, so it must be exactly one geometry
+            first = children[0] if children else None
+            if not (isinstance(first, cadfileparser.Statement) or
+                    (isinstance(first, cadfileparser.Scope) and first.name != "assign")):
+                for result in self.extract_primitives(children, matrix):
+                    yield result
+                return
+
+            for result in self.extract_primitives(children[:1], matrix):
+                yield result
+            children = children[1:]
+
+        combine = self.create_intersection if name == "intersection" else self.create_union
+        for chunk in split_chunks(children, [self.hasher.digest(child) for child in children]):
+            key = self.subtree_key(name, chunk, matrix)
+            if key is None:
+                result = combine(self.extract_primitives(chunk, matrix))
+            else:
+                result = self.subtree_cache.get(key, lambda: combine(self.extract_primitives(chunk, matrix)))
+
+            if result is not None:
+                yield result
+
+    def resolve_loop_bound(self, value):
+        if isinstance(value, cadfileparser.UnresolvedCalculation):
+            return self.termResolver.calculate(value)
+        elif isinstance(value, cadfileparser.Variable):
+            return self.termResolver.lookup(value.identifier)
+        return value
+
+    def is_batchable(self, loop):
+        if not vectorized.is_available() or not all(modifier.name in BATCH_MODIFIERS for modifier in loop.modifiers or []):
+            return False
+
+        for child in loop.children:
+            if isinstance(child, cadfileparser.ForLoop):
+                if not self.is_batchable(child):
+                    return False
+            elif not (isinstance(child, cadfileparser.Statement) and child.type == cadfileparser.StatementType.Primitive and
+                      child.name in BATCH_PRIMITIVES and all(modifier.name in BATCH_MODIFIERS for modifier in child.modifiers or [])):
+                return False
+        return True
+
+    def resolve_batch_range(self, loop):
+        """Integer bounds of a nested loop, or None if they depend on an outer loop variable."""
+        try:
+            start = self.resolve_loop_bound(loop.loop_range.x)
+            end = self.resolve_loop_bound(loop.loop_range.y)
+        except cadfileparser.SemanticException:
+            return None
+
+        if not all(isinstance(bound, (int, long)) and not isinstance(bound, bool) for bound in (start, end)):
+            return None
+        return start, max(end, start)
+
+    def loop_body_size(self, loop):
+        """Number of geometries one iteration creates, or None if that differs between iterations."""
+        size = 0
+        for child in loop.children:
+            if isinstance(child, cadfileparser.ForLoop):
+                loop_range = self.resolve_batch_range(child)
+                child_size = self.loop_body_size(child) if loop_range is not None else None
+                if child_size is None:
+                    return None
+                size += (loop_range[1] - loop_range[0]) * child_size
+            else:
+                size += 1
+        return size
 
-    def extract_primitives(self, expression_list):
+    @profiling.profiled("GeometryGenerator.create_primitive_batch", node_argument=1)
+    def create_primitive_batch(self, primitive, loop_modifiers, count, outer_matrix):
+        """All iterations of one primitive, or None if some argument can't be used on arrays."""
+        if primitive.name == "circle":
+            radius, resolution = self.circle_argument_parser.parse(primitive.arguments)
+            if vectorized.is_array(resolution) or not vectorized.all_finite([radius]):
+                return None
+            # the rings of circles of one size are kept as outlines until the end, unless a scale needs geometries
+            result = vectorized.circle_outlines(self.current_position[0], self.current_position[1], radius, resolution, count)
+            if result is None:
+                result = vectorized.create_circles(self.current_position[0], self.current_position[1], radius, resolution, count)
+        else:
+            w, h = self.rect_argument_parser.parse(primitive.arguments)
+            if not vectorized.all_finite([w, h]):
+                return None
+            result = vectorized.create_rects(self.current_position[0], self.current_position[1], w, h, count)
+
+        matrices = None
+        for modifier in list(primitive.modifiers or []) + list(loop_modifiers or []):
+            if modifier.name == "translate":
+                x, y = self.translate_argument_parser.parse(modifier.arguments)
+                if not vectorized.all_finite([x, y]):
+                    return None
+                matrix = vectorized.translation_matrices(x, y, count)
+            elif modifier.name == "rotate":
+                angle, origin_x, origin_y, use_radians = self.rotate_argument_parser.parse(modifier.arguments)
+                if origin_x is None or origin_y is None or vectorized.is_array(use_radians) or \
+                        not vectorized.all_finite([angle, origin_x, origin_y]):
+                    return None
+                matrix = vectorized.rotation_matrices(angle, origin_x, origin_y, use_radians, count)
+            else:
+                x, y = self.scale_argument_parser.parse(modifier.arguments)
+                if not vectorized.all_finite([x, y]):
+                    return None
+                # scaling is relative to the current bounding box, so everything before has to be applied first
+                if matrices is not None:
+                    result = vectorized.transform(result, matrices)
+                    matrices = None
+                matrix = vectorized.scale_matrices(x, y, result)
+
+            matrices = matrix if matrices is None else vectorized.compose(matrix, matrices)
+
+        if outer_matrix != affinematrix.IDENTITY:
+            matrices = vectorized.compose(outer_matrix, vectorized.identity_matrices(count) if matrices is None else matrices)
+        if matrices is not None:
+            result = vectorized.transform(result, matrices)
+        return vectorized.to_geometries(result)
+
+    @profiling.profiled("GeometryGenerator.create_loop_batch", node_argument=1)
+    def create_loop_batch(self, loop, start, end, bindings, keys, modifiers, matrix):
+        """Generates all iterations of a loop at once, nested loops included, with every loop variable bound to an
+           array. Returns (geometries, keys) pairs, the keys give the order the iterations would have created them in.
+        """
+        bindings = vectorized.nest_bindings(bindings, len(keys), loop.variable, start, end)
+        modifiers = list(loop.modifiers or []) + list(modifiers)
         result = []
 
+        self.termResolver.push_assignments([cadfileparser.Assignment(name, values) for name, values in bindings])
+        try:
+            size = self.loop_body_size(loop)
+            if size is None:
+                return None
+
+            keys = vectorized.nest_keys(keys, end - start, size)
+            offset = 0
+            for child in loop.children:
+                if isinstance(child, cadfileparser.ForLoop):
+                    child_start, child_end = self.resolve_batch_range(child)
+                    if child_end > child_start:
+                        batches = self.create_loop_batch(child, child_start, child_end, bindings, keys + offset, modifiers, matrix)
+                        if batches is None:
+                            return None
+                        result.extend(batches)
+                    offset += (child_end - child_start) * self.loop_body_size(child)
+                else:
+                    geoms = self.create_primitive_batch(child, modifiers, len(keys), matrix)
+                    if geoms is None:
+                        return None
+                    result.append((geoms, keys + offset))
+                    offset += 1
+        finally:
+            self.termResolver.pop_assignments()
+
+        return result
+
+    def iterate_loop(self, loop, matrix=affinematrix.IDENTITY):
+        """Runs the loop body once per index, only the current iteration is kept in memory."""
+        start = self.resolve_loop_bound(loop.loop_range.x)
+        end = self.resolve_loop_bound(loop.loop_range.y)
+
+        # loops of plain primitives are generated with array operations, anything else falls back to iterating
+        if self.is_batchable(loop) and self.resolve_batch_range(loop) is not None and end > start:
+            with vectorized.ignore_float_errors():
+                batches = self.create_loop_batch(loop, start, end, [], vectorized.root_keys(), [], matrix)
+            if batches is not None:
+                for result in vectorized.sort_by_keys(batches):
+                    yield result
+                return
+
+        for i in loop.indices(start, end):
+            self.termResolver.push_assignments([cadfileparser.Assignment(loop.variable, i)])
+            try:
+                # the loop modifiers apply to each child on its own, like the modifiers of a scope to its result
+                inner, modifiers = self.split_modifiers(loop.modifiers or [])
+                if not modifiers:
+                    for result in self.extract_primitives(loop.children, affinematrix.multiply(matrix, inner)):
+                        yield result
+                else:
+                    for result in self.extract_primitives(loop.children, inner):
+                        yield self.apply_modifiers(result, modifiers, matrix)
+            finally:
+                self.termResolver.pop_assignments()
+
+    def extract_primitives(self, expression_list, matrix=affinematrix.IDENTITY):
+        """Yields the geometry of each expression transformed by matrix. Consumers reduce it right away, so loops
+           never get materialized.
+        """
         for expression in expression_list:
+            if self.cancelled is not None and self.cancelled():
+                raise GenerationCancelled()
+
             if isinstance(expression, cadfileparser.Statement) and expression.type == cadfileparser.StatementType.Primitive:
-                result.append(self.create_primitive(expression))
+                yield self.create_primitive(expression, matrix)
+            elif isinstance(expression, cadfileparser.ForLoop):
+                for result in self.iterate_loop(expression, matrix):
+                    yield result
+            elif isinstance(expression, cadfileparser.Scope) and expression.name == "assign":
+                self.apply_temporary_assignments(expression)
+                try:
+                    for result in self.extract_primitives(expression.children, matrix):
+                        yield result
+                finally:
+                    self.resolve_temporary_assignments()
             elif isinstance(expression, cadfileparser.Scope):
-                scope_result = self.create_scope(expression)
-                if isinstance(scope_result, list):
-                    result.extend(scope_result)
-                else:
-                    result.append(scope_result)
+                yield self.create_scope(expression, matrix)
             else:
                 raise Exception("unknown expression type " + repr(type(expression)) + " ( " + repr(expression) + " )")
 
-        return result
-
-    def generate(self, ast):
+    def generate_geometry(self, ast, cancelled=None):
+        """The shapely geometry of the whole program, None if it is empty. Doesn't need Qt.
+           cancelled - checked before every statement, GenerationCancelled is raised once it returns True
+        """
         self.current_position = [self.screen_width/2, self.screen_height/2]
 
-        primitives = self.extract_primitives(ast)
-
-        root_element = None
-        if len(primitives) > 1:
-            root_element = self.create_union(primitives)
-        elif len(primitives) == 1:
-            root_element = primitives[0]
-
-        result = []
-        if root_element:
-            if isinstance(root_element, BaseMultipartGeometry):
-                for geom in root_element.geoms:
-                    print(type(geom))
-                    if isinstance(geom, Polygon):
-                        result.append(QPolygonF(map(lambda c: QPointF(c[0], c[1]), list(geom.exterior.coords))))
-                    else:
-                        result.append(QPolygonF(map(lambda c: QPointF(c[0], c[1]), list(geom.coords))))
-            else:
-                result = [QPolygonF(map(lambda c: QPointF(c[0], c[1]), list(root_element.exterior.coords)))]
-
-        return result
+        caching = self.subtree_cache.max_size > 0 or self.subtree_cache.disk_cache is not None
+        self.hasher = SubtreeHasher() if caching else None
+        self.cancelled = cancelled
+        if profiling.is_node_profiling_enabled():
+            profiling.set_node_labels(node_labels(ast))
+        try:
+            create = lambda: self.create_union(self.extract_operands("union", ast, affinematrix.IDENTITY))
+            key = self.subtree_key("program", ast, affinematrix.IDENTITY)
+            root_element = create() if key is None else self.subtree_cache.get(key, create)
+        finally:
+            self.hasher = None
+            self.cancelled = None
+
+        return root_element
+
+    def generate(self, ast, cancelled=None):
+        return GeometryResult(self.generate_geometry(ast, cancelled))
@@ -0,0 +1,104 @@
+"""Result of GeometryGenerator.generate, plain geometry and coordinate buffers without any Qt types."""
+from shapely.geometry import Polygon
+from shapely.geometry.base import BaseMultipartGeometry
+
+from src import vectorized
+
+__author__ = 'sven'
+
+
+def iterate_parts(geom):
+    if geom is None or geom.is_empty:
+        return
+    if isinstance(geom, BaseMultipartGeometry):
+        for part in geom.geoms:
+            for result in iterate_parts(part):
+                yield result
+    else:
+        yield geom
+
+
+def iterate_rings(geom):
+    """(coordinates, closed) of every exterior, interior and line of geom."""
+    for part in iterate_parts(geom):
+        if isinstance(part, Polygon):
+            yield part.exterior.coords, True
+            for interior in part.interiors:
+                yield interior.coords, True
+        else:
+            yield part.coords, part.geom_type == "LinearRing"
+
+
+def ring_buffers(geom):
+    """Coordinates of all rings in one list, with ring offsets and a flag telling exteriors and lines from interiors."""
+    coordinates, offsets, exteriors = [], [0], []
+    for part in iterate_parts(geom):
+        if isinstance(part, Polygon):
+            rings = [part.exterior] + list(part.interiors)
+        else:
+            rings = [part]
+
+        for i, ring in enumerate(rings):
+            coordinates.extend(tuple(point[:2]) for point in ring.coords)
+            offsets.append(len(coordinates))
+            exteriors.append(i == 0)
+    return coordinates, offsets, exteriors
+
+
+class GeometryResult(object):
+    """The generated shapely geometry, plus its coordinates in contiguous buffers built on first use.
+
+       Ring i is coordinates[offsets[i]:offsets[i + 1]]. With numpy and shapely 2 the buffers are numpy arrays,
+       an (n, 2) float array and integer arrays, otherwise lists.
+    """
+
+    def __init__(self, geometry):
+        self.geometry = geometry
+        self._buffers = None
+
+    def buffers(self):
+        """(coordinates, offsets, exteriors)"""
+        if self._buffers is None:
+            result = vectorized.ring_buffers(self.geometry) if vectorized.is_available() else None
+            self._buffers = result if result is not None else ring_buffers(self.geometry)
+        return self._buffers
+
+    @property
+    def coordinates(self):
+        return self.buffers()[0]
+
+    @property
+    def offsets(self):
+        return self.buffers()[1]
+
+    @property
+    def exteriors(self):
+        return self.buffers()[2]
+
+    def rings(self, interiors=True):
+        """(x, y) pairs of every ring. The whole buffer is converted in one go, as one flat list of floats,
+           which is much cheaper than a list per point.
+        """
+        coordinates, offsets, exteriors = self.buffers()
+        if not vectorized.is_array(coordinates):
+            for i in range(len(offsets) - 1):
+                if interiors or exteriors[i]:
+                    yield coordinates[offsets[i]:offsets[i + 1]]
+            return
+
+        values = coordinates.ravel().tolist()
+        offsets = (offsets * 2).tolist()
+        for i, exterior in enumerate(exteriors.tolist()):
+            if interiors or exterior:
+                yield zip(values[offsets[i]:offsets[i + 1]:2], values[offsets[i] + 1:offsets[i + 1]:2])
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __bool__(self):
+        return self.geometry is not None and not self.geometry.is_empty
+
+    __nonzero__ = __bool__
+
+    def __repr__(self):
+        return "{GEOMETRY RESULT: " + str(len(self)) + " rings}"
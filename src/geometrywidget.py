@@ -1,17 +1,26 @@
 from __future__ import print_function
 import os
-import svgwrite
 from PySide import QtCore, QtGui
-from PySide.QtCore import Qt
-from PySide.QtGui import QMessageBox
+from PySide.QtCore import Qt, QPointF
+from PySide.QtGui import QMessageBox, QPolygonF
+
+from src import profiling
+from src.dxfgenerator import DxfGenerator
+from src.svggenerator import SvgGenerator
+from src.viewport import Viewport, RingIndex
+
+# zoom factor of one wheel step
+ZOOM_STEP = 1.25
 
 
 class GeometryWidget(QtGui.QMainWindow, object):
-    def __init__(self, filename, data, log_data, error, screen_width, screen_height, load_file_callback):
+    def __init__(self, filename, result, log_data, error, screen_width, screen_height, load_file_callback):
         super(GeometryWidget, self).__init__()
 
         self.filename = filename
-        self.data = data
+        self.viewport = Viewport()
+        self.dragPosition = None
+        self.setResult(result)
         self.screen_width = screen_width
         self.screen_height = screen_height
         self.load_file_callback = load_file_callback
@@ -24,37 +33,32 @@ class GeometryWidget(QtGui.QMainWindow, object):
         self.initUI()
 
     def openFile(self):
-        self.filename = str(QtGui.QFileDialog.getOpenFileName(self, 'Open File', os.path.expanduser('~')))
+        filename, selected_filter = QtGui.QFileDialog.getOpenFileName(self, 'Open File', os.path.expanduser('~'))
+        if not filename:
+            return
+        self.filename = str(filename)
         self.load_file_callback(self.filename)
         self.setWindowTitle('OpenSCAD2D - ' + os.path.basename(self.filename))
 
     def exportSvgFile(self):
-        if not self.data:
-            QMessageBox.about(self, "No Data loaded yet!")
-            return
+        filename = self.exportFileName('Export SVG File', "*.svg")
+        if filename:
+            SvgGenerator().write(self.result, filename)
 
-        svgFilename = str(QtGui.QFileDialog.getSaveFileName(self, 'Export SVG File', os.path.expanduser('~'), "*.svg"))
-
-        drawing = svgwrite.Drawing(svgFilename, profile='tiny', size=('1220mm', '610mm'), viewBox=('0 0 1220 610'))
-        group = drawing.add(drawing.g(id='geometries', stroke='black', fill='none'))
-
-        for elem in self.data:
-            if elem.count() > 0:
-                path = drawing.path()
+    def exportDxfFile(self):
+        filename = self.exportFileName('Export DXF File', "*.dxf")
+        if filename:
+            DxfGenerator(circles=True).write(self.result, filename)
 
-                first = True
-                for p in elem:
-                    if first:
-                        first = False
-                        path.push(['M', p.x(), p.y()])
-                    else:
-                        path.push(['L', p.x(), p.y()])
+    def exportFileName(self, caption, file_filter):
+        """Target file chosen by the user, None if there is nothing to export or the dialog was cancelled."""
+        if not self.result:
+            QMessageBox.about(self, "Export", "No Data loaded yet!")
+            return None
 
-                group.add(path)
-        drawing.save()
-
-    def exportDxfFile(self):
-        pass # TODO
+        # PySide returns the filename together with the selected filter
+        filename, selected_filter = QtGui.QFileDialog.getSaveFileName(self, caption, os.path.expanduser('~'), file_filter)
+        return str(filename) if filename else None
 
     def createMenu(self):
         openAction = QtGui.QAction(QtGui.QIcon('open.png'), '&Open', self)
@@ -67,6 +71,11 @@ class GeometryWidget(QtGui.QMainWindow, object):
         exportSvgAction.setStatusTip('Export SVG File')
         exportSvgAction.triggered.connect(self.exportSvgFile)
 
+        exportDxfAction = QtGui.QAction(QtGui.QIcon('export.png'), 'Export &DXF', self)
+        exportDxfAction.setShortcut('Ctrl+D')
+        exportDxfAction.setStatusTip('Export DXF File')
+        exportDxfAction.triggered.connect(self.exportDxfFile)
+
         exitAction = QtGui.QAction(QtGui.QIcon('exit.png'), '&Exit', self)
         exitAction.setShortcut('Ctrl+Q')
         exitAction.setStatusTip('Exit application')
@@ -74,6 +83,7 @@ class GeometryWidget(QtGui.QMainWindow, object):
 
         exportMenu = QtGui.QMenu('Export', self)
         exportMenu.addAction(exportSvgAction)
+        exportMenu.addAction(exportDxfAction)
 
         menubar = self.menuBar()
         fileMenu = menubar.addMenu('&File')
@@ -81,7 +91,13 @@ class GeometryWidget(QtGui.QMainWindow, object):
         fileMenu.addMenu(exportMenu)
         fileMenu.addAction(exitAction)
 
+        resetViewAction = QtGui.QAction('&Reset View', self)
+        resetViewAction.setShortcut('Ctrl+0')
+        resetViewAction.setStatusTip('Reset zoom and pan')
+        resetViewAction.triggered.connect(self.resetView)
+
         viewMenu = menubar.addMenu('&View')
+        viewMenu.addAction(resetViewAction)
         helpMenu = menubar.addMenu('&?')
 
     def initUI(self):
@@ -107,31 +123,112 @@ class GeometryWidget(QtGui.QMainWindow, object):
         self.show()
 
 
+    @profiling.profiled("GeometryWidget.paintEvent")
     def paintEvent(self, event):
 
         qp = QtGui.QPainter()
         qp.begin(self)
 
-        qp.setPen(QtGui.QColor(Qt.black))
-        if self.data:
-            for elem in self.data:
-                qp.drawPolyline(elem)
+        # window moves, dock resizes and the loading indicator only copy the cached scene
+        if self.index:
+            qp.drawPixmap(event.rect(), self.scenePixmap(), event.rect())
         if self.isLoading:
             self.drawLoading(event, qp)
         qp.end()
 
-
+    def scenePixmap(self):
+        """The drawn geometry, rendered again only after the result, the view or the size changed."""
+        if self.scene is None or self.scene.size() != self.size():
+            self.scene = QtGui.QPixmap(self.size())
+            self.scene.fill(self.palette().color(QtGui.QPalette.Background))
+
+            qp = QtGui.QPainter()
+            qp.begin(self.scene)
+            self.drawOutlines(self.rect(), qp)
+            qp.end()
+        return self.scene
+
+    def invalidateScene(self):
+        self.scene = None
+        self.update()
+
+    @profiling.profiled("GeometryWidget.drawOutlines")
+    def drawOutlines(self, rect, qp):
+        """Draws the rings overlapping rect, holes included, in the level of detail that fits the zoom."""
+        viewport = self.viewport
+        area = viewport.visible_area(rect.x(), rect.y(), rect.width(), rect.height())
+        pixel_size = viewport.pixel_size()
+        level = self.index.level_for(pixel_size)
+
+        qp.save()
+        # a cosmetic pen keeps its width at any zoom
+        qp.setPen(QtGui.QPen(QtGui.QColor(Qt.black), 0))
+        qp.setTransform(QtGui.QTransform(viewport.scale, 0, 0, viewport.scale, viewport.offset[0], viewport.offset[1]))
+        visible = self.index.visible(area)
+        profiling.count("GeometryWidget.rings", len(visible))
+        for position in visible:
+            if self.index.is_tiny(position, pixel_size):
+                x0, y0 = self.index.bounds[position][:2]
+                qp.drawPoint(QPointF(x0, y0))
+            else:
+                qp.drawPolyline(self.outline(level, position))
+        qp.restore()
+
+    def outline(self, level, position):
+        """QPolygonF of a ring in a level of detail, converted the first time it is drawn."""
+        key = (level, position)
+        if key not in self.outlines:
+            with profiling.timed("GeometryWidget.outline"):
+                self.outlines[key] = QPolygonF([QPointF(x, y) for x, y in self.index.outline(level, position)])
+        return self.outlines[key]
+
+    def resetView(self):
+        self.viewport.reset()
+        self.invalidateScene()
+
+    def wheelEvent(self, event):
+        self.viewport.zoom_at(event.pos().x(), event.pos().y(), ZOOM_STEP ** (event.delta() / 120.0))
+        self.invalidateScene()
+
+    def mousePressEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.dragPosition = event.pos()
+
+    def mouseMoveEvent(self, event):
+        if self.dragPosition is not None:
+            position = event.pos()
+            self.viewport.pan(position.x() - self.dragPosition.x(), position.y() - self.dragPosition.y())
+            self.dragPosition = position
+            self.invalidateScene()
+
+    def mouseReleaseEvent(self, event):
+        if event.button() == Qt.LeftButton:
+            self.dragPosition = None
 
     def drawLoading(self, event, qp):
         qp.setPen(QtGui.QColor(168, 34, 3))
         qp.setFont(QtGui.QFont('Decorative', 10))
         qp.drawText(event.rect(), QtCore.Qt.AlignCenter, "Loading...")
 
-    def setData(self, data, log_data, error):
-        self.data = data
+    def setLoading(self, loading):
+        self.isLoading = loading
+        self.update()
+
+    def setResult(self, result):
+        # the generator result, its ring index, the QPolygonFs drawn so far and the rendered scene,
+        # they are kept until the next result
+        self.result = result
+        self.index = RingIndex(result) if result else None
+        self.outlines = {}
+        self.scene = None
+
+    def setData(self, result, log_data, error):
+        self.setResult(result)
         if self.logList:
             self.logList.addItems(log_data)
         else:
             self.logList = log_data
         self.current_error = error
-        self.updateGeometry()
\ No newline at end of file
+        self.isLoading = False
+        self.updateGeometry()
+        self.update()
\ No newline at end of file
@@ -1,79 +1,156 @@
 # pylint: disable-msg=E0611
 from __future__ import print_function
+import argparse
 import sys
+import traceback
 from PySide import QtCore, QtGui
 
+from src import profiling
+from src.diskcache import DiskCache
 from src.documentwatcher import DocumentWatcher
 from src.geometrywidget import GeometryWidget
-from src.cadfileparser import FcadParser
+from src.cadfileparser import FcadParser, StatementCache, used_files
+from src.astoptimizer import AstOptimizer
 from src.printcapturecontext import PrintCaptureContext
 from src.svggenerator import SvgGenerator
-from src.geometrygenerator import GeometryGenerator
+from src.geometrygenerator import GeometryGenerator, GenerationCancelled
+from src.renderscheduler import RenderScheduler
+
+
+class RenderSignals(QtCore.QObject):
+    """Hands the state of the render worker to the widget on the GUI thread."""
+    started = QtCore.Signal()
+    finished = QtCore.Signal(object, object, object)
 
 
 class OpenSCAD2D(object):
-    def __init__(self, filename):
+    def __init__(self, filename, disk_cache=None):
 
         self.screen_width, self.screen_height = 800.0, 600.0
 
+        self.disk_cache = disk_cache
         self.file_generator = SvgGenerator()
-        self.geometry_generator = GeometryGenerator(self.screen_width, self.screen_height)
+        self.geometry_generator = GeometryGenerator(self.screen_width, self.screen_height, disk_cache=disk_cache)
 
         self.widget = None
         self.watcher = None
+        self.signals = None
+        # parsing and generating happen on a worker thread, bursts of file changes lead to one render
+        self.scheduler = RenderScheduler(self.render, self.on_render_finished, self.on_render_started)
+        self.result = None
 
         self.loadFile(filename)
 
     def loadFile(self, filename):
         self.filename = filename
 
+        # one watcher for the whole session, it just follows the open file and the files it uses
         if self.watcher:
-            self.watcher.stop_monitor()
-        self.watcher = DocumentWatcher(self.filename, self.on_file_change)
-        self.watcher.monitor()
-
-        self.parser = FcadParser(filename)
-
-        self.update()
-
-    def update(self):
+            self.watcher.set_documents(self.documents())
+        else:
+            self.watcher = DocumentWatcher(self.documents(), self.on_file_change)
+            self.watcher.monitor()
+
+        # reused by every parse of this file, so an edit only parses the statements that changed again
+        self.statement_cache = StatementCache()
+        self.scheduler.request(0)
+
+    def render(self, cancelled=None):
+        """Parses and generates the current file, returns (result, log lines, error).
+           cancelled - checked between the steps and by the generator, see RenderScheduler
+        """
+        data, error = None, None
         with PrintCaptureContext() as capture_context:
-            self.parser = FcadParser(self.filename)
-            ast, error = self.parser.parse()
-            print("AST:", ast, ", Error:", error)
+            try:
+                self.parser = FcadParser(self.filename, disk_cache=self.disk_cache, statement_cache=self.statement_cache)
+                ast, error = self.parser.parse()
+                print("AST:", ast, ", Error:", error)
+
+                if not error and not (cancelled and cancelled()):
+                    optimizer = AstOptimizer(self.parser.symtab)
+                    ast = optimizer.optimize(ast)
+                    print(optimizer.report)
+
+                    if not (cancelled and cancelled()):
+                        data = self.geometry_generator.generate(ast, cancelled)
+            except GenerationCancelled:
+                raise
+            except Exception as ex:
+                # there is no caller to raise to on the worker thread, the error goes to the log list instead
+                error = str(ex) or type(ex).__name__
+                traceback.print_exc(file=sys.stdout)
+
+            if error:
+                print("[error]", error)
 
-            if not error:
-                data = self.geometry_generator.generate(ast)
-            else:
-                raise Exception(error)
+        return data, capture_context, error
 
+    def update(self):
+        """Renders right away on the calling thread."""
+        self.result = self.render()
         if self.widget:
-            self.widget.setData(data, capture_context, error)
+            self.widget.setData(*self.result)
+        return self.result
 
-        return data, capture_context, error
+    def on_render_started(self):
+        if self.signals:
+            self.signals.started.emit()
+
+    def on_render_finished(self, result):
+        self.result = result
+        if self.signals:
+            self.signals.finished.emit(*result)
 
     def run(self):
         app = QtGui.QApplication(sys.argv)
         app.setApplicationName("OpenSCAD2D")
         app.setQuitOnLastWindowClosed(True)
         app.setWindowIcon(QtGui.QIcon('../logo.png'))
-        data, capture_context, error = self.update()
+
+        # the window shows up right away, with the loading indicator until the first render is done
+        data, capture_context, error = self.result or (None, [], None)
         self.widget = GeometryWidget(self.filename, data, capture_context, error, self.screen_width, self.screen_height, self.loadFile)
+        self.widget.setLoading(self.result is None)
 
-        if self.watcher:
-            self.watcher.stop_monitor()
+        # signals emitted on the worker thread are delivered on the GUI thread
+        self.signals = RenderSignals()
+        self.signals.started.connect(lambda: self.widget.setLoading(True), QtCore.Qt.QueuedConnection)
+        self.signals.finished.connect(self.widget.setData, QtCore.Qt.QueuedConnection)
+        self.scheduler.start()
 
-        sys.exit(app.exec_())
+        try:
+            status = app.exec_()
+        finally:
+            self.scheduler.stop()
+            if self.watcher:
+                self.watcher.stop_monitor()
+
+        sys.exit(status)
+
+    def documents(self):
+        return [self.filename] + used_files(self.filename)
 
     def on_file_change(self):
-        self.update()
+        # called on the watcher thread, only for real content changes, editors often write a file more than
+        # once per save though
+        self.watcher.set_documents(self.documents())
+        self.scheduler.request()
 
 if __name__ == "__main__":
-    if len(sys.argv) <= 1:
-        #print "no"
-        program = OpenSCAD2D("../test/data/complex_example.fcad")
-    else:
-        program = OpenSCAD2D(sys.argv[1])
-
-    program.run()
+    argument_parser = argparse.ArgumentParser(prog="openscad2d")
+    argument_parser.add_argument("filename", nargs="?", default="../test/data/complex_example.fcad")
+    argument_parser.add_argument("--cache", help="on-disk cache of parse results and geometry, shared between runs")
+    argument_parser.add_argument("--profile", help="write call counts and timings of the render stages as JSON to this file on exit")
+    argument_parser.add_argument("--profile-nodes", action="store_true", help="also time every AST node in the profile")
+    # Qt takes its own options from sys.argv
+    args, unknown = argument_parser.parse_known_args()
+
+    if args.profile:
+        profiling.enable_profiling(args.profile_nodes)
+    try:
+        program = OpenSCAD2D(args.filename, disk_cache=DiskCache(args.cache) if args.cache else None)
+        program.run()
+    finally:
+        if args.profile:
+            profiling.write_report(args.profile)
 
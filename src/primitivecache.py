@@ -0,0 +1,57 @@
+from collections import OrderedDict
+
+from shapely.geometry import Point, MultiPoint
+
+__author__ = 'sven'
+
+DEFAULT_PRIMITIVE_CACHE_SIZE = 256
+
+
+class PrimitiveCache(object):
+    """LRU cache of primitive outlines at the origin, keyed by primitive name and resolved arguments.
+
+       Shapely geometries are immutable, so one outline can be shared by every instance. A max_size of 0
+       disables caching, every lookup then creates the outline again.
+    """
+
+    def __init__(self, max_size=DEFAULT_PRIMITIVE_CACHE_SIZE):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, create):
+        """Cached outline for key, create() makes it if it isn't cached."""
+        if key in self.entries:
+            self.hits += 1
+            geom = self.entries.pop(key)
+            self.entries[key] = geom
+            return geom
+
+        self.misses += 1
+        geom = create()
+        if self.max_size > 0:
+            self.entries[key] = geom
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+        return geom
+
+    def clear(self):
+        self.entries.clear()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __repr__(self):
+        return "{PRIMITIVE CACHE: " + str(len(self.entries)) + " of " + str(self.max_size) + " outlines, " + \
+               str(self.hits) + " hits, " + str(self.misses) + " misses}"
+
+
+def create_circle_outline(radius, resolution):
+    return Point(0, 0).buffer(radius, resolution)
+
+
+def create_rect_outline(w, h):
+    return MultiPoint([(0, 0), (0, h), (w, h), (w, 0)]).convex_hull
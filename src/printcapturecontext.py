@@ -1,12 +1,62 @@
-from cStringIO import StringIO
 import sys
+import threading
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+# guards installing and removing the ThreadRoutedStream
+_lock = threading.Lock()
+_captures = 0
+
+
+class ThreadRoutedStream(object):
+    """Stands in for sys.stdout while captures are running. What a thread with a capture prints goes to it,
+       everything else to the original stream.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def target(self):
+        buffer = getattr(self.local, "buffer", None)
+        return self.stream if buffer is None else buffer
+
+    def write(self, text):
+        self.target().write(text)
+
+    def flush(self):
+        self.target().flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
 
 class PrintCaptureContext(list):
+    """Collects the lines printed on the current thread, other threads keep printing to sys.stdout."""
+
     def __enter__(self):
-        self._stdout = sys.stdout
-        sys.stdout = self._stringio = StringIO()
+        global _captures
+        with _lock:
+            if not isinstance(sys.stdout, ThreadRoutedStream):
+                sys.stdout = ThreadRoutedStream(sys.stdout)
+            self._routed = sys.stdout
+            _captures += 1
+
+        # nested captures on the same thread hand the previous one back on exit
+        self._previous = getattr(self._routed.local, "buffer", None)
+        self._routed.local.buffer = self._stringio = StringIO()
         return self
 
     def __exit__(self, *args):
+        global _captures
+        self._routed.local.buffer = self._previous
         self.extend(self._stringio.getvalue().splitlines())
-        sys.stdout = self._stdout
\ No newline at end of file
+
+        with _lock:
+            _captures -= 1
+            # unless someone replaced sys.stdout in the meantime
+            if not _captures and sys.stdout is self._routed:
+                sys.stdout = self._routed.stream
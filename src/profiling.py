@@ -0,0 +1,194 @@
+"""Timers and counters for the stages of a render.
+
+Profiling is off by default, a profiled function then costs one extra call and a check of a global. It is
+switched on with enable_profiling(), the --profile option of the GUI and of the batch renderer does that and
+writes get_report() to a JSON file at the end.
+
+Every timer keeps its calls, the time spent in them ("total") and the part of it not spent in other timers
+("self"). The generator hands geometries on lazily, so a union runs the primitives it merges, their time only
+shows up in their own self time. With per_node the time is also attributed to the AST nodes, labelled by their
+path in the program (see set_node_labels).
+"""
+from __future__ import print_function
+import json
+import threading
+import time
+
+__author__ = 'sven'
+
+PERCENTILES = (50, 90, 99)
+
+timer = getattr(time, "perf_counter", time.time)
+
+_profile = None
+
+
+class Profile(object):
+    def __init__(self, per_node=False):
+        self.per_node = per_node
+        self.durations = {}
+        self.self_times = {}
+        self.counters = {}
+        self.nodes = {}
+        self.node_labels = {}
+        # timers running on this thread, each with the time of the timers nested in it so far
+        self.local = threading.local()
+
+    def start(self):
+        stack = getattr(self.local, "stack", None)
+        if stack is None:
+            stack = self.local.stack = []
+        stack.append(0.0)
+        return timer()
+
+    def stop(self, name, start, node=None):
+        duration = timer() - start
+        stack = self.local.stack
+        nested = stack.pop()
+        if stack:
+            stack[-1] += duration
+
+        self.durations.setdefault(name, []).append(duration)
+        self.self_times[name] = self.self_times.get(name, 0.0) + duration - nested
+        if node is not None:
+            label = name + " " + self.node_labels.get(id(node), type(node).__name__)
+            self.nodes.setdefault(label, []).append(duration)
+
+    def count(self, name, amount=1):
+        self.counters[name] = self.counters.get(name, 0) + amount
+
+    def samples(self):
+        """The raw measurements as plain dicts and lists, they can be pickled and merged into another profile."""
+        return {"durations": self.durations, "self": self.self_times, "counters": self.counters, "nodes": self.nodes}
+
+    def merge(self, samples, node_prefix=""):
+        for name, durations in samples["durations"].items():
+            self.durations.setdefault(name, []).extend(durations)
+        for name, self_time in samples["self"].items():
+            self.self_times[name] = self.self_times.get(name, 0.0) + self_time
+        for name, amount in samples["counters"].items():
+            self.count(name, amount)
+        for label, durations in samples["nodes"].items():
+            self.nodes.setdefault(node_prefix + label, []).extend(durations)
+
+    def report(self):
+        timers = {}
+        for name, durations in self.durations.items():
+            timers[name] = summarize(durations)
+            timers[name]["self"] = self.self_times[name]
+
+        report = {"timers": timers, "counters": dict(self.counters)}
+        if self.per_node:
+            report["nodes"] = dict((label, summarize(durations)) for label, durations in self.nodes.items())
+        return report
+
+
+def summarize(durations):
+    ordered = sorted(durations)
+    result = {"count": len(ordered), "total": sum(ordered), "min": ordered[0], "max": ordered[-1],
+              "mean": sum(ordered) / len(ordered)}
+    for percentile in PERCENTILES:
+        # nearest rank
+        rank = max(-(-percentile * len(ordered) // 100), 1)
+        result["p%d" % percentile] = ordered[rank - 1]
+    return result
+
+
+def enable_profiling(per_node=False):
+    global _profile
+    _profile = Profile(per_node)
+
+
+def disable_profiling():
+    global _profile
+    _profile = None
+
+
+def is_profiling_enabled():
+    return _profile is not None
+
+
+def is_node_profiling_enabled():
+    profile = _profile
+    return profile is not None and profile.per_node
+
+
+def profiled(name, node_argument=None):
+    """Decorator that times every call of a function as name.
+       node_argument - position of the AST node the call works on, for the per node report
+    """
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            profile = _profile
+            if profile is None:
+                return func(*args, **kwargs)
+
+            node = args[node_argument] if profile.per_node and node_argument is not None else None
+            start = profile.start()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                profile.stop(name, start, node)
+
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
+class timed(object):
+    """Times a block as name, like profiled does for a function."""
+
+    def __init__(self, name):
+        self.name = name
+        self.profile = None
+        self.start = None
+
+    def __enter__(self):
+        self.profile = _profile
+        if self.profile is not None:
+            self.start = self.profile.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, tb):
+        if self.profile is not None:
+            self.profile.stop(self.name, self.start)
+
+
+def count(name, amount=1):
+    profile = _profile
+    if profile is not None:
+        profile.count(name, amount)
+
+
+def set_node_labels(labels):
+    """Labels of the AST nodes for the per node report, by id() of the node."""
+    profile = _profile
+    if profile is not None:
+        profile.node_labels = labels
+
+
+def take_samples():
+    """The measurements so far, the profile starts over afterwards. None if profiling is off."""
+    global _profile
+    profile = _profile
+    if profile is None:
+        return None
+    _profile = Profile(profile.per_node)
+    return profile.samples()
+
+
+def merge_samples(samples, node_prefix=""):
+    profile = _profile
+    if profile is not None and samples is not None:
+        profile.merge(samples, node_prefix)
+
+
+def get_report():
+    """Counts, total and self times and percentiles of every timer in seconds, and the counters."""
+    return _profile.report() if _profile is not None else {"timers": {}, "counters": {}}
+
+
+def write_report(filename):
+    with open(filename, "w") as f:
+        json.dump(get_report(), f, indent=2, sort_keys=True)
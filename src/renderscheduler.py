@@ -0,0 +1,105 @@
+"""Runs renders on one background thread, so the caller never waits for the parser or the geometry generator.
+
+Requests are debounced, a burst of them, like an editor saving twice, leads to one render. A request arriving
+while a render runs makes that render stale: it is told to stop through its cancelled callback and its result
+is dropped, the render of the newest request follows.
+"""
+from __future__ import print_function
+import threading
+import time
+import traceback
+
+__author__ = 'sven'
+
+# seconds a request waits for the next one before the render starts
+DEFAULT_DELAY = 0.2
+
+
+class RenderScheduler(object):
+    def __init__(self, render, finished, started=None, delay=DEFAULT_DELAY):
+        """render - called on the worker thread with a cancelled callback, which returns True once a newer
+                    request makes the render pointless, returns the result
+           finished - called on the worker thread with the result of the newest request
+           started - called on the worker thread before a render starts
+        """
+        self.render = render
+        self.finished = finished
+        self.started = started
+        self.delay = delay
+
+        self.condition = threading.Condition()
+        self.version = 0
+        self.pending = False
+        self.deadline = 0.0
+        # version of the running render
+        self.rendering = None
+        self.stopped = False
+        self.thread = None
+
+    def start(self):
+        """Starts the worker, requests made before are rendered then."""
+        with self.condition:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, name="RenderScheduler")
+                self.thread.daemon = True
+                self.thread.start()
+
+    def stop(self, timeout=None):
+        """Cancels the running render and ends the worker."""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify_all()
+        if self.thread is not None and self.thread is not threading.current_thread():
+            self.thread.join(timeout)
+
+    def request(self, delay=None):
+        """Asks for a render, after delay seconds without another request. Safe to call from any thread."""
+        with self.condition:
+            self.version += 1
+            self.pending = True
+            self.deadline = time.time() + (self.delay if delay is None else delay)
+            self.condition.notify_all()
+
+    def is_busy(self):
+        """Whether a render runs or a request waits for one."""
+        with self.condition:
+            return self.pending or self.rendering is not None
+
+    def next_version(self):
+        """Waits for a request and its delay, returns its version, None once stopped."""
+        with self.condition:
+            while not self.stopped:
+                if self.pending:
+                    remaining = self.deadline - time.time()
+                    if remaining <= 0:
+                        self.pending = False
+                        self.rendering = self.version
+                        return self.version
+                    self.condition.wait(remaining)
+                else:
+                    self.condition.wait()
+            return None
+
+    def is_stale(self, version):
+        return self.stopped or self.version != version
+
+    def run(self):
+        while True:
+            version = self.next_version()
+            if version is None:
+                return
+
+            cancelled = lambda: self.is_stale(version)
+            try:
+                if self.started:
+                    self.started()
+                result = self.render(cancelled)
+                if not cancelled():
+                    self.finished(result)
+            except Exception:
+                # a stale render may stop with any exception, only others are worth reporting
+                if not cancelled():
+                    traceback.print_exc()
+            finally:
+                with self.condition:
+                    self.rendering = None
@@ -0,0 +1,136 @@
+import hashlib
+
+from src.cadfileparser import Statement, Scope, ForLoop, Assignment, Variable, UnresolvedCalculation
+from src.primitivecache import PrimitiveCache
+
+__author__ = 'sven'
+
+DEFAULT_SUBTREE_CACHE_SIZE = 2048
+
+# a chunk of operands ends after every operand whose digest starts with a byte divisible by this, so
+# on average chunks have this many operands and an insertion only moves the boundaries next to it
+CHUNK_SIZE = 16
+
+
+class SubtreeCache(PrimitiveCache):
+    """LRU cache of generated geometry, keyed by the digests of the subtrees and everything they depend on.
+
+       With a disk cache, misses are looked up there before the geometry is generated, and generated
+       geometry is stored there as well.
+    """
+
+    def __init__(self, max_size=DEFAULT_SUBTREE_CACHE_SIZE, disk_cache=None):
+        super(SubtreeCache, self).__init__(max_size)
+        self.disk_cache = disk_cache
+
+    def get(self, key, create):
+        if self.disk_cache is None or key in self.entries:
+            return super(SubtreeCache, self).get(key, create)
+        return super(SubtreeCache, self).get(key, lambda: self.load_or_create(key, create))
+
+    def load_or_create(self, key, create):
+        disk_key = self.disk_cache.key("subtree", key)
+        geom = self.disk_cache.load_geometry(disk_key)
+        if geom is None:
+            geom = create()
+            if geom is not None:
+                self.disk_cache.store_geometry(disk_key, geom)
+        return geom
+
+    def __repr__(self):
+        return "{SUBTREE CACHE: " + str(len(self.entries)) + " of " + str(self.max_size) + " subtrees, " + \
+               str(self.hits) + " hits, " + str(self.misses) + " misses}"
+
+
+def term_variables(term, result):
+    if isinstance(term, Variable):
+        result.add(term.identifier)
+    elif isinstance(term, UnresolvedCalculation):
+        for operand in term.stack[:2]:
+            term_variables(operand, result)
+    elif isinstance(term, Assignment):
+        term_variables(term.value, result)
+    elif isinstance(term, Statement):
+        for argument in term.arguments:
+            term_variables(argument, result)
+        for modifier in term.modifiers or []:
+            term_variables(modifier, result)
+    return result
+
+
+def split_chunks(nodes, digests):
+    """Content defined chunks, the same operands end up in the same chunks no matter what comes before them."""
+    chunk = []
+    for node, digest in zip(nodes, digests):
+        chunk.append(node)
+        if ord(digest[:1]) % CHUNK_SIZE == 0:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+class SubtreeHasher(object):
+    """Digests and free variables of AST subtrees, each computed once per node.
+
+       The reprs of the AST nodes contain every field, so they are hashed instead of building structural keys.
+       The nodes are kept alive along with their results, so ids can't be reused while the hasher exists.
+    """
+
+    def __init__(self):
+        self.digests = {}
+        self.free = {}
+
+    def digest(self, node):
+        cached = self.digests.get(id(node))
+        if cached is not None:
+            return cached[1]
+
+        if isinstance(node, Scope):
+            head = "{SCOPE: " + node.name + " - " + repr(node.arguments) + " - " + repr(node.modifiers) + "}"
+        elif isinstance(node, ForLoop):
+            head = "{FORLOOP: " + node.variable + " = " + repr(node.loop_range) + " - " + repr(node.modifiers) + "}"
+        else:
+            head = repr(node)
+
+        result = hashlib.sha1(head.encode("utf-8"))
+        for child in getattr(node, "children", []):
+            result.update(self.digest(child))
+
+        self.digests[id(node)] = (node, result.digest(), "{VARIABLE: " in head)
+        return self.digests[id(node)][1]
+
+    def free_variables(self, node):
+        """Names of the loop and assign variables the subtree uses but doesn't bind itself."""
+        cached = self.free.get(id(node))
+        if cached is not None:
+            return cached[1]
+
+        result = set()
+        if isinstance(node, Statement):
+            self.digest(node)
+            if self.digests[id(node)][2]:
+                term_variables(node, result)
+        elif isinstance(node, Scope) or isinstance(node, ForLoop):
+            inner = set()
+            for modifier in node.modifiers or []:
+                term_variables(modifier, inner)
+            for child in node.children:
+                inner |= self.free_variables(child)
+
+            if isinstance(node, ForLoop):
+                inner.discard(node.variable)
+                term_variables(node.loop_range.x, result)
+                term_variables(node.loop_range.y, result)
+            elif node.name == "assign":
+                inner -= set(assignment.identifier for assignment in node.arguments)
+                for assignment in node.arguments:
+                    term_variables(assignment, result)
+            else:
+                for argument in node.arguments:
+                    term_variables(argument, result)
+            result |= inner
+
+        result = frozenset(result)
+        self.free[id(node)] = (node, result)
+        return result
@@ -1,8 +1,114 @@
+"""Streaming SVG writer. Path data is formatted straight from the coordinate buffers of a GeometryResult and
+written out in chunks, there is no element tree in memory.
+"""
 from __future__ import print_function
+import bisect
+
+from src import vectorized, profiling
+from src.geometryresult import GeometryResult
+
+__author__ = 'sven'
+
+DEFAULT_DOCUMENT_SIZE = (1220, 610)
+DEFAULT_PRECISION = 3
+
+# characters of path data collected before they are written to the file
+CHUNK_SIZE = 1 << 20
+# coordinate values converted to python floats at once
+BLOCK_SIZE = 1 << 16
+
+HEADER = '<?xml version="1.0" encoding="utf-8" ?>\n' \
+         '<svg baseProfile="tiny" height="%(height)smm" version="1.2" viewBox="0 0 %(width)s %(height)s" ' \
+         'width="%(width)smm" xmlns="http://www.w3.org/2000/svg" xmlns:ev="http://www.w3.org/2001/xml-events" ' \
+         'xmlns:xlink="http://www.w3.org/1999/xlink"><defs />\n<g fill="none" id="geometries" stroke="black">\n'
+FOOTER = '</g>\n</svg>\n'
+
 
 class SvgGenerator(object):
-    def __init__(self):
-        pass
+    def __init__(self, size=DEFAULT_DOCUMENT_SIZE, precision=DEFAULT_PRECISION, relative=False):
+        """precision - decimals of the coordinates
+           relative - every point but the first of a path as offset to the previous one, usually shorter
+        """
+        self.size = size
+        self.precision = precision
+        self.relative = relative
+
+    @profiling.profiled("SvgGenerator.write")
+    def write(self, result, filename):
+        """Writes the outlines of a GeometryResult, or of plain shapely geometry, in the layout of the GUI export."""
+        if not isinstance(result, GeometryResult):
+            result = GeometryResult(result)
+
+        with open(filename, 'w') as f:
+            width, height = self.size
+            f.write(HEADER % {"width": width, "height": height})
+
+            chunk, length = [], 0
+            for path in self.iterate_paths(result):
+                chunk.append(path)
+                length += len(path)
+                if length >= CHUNK_SIZE:
+                    f.write("".join(chunk))
+                    chunk, length = [], 0
+
+            f.write("".join(chunk))
+            f.write(FOOTER)
+
+    def iterate_paths(self, result):
+        coordinates, offsets = result.buffers()[:2]
+        values, starts, closed = self.path_values(coordinates, offsets)
+        move, close = ("m", "z") if self.relative else ("M", "Z")
+
+        block, base, block_end = None, 0, 0
+        for i in range(len(starts) - 1):
+            if i >= block_end:
+                # the numbers are turned into python floats one block of rings at a time, not all at once
+                base = starts[i]
+                block_end = min(bisect.bisect_left(starts, base + BLOCK_SIZE, i + 1), len(starts) - 1)
+                block = values[base:starts[block_end]]
+                block = block.tolist() if vectorized.is_array(block) else block
+
+            start, end = starts[i] - base, starts[i + 1] - base
+            if closed[i]:
+                # rings repeat their first point at the end, Z closes them instead
+                end -= 2
+            if end - start < 4:
+                continue
+
+            # the values are rounded already, so their repr is the shortest form, only whole numbers end in .0
+            data = " ".join(map(repr, block[start:end])) + " "
+            yield '<path d="' + move + data.replace(".0 ", " ")[:-1] + (close if closed[i] else "") + '" />\n'
+
+    def path_values(self, coordinates, offsets):
+        """Flat list of the numbers to write, where each ring starts in it and whether it is closed.
+           Coordinates are rounded first, so relative offsets add up to exactly the rounded absolute positions.
+        """
+        if vectorized.is_array(coordinates):
+            numpy = vectorized.numpy
+            rounded = numpy.round(coordinates, self.precision)
+            firsts, lasts = offsets[:-1], offsets[1:] - 1
+            nonempty = lasts >= firsts
+            closed = numpy.zeros(len(firsts), dtype=bool)
+            closed[nonempty] = (rounded[firsts[nonempty]] == rounded[lasts[nonempty]]).all(axis=1) & \
+                               (lasts[nonempty] > firsts[nonempty])
+
+            if self.relative and len(rounded):
+                deltas = rounded.copy()
+                deltas[1:] -= rounded[:-1]
+                # the first point of every ring stays absolute
+                deltas[firsts[nonempty]] = rounded[firsts[nonempty]]
+                rounded = numpy.round(deltas, self.precision)
+            # adding zero turns -0.0 into 0.0
+            return (rounded + 0.0).ravel(), (offsets * 2).tolist(), closed.tolist()
 
-    def generate(self, ast):
-        print("test", ast)
+        values, starts, closed = [], [0], []
+        for i in range(len(offsets) - 1):
+            ring = [(round(x, self.precision) + 0.0, round(y, self.precision) + 0.0) for x, y in coordinates[offsets[i]:offsets[i + 1]]]
+            closed.append(len(ring) > 1 and ring[0] == ring[-1])
+            for j, (x, y) in enumerate(ring):
+                if self.relative and j > 0:
+                    values.extend((round(x - ring[j - 1][0], self.precision) + 0.0, round(y - ring[j - 1][1], self.precision) + 0.0))
+                else:
+                    values.extend((x, y))
+            starts.append(len(values))
+        return values, starts, closed
@@ -0,0 +1,83 @@
+"""Structured tracing for the parser.
+
+Tracing is off by default. It is switched on with enable_tracing() or by setting the
+OPENSCAD2D_TRACE environment variable (optionally to the ring buffer capacity). Trace
+events are kept in a bounded ring buffer and only formatted when asked for.
+"""
+from __future__ import print_function
+import collections
+import os
+import time
+
+TRACE_ENVIRONMENT_VARIABLE = "OPENSCAD2D_TRACE"
+DEFAULT_CAPACITY = 4096
+
+TraceEvent = collections.namedtuple("TraceEvent", ["time", "name", "location", "data"])
+
+_events = None
+
+
+def enable_tracing(capacity=DEFAULT_CAPACITY):
+    global _events
+    _events = collections.deque(maxlen=capacity)
+
+
+def disable_tracing():
+    global _events
+    _events = None
+
+
+def is_tracing_enabled():
+    return _events is not None
+
+
+def trace(name, location=None, data=None):
+    events = _events
+    if events is not None:
+        events.append(TraceEvent(time.time(), name, location, data))
+
+
+def get_trace_events():
+    return list(_events) if _events is not None else []
+
+
+def clear_trace():
+    if _events is not None:
+        _events.clear()
+
+
+def format_trace(events=None):
+    if events is None:
+        events = get_trace_events()
+
+    result = []
+    for event in events:
+        location = "" if event.location is None else "@%d" % event.location
+        result.append("%.6f %s%s: %r" % (event.time, event.name, location, event.data))
+
+    return result
+
+
+def traced(func):
+    """Wraps a pyparsing parse action so that every call and every failure is recorded."""
+    name = func.__name__
+
+    def wrapper(text, location, tokens):
+        trace(name, location, tokens)
+        try:
+            return func(text, location, tokens)
+        except Exception as ex:
+            trace(name + "_failed", location, ex)
+            raise
+
+    wrapper.__name__ = name
+    return wrapper
+
+
+def _init_from_environment():
+    value = os.environ.get(TRACE_ENVIRONMENT_VARIABLE, "")
+    if value and value != "0":
+        enable_tracing(int(value) if value.isdigit() else DEFAULT_CAPACITY)
+
+
+_init_from_environment()
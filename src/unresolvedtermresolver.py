@@ -1,54 +1,36 @@
-from src import cadfileparser
+from src import cadfileparser, profiling
 
 __author__ = 'sven'
 
 
 class UnresolvedTermResolver(object):
     def __init__(self):
-        self.assignment_stack = []
-        self.parser = cadfileparser.FcadParser(None)
+        self.scope = cadfileparser.SymbolTable()
 
-    def lookup_variable_value(self, variable):
-        value = None
+    def push_assignments(self, assignments):
+        self.scope = self.scope.create_scope()
+        for assignment in assignments:
+            self.scope.insert_loop_var(assignment.identifier, assignment.value)
+
+    def pop_assignments(self):
+        self.scope = self.scope.outer
 
-        for assignment in self.assignment_stack:
-            if assignment.identifier == variable.identifier:
-                value = assignment.value
-                break
+    def lookup_variable_value(self, variable):
+        entry = self.scope.find(variable.identifier, cadfileparser.KINDS.LOOP_VAR, None)
+        value = entry.value if entry is not None else None
 
         if value is not None:
             variable.value = value
         return value
 
-    def calculate(self, calculation):
-        calculation_stack = self.resolve_calculation(calculation)
-
-        result = self.parser.evaluateStack(calculation_stack)
-
-        if isinstance(result, cadfileparser.UnresolvedCalculation):
-            raise cadfileparser.SemanticException("Calculation stack '" + repr(calculation) + "' could not be resolved.")
+    def lookup(self, identifier):
+        entry = self.scope.find(identifier, cadfileparser.KINDS.LOOP_VAR, None)
 
-        return result
+        if entry is None or entry.value is None:
+            raise cadfileparser.SemanticException("variable '" + identifier + "' could not be resolved. Expected numerical term.")
 
-    def resolve_calculation(self, calculation):
-        result = []
-        for i in range(len(calculation.stack)):
-            term = self.resolve_calculation_term(calculation.stack[i])
-            result.append(term)
+        return entry.value
 
-        return result
-
-    def resolve_calculation_term(self, calculation):
-        if isinstance(calculation, cadfileparser.Variable):
-            value = self.lookup_variable_value(calculation)
-
-            if value is None:
-                raise cadfileparser.SemanticException("variable '" + repr(calculation) + "' could not be resolved. Expected numerical term.")
-
-            calculation = value
-        elif isinstance(calculation, list):
-            calculation = self.resolve_calculation(calculation)
-        elif isinstance(calculation, cadfileparser.UnresolvedCalculation):
-            calculation = self.calculate(calculation)
-
-        return calculation
\ No newline at end of file
+    @profiling.profiled("UnresolvedTermResolver.calculate")
+    def calculate(self, calculation):
+        return calculation.compile()(self.lookup)
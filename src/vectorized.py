@@ -0,0 +1,262 @@
+"""Array versions of the primitives and modifiers, used to generate whole loops at once.
+
+Needs numpy and shapely 2, without them is_available() is False and loops are expanded one
+iteration at a time.
+"""
+import math
+
+from shapely.strtree import STRtree
+
+try:
+    import numpy
+    import shapely
+    if int(shapely.__version__.split(".")[0]) < 2:
+        raise ImportError("shapely 2 required")
+except ImportError:
+    numpy = None
+    shapely = None
+
+__author__ = 'sven'
+
+
+def is_available():
+    return numpy is not None
+
+
+def is_array(value):
+    return numpy is not None and isinstance(value, numpy.ndarray)
+
+
+def broadcast(value, count):
+    return numpy.broadcast_to(numpy.asarray(value, dtype=float), (count,))
+
+
+def identity_matrices(count):
+    return numpy.tile(numpy.eye(3), (count, 1, 1))
+
+
+def translation_matrices(x, y, count):
+    result = identity_matrices(count)
+    result[:, 0, 2] = broadcast(x, count)
+    result[:, 1, 2] = broadcast(y, count)
+    return result
+
+
+def rotation_matrices(angle, origin_x, origin_y, use_radians, count):
+    """Same matrix as shapely.affinity.rotate around a point."""
+    angle = broadcast(angle, count)
+    if not use_radians:
+        angle = angle * math.pi / 180.0
+    cos = numpy.cos(angle)
+    sin = numpy.sin(angle)
+    # snapped like shapely does, so right angles stay exact
+    cos[numpy.abs(cos) < 2.5e-16] = 0.0
+    sin[numpy.abs(sin) < 2.5e-16] = 0.0
+    x0 = broadcast(origin_x, count)
+    y0 = broadcast(origin_y, count)
+
+    result = identity_matrices(count)
+    result[:, 0, 0] = cos
+    result[:, 0, 1] = -sin
+    result[:, 0, 2] = x0 - x0 * cos + y0 * sin
+    result[:, 1, 0] = sin
+    result[:, 1, 1] = cos
+    result[:, 1, 2] = y0 - x0 * sin - y0 * cos
+    return result
+
+
+def scale_matrices(x, y, geoms):
+    """Same matrix as shapely.affinity.scale around the center of each bounding box, geoms may also be outlines."""
+    count = len(geoms)
+    bounds = outline_bounds(geoms) if is_outlines(geoms) else shapely.bounds(geoms)
+    x = broadcast(x, count)
+    y = broadcast(y, count)
+    x0 = (bounds[:, 0] + bounds[:, 2]) / 2.0
+    y0 = (bounds[:, 1] + bounds[:, 3]) / 2.0
+
+    result = identity_matrices(count)
+    result[:, 0, 0] = x
+    result[:, 0, 2] = x0 - x0 * x
+    result[:, 1, 1] = y
+    result[:, 1, 2] = y0 - y0 * y
+    return result
+
+
+def compose(outer, inner):
+    """Matrices applying inner first and outer second, outer may also be a single matrix for all of them."""
+    return numpy.matmul(numpy.asarray(outer, dtype=float), inner)
+
+
+def transform(geoms, matrices):
+    """Applies one matrix per geometry with a single pass over all coordinates. Outlines stay outlines."""
+    if is_outlines(geoms):
+        return transform_outlines(geoms, matrices)
+    outlines = to_outlines(geoms)
+    if outlines is not None:
+        return shapely.polygons(transform_outlines(outlines, matrices))
+
+    coords, index = shapely.get_coordinates(geoms, return_index=True)
+    x = matrices[index, 0, 0] * coords[:, 0] + matrices[index, 0, 1] * coords[:, 1] + matrices[index, 0, 2]
+    y = matrices[index, 1, 0] * coords[:, 0] + matrices[index, 1, 1] * coords[:, 1] + matrices[index, 1, 2]
+    return shapely.set_coordinates(geoms, numpy.column_stack((x, y)))
+
+
+def is_outlines(value):
+    """Whether value holds outlines, the rings of polygons without holes that all have the same number of points
+       as one (count, points, 2) array. Loops build them without creating a geometry per iteration.
+    """
+    return is_array(value) and value.ndim == 3
+
+
+def to_outlines(geoms):
+    """Outlines of the geometries, None unless they are all polygons without holes and with equally long rings."""
+    if not len(geoms) or not (shapely.get_type_id(geoms) == 3).all() or shapely.get_num_interior_rings(geoms).any():
+        return None
+    sizes = shapely.get_num_coordinates(geoms)
+    if (sizes != sizes[0]).any():
+        return None
+    return shapely.get_coordinates(geoms).reshape(len(geoms), sizes[0], 2)
+
+
+def transform_outlines(outlines, matrices):
+    # the same sums as for single coordinates, so the result doesn't depend on the path taken
+    x, y = outlines[:, :, 0], outlines[:, :, 1]
+    m = matrices[:, :, :, None]
+    return numpy.stack((m[:, 0, 0] * x + m[:, 0, 1] * y + m[:, 0, 2], m[:, 1, 0] * x + m[:, 1, 1] * y + m[:, 1, 2]), axis=-1)
+
+
+def outline_bounds(outlines):
+    return numpy.column_stack((outlines.min(axis=1), outlines.max(axis=1)))
+
+
+def to_geometries(batch):
+    """Polygons of outlines, other geometry arrays are returned as they are."""
+    return shapely.polygons(batch) if is_outlines(batch) else batch
+
+
+def circle_outlines(x, y, radius, resolution, count):
+    """Outlines of count equal circles, None if the radius differs between them or they are empty."""
+    if is_array(radius):
+        return None
+    # all circles are the same, so one is buffered and its ring copied
+    template = shapely.get_coordinates(shapely.buffer(shapely.points(x, y), radius, quad_segs=resolution))
+    if len(template) == 0:
+        return None
+    return numpy.broadcast_to(template, (count,) + template.shape)
+
+
+def create_circles(x, y, radius, resolution, count):
+    outlines = circle_outlines(x, y, radius, resolution, count)
+    if outlines is not None:
+        return shapely.polygons(outlines)
+    return shapely.buffer(shapely.points(broadcast(x, count), broadcast(y, count)), radius, quad_segs=resolution)
+
+
+def create_rects(x, y, w, h, count):
+    x = broadcast(x, count)
+    y = broadcast(y, count)
+    w = broadcast(w, count)
+    h = broadcast(h, count)
+    corners = numpy.stack([numpy.column_stack(corner) for corner in ((x, y), (x, y + h), (x + w, y + h), (x + w, y))], axis=1)
+    return shapely.convex_hull(shapely.multipoints(corners))
+
+
+def root_keys():
+    return numpy.zeros(1, dtype=numpy.int64)
+
+
+def nest_bindings(bindings, outer_count, variable, start, end):
+    """Loop variable arrays for a loop running outer_count times, outer variables are repeated for each index."""
+    count = end - start
+    result = [(name, numpy.repeat(values, count)) for name, values in bindings]
+    result.append((variable, numpy.tile(numpy.arange(start, end, dtype=float), outer_count)))
+    return result
+
+
+def nest_keys(keys, count, size):
+    """Order keys of every iteration, iterations of one run follow each other in steps of the body size."""
+    return numpy.repeat(keys, count) + numpy.tile(numpy.arange(count, dtype=numpy.int64) * size, len(keys))
+
+
+def sort_by_keys(batches):
+    geoms = numpy.concatenate([geoms for geoms, keys in batches])
+    keys = numpy.concatenate([keys for geoms, keys in batches])
+    return list(geoms[numpy.argsort(keys, kind="stable")])
+
+
+def all_finite(values):
+    return all(numpy.isfinite(value).all() for value in values if is_array(value))
+
+
+def ignore_float_errors():
+    """Division by zero and friends end up as non finite values, the caller falls back to the scalar path."""
+    return numpy.errstate(all='ignore')
+
+
+def disjoint_union(elements):
+    """Union that only overlays polygons which actually touch, the others are just collected.
+
+       Returns None if some element isn't polygonal.
+    """
+    elements = numpy.asarray(elements, dtype=object)
+    if not numpy.isin(shapely.get_type_id(elements), (3, 6)).all():
+        return None
+    polygons = shapely.get_parts(elements)
+    polygons = polygons[~shapely.is_empty(polygons)]
+    if not len(polygons):
+        return None
+
+    pairs = STRtree(polygons).query(polygons, predicate="intersects")
+    pairs = pairs[:, pairs[0] < pairs[1]]
+    if pairs.shape[1] == 0:
+        return polygons[0] if len(polygons) == 1 else shapely.multipolygons(polygons)
+
+    # connected components of touching polygons, each one is overlaid on its own
+    parents = list(range(len(polygons)))
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i = parents[i]
+        return i
+
+    for i, j in pairs.T:
+        parents[find(i)] = find(j)
+
+    components = {}
+    for i in range(len(polygons)):
+        components.setdefault(find(i), []).append(polygons[i])
+
+    result = []
+    for members in components.values():
+        merged = members[0] if len(members) == 1 else shapely.union_all(members)
+        result.extend(merged.geoms if merged.geom_type == "MultiPolygon" else [merged])
+    return result[0] if len(result) == 1 else shapely.multipolygons(result)
+
+
+def punch_holes(part, holes):
+    """GeometryGenerator.punch_holes with one containment test for all holes, None if some hole doesn't qualify."""
+    holes = numpy.asarray(holes, dtype=object)
+    shapely.prepare(part)
+    if shapely.get_num_interior_rings(holes).any() or not shapely.contains_properly(part, holes).all():
+        return None
+    return shapely.polygons(part.exterior, numpy.concatenate((shapely.get_interior_ring(part, range(len(part.interiors))),
+                                                            shapely.get_exterior_ring(holes))))
+
+
+def ring_buffers(geom):
+    """Buffers of GeometryResult for polygonal geometry, None for anything else."""
+    if geom is None or geom.is_empty:
+        return numpy.zeros((0, 2)), numpy.zeros(1, dtype=numpy.int64), numpy.zeros(0, dtype=bool)
+
+    parts = shapely.get_parts(geom)
+    if not (shapely.get_type_id(parts) == 3).all():
+        return None
+
+    rings, index = shapely.get_rings(parts, return_index=True)
+    offsets = numpy.zeros(len(rings) + 1, dtype=numpy.int64)
+    numpy.cumsum(shapely.get_num_coordinates(rings), out=offsets[1:])
+    # get_rings lists the exterior of every polygon before its interiors
+    exteriors = numpy.ones(len(rings), dtype=bool)
+    exteriors[1:] = index[1:] != index[:-1]
+    return numpy.ascontiguousarray(shapely.get_coordinates(rings)), offsets, exteriors
@@ -0,0 +1,155 @@
+"""Zoom and pan of the drawing, and an index that tells which rings to draw in how much detail.
+
+Painting only touches the rings whose bounding box overlaps the visible area, each in the coarsest of
+several simplified versions that still looks the same at the current zoom. The work per repaint depends
+on what is on the screen, not on the total number of vertices.
+"""
+from __future__ import print_function
+
+from shapely.geometry import LineString, box
+from shapely.strtree import STRtree
+
+from src import vectorized
+
+__author__ = 'sven'
+
+# simplification tolerances in drawing units, level 0 is the original outline
+LEVEL_TOLERANCES = (0.0, 0.03125, 0.125, 0.5, 2.0, 8.0, 32.0)
+# a level is used while its tolerance stays below this many pixels
+MAX_ERROR_PIXELS = 0.5
+
+MIN_SCALE = 1e-3
+MAX_SCALE = 1e3
+
+
+class Viewport(object):
+    """Maps drawing coordinates to the screen, screen = drawing * scale + offset."""
+
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.scale = 1.0
+        self.offset = (0.0, 0.0)
+
+    def to_screen(self, x, y):
+        return x * self.scale + self.offset[0], y * self.scale + self.offset[1]
+
+    def to_drawing(self, x, y):
+        return (x - self.offset[0]) / self.scale, (y - self.offset[1]) / self.scale
+
+    def visible_area(self, left, top, width, height):
+        """(min x, min y, max x, max y) in drawing coordinates of a screen rectangle."""
+        x0, y0 = self.to_drawing(left, top)
+        x1, y1 = self.to_drawing(left + width, top + height)
+        return x0, y0, x1, y1
+
+    def pixel_size(self):
+        """Size of one pixel in drawing units."""
+        return 1.0 / self.scale
+
+    def zoom_at(self, x, y, factor):
+        """Zooms by factor, keeping the drawing point under the screen point x, y in place."""
+        scale = min(max(self.scale * factor, MIN_SCALE), MAX_SCALE)
+        drawing_x, drawing_y = self.to_drawing(x, y)
+        self.scale = scale
+        self.offset = (x - drawing_x * scale, y - drawing_y * scale)
+
+    def pan(self, dx, dy):
+        self.offset = (self.offset[0] + dx, self.offset[1] + dy)
+
+
+class RingIndex(object):
+    """Bounding boxes of the rings and lines of a GeometryResult, holes included, in an STRtree, and their
+       outlines in several levels of detail, each level simplified once, the first time it is needed.
+    """
+
+    def __init__(self, result):
+        self.result = result
+        coordinates, offsets = result.buffers()[:2]
+        self.levels = {}
+
+        if vectorized.is_array(coordinates):
+            numpy, shapely = vectorized.numpy, vectorized.shapely
+            self.rings = numpy.nonzero(offsets[1:] > offsets[:-1])[0]
+            starts = offsets[self.rings]
+            self.bounds = numpy.column_stack((numpy.minimum.reduceat(coordinates, starts),
+                                              numpy.maximum.reduceat(coordinates, starts))) if len(starts) else []
+            self.boxes = shapely.box(*self.bounds.T) if len(starts) else []
+            self.rings, self.bounds = self.rings.tolist(), self.bounds.tolist() if len(starts) else []
+        else:
+            self.rings = [i for i in range(len(offsets) - 1) if offsets[i + 1] > offsets[i]]
+            self.bounds = []
+            for i in self.rings:
+                xs, ys = [x for x, y in coordinates[offsets[i]:offsets[i + 1]]], [y for x, y in coordinates[offsets[i]:offsets[i + 1]]]
+                self.bounds.append((min(xs), min(ys), max(xs), max(ys)))
+            self.boxes = [box(*bounds) for bounds in self.bounds]
+
+        self.tree = STRtree(self.boxes) if len(self.boxes) else None
+
+    def __len__(self):
+        return len(self.rings)
+
+    def visible(self, area):
+        """Positions in self.rings of the rings whose bounding box overlaps area, in drawing order."""
+        if self.tree is None:
+            return []
+        x0, y0, x1, y1 = area
+        hits = self.tree.query(box(min(x0, x1), min(y0, y1), max(x0, x1), max(y0, y1)))
+        # shapely 2 returns indices, older versions the geometries themselves
+        if len(hits) and not hasattr(hits[0], "geom_type"):
+            return sorted(int(hit) for hit in hits)
+        positions = dict((id(box), position) for position, box in enumerate(self.boxes))
+        return sorted(positions[id(hit)] for hit in hits)
+
+    def level_for(self, pixel_size):
+        """The coarsest level whose simplification stays invisible at the given pixel size."""
+        level = 0
+        for i, tolerance in enumerate(LEVEL_TOLERANCES):
+            if tolerance <= MAX_ERROR_PIXELS * pixel_size:
+                level = i
+        return level
+
+    def is_tiny(self, position, pixel_size):
+        """Whether the ring fits into a single pixel."""
+        x0, y0, x1, y1 = self.bounds[position]
+        return max(x1 - x0, y1 - y0) < pixel_size
+
+    def outline(self, level, position):
+        """Points of the ring at position in the given level of detail."""
+        values, starts = self.level(level)
+        start, end = 2 * starts[position], 2 * starts[position + 1]
+        return list(zip(values[start:end:2], values[start + 1:end:2]))
+
+    def level(self, level):
+        if level not in self.levels:
+            self.levels[level] = self.simplify(LEVEL_TOLERANCES[level])
+        return self.levels[level]
+
+    def simplify(self, tolerance):
+        """Flat coordinate values of the drawn rings simplified with tolerance, and where each ring starts."""
+        coordinates, offsets = self.result.buffers()[:2]
+        if not vectorized.is_array(coordinates):
+            rings = [list(coordinates[offsets[i]:offsets[i + 1]]) for i in self.rings]
+            if tolerance > 0.0:
+                rings = [list(LineString(ring).simplify(tolerance, preserve_topology=False).coords) if len(ring) > 2
+                         else ring for ring in rings]
+            starts = [0]
+            for ring in rings:
+                starts.append(starts[-1] + len(ring))
+            return [value for ring in rings for point in ring for value in point[:2]], starts
+
+        # all rings of the level in one go
+        numpy, shapely = vectorized.numpy, vectorized.shapely
+        rings = numpy.array(self.rings, dtype=numpy.int64)
+        sizes = offsets[rings + 1] - offsets[rings]
+        indices = numpy.repeat(offsets[rings] - numpy.cumsum(sizes) + sizes, sizes) + numpy.arange(sizes.sum())
+        points = coordinates[indices]
+        if tolerance == 0.0:
+            starts = numpy.concatenate(([0], numpy.cumsum(sizes)))
+        else:
+            lines = shapely.linestrings(points, indices=numpy.repeat(numpy.arange(len(rings)), sizes))
+            points, index = shapely.get_coordinates(shapely.simplify(lines, tolerance, preserve_topology=False),
+                                                    return_index=True)
+            starts = numpy.searchsorted(index, numpy.arange(len(rings) + 1))
+        return points.ravel().tolist(), starts.tolist()
@@ -1,4 +1,21 @@
 from test.test_fcadParser import *
+from test.test_affineMatrix import *
+from test.test_batch import *
+from test.test_astOptimizer import *
+from test.test_diskCache import *
+from test.test_documentWatcher import *
+from test.test_dxfGenerator import *
+from test.test_geometryResult import *
+from test.test_primitiveCache import *
+from test.test_printCaptureContext import *
+from test.test_profiling import *
+from test.test_renderScheduler import *
+from test.test_subtreeCache import *
+from test.test_svgGenerator import *
+from test.test_tracing import *
+from test.test_unresolvedTermResolver import *
+from test.test_vectorized import *
+from test.test_viewport import *
 import sys
 
 if __name__ == '__main__':
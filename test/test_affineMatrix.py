@@ -0,0 +1,46 @@
+from __future__ import print_function
+
+from shapely import affinity
+from shapely.geometry import Point, Polygon
+
+from src import affinematrix
+
+import unittest
+
+
+class TestAffineMatrix(unittest.TestCase):
+    def assertSameCoordinates(self, geom, expected):
+        for a, b in zip(geom.exterior.coords, expected.exterior.coords):
+            self.assertAlmostEqual(a[0], b[0], places=9)
+            self.assertAlmostEqual(a[1], b[1], places=9)
+
+    def test_composition(self):
+        geom = Polygon([(0, 0), (0, 2), (3, 2), (3, 0)])
+        expected = affinity.rotate(affinity.translate(geom, 5, -1), 30, Point(1, 2))
+        expected = affinity.rotate(affinity.translate(expected, 2, 2), 1.2, Point(0, 0), True)
+
+        matrix = affinematrix.IDENTITY
+        for step in (affinematrix.translation(5, -1), affinematrix.rotation(30, 1, 2),
+                     affinematrix.translation(2, 2), affinematrix.rotation(1.2, 0, 0, True)):
+            matrix = affinematrix.multiply(step, matrix)
+
+        self.assertSameCoordinates(affinematrix.transform(geom, matrix), expected)
+        self.assertFalse(affinematrix.is_axis_aligned(matrix))
+
+    def test_right_angle(self):
+        matrix = affinematrix.rotation(90, 0, 0)
+        self.assertEqual(affinematrix.transform_point(matrix, 1, 0), (0.0, 1.0))
+        self.assertTrue(affinematrix.is_axis_aligned(affinematrix.multiply(matrix, matrix)))
+
+    def test_scaling(self):
+        geom = Point(3, 4).buffer(2, 4)
+        matrix = affinematrix.translation(10, 0)
+        x, y = affinematrix.transform_point(matrix, 3, 4)
+        matrix = affinematrix.multiply(affinematrix.scaling(2, 0.5, x, y), matrix)
+
+        self.assertSameCoordinates(affinematrix.transform(geom, matrix), affinity.scale(affinity.translate(geom, 10, 0), 2, 0.5))
+        self.assertTrue(affinematrix.transform(geom, affinematrix.IDENTITY) is geom)
+
+
+if __name__ == '__main__':
+    unittest.main()
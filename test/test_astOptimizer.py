@@ -0,0 +1,129 @@
+from __future__ import print_function
+import os
+
+from src.astoptimizer import AstOptimizer, structural_key
+from src.cadfileparser import FcadParser, Statement, Scope, ForLoop, Assignment, UnresolvedCalculation, Variable, \
+    StatementType, get_backend, ParseContext, ParserBackend
+from src.unresolvedtermresolver import UnresolvedTermResolver
+
+import unittest
+
+file_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+def resolve_value(resolver, value):
+    if isinstance(value, UnresolvedCalculation):
+        return resolver.calculate(value)
+    elif isinstance(value, Variable):
+        return resolver.lookup(value.identifier)
+    return value
+
+
+def resolve_primitives(nodes, resolver=None, path=()):
+    """Lists every primitive with its resolved arguments the way the geometry generator would see them."""
+    resolver = resolver or UnresolvedTermResolver()
+    result = []
+
+    for node in nodes:
+        if isinstance(node, Statement):
+            arguments = [(a.identifier, resolve_value(resolver, a.value)) if hasattr(a, 'identifier') else resolve_value(resolver, a)
+                         for a in node.arguments]
+            modifiers = [(m.name, [resolve_value(resolver, a) for a in m.arguments]) for m in node.modifiers or []]
+            result.append((path, node.name, arguments, modifiers))
+        elif isinstance(node, ForLoop):
+            for i in node.indices(resolve_value(resolver, node.loop_range.x), resolve_value(resolver, node.loop_range.y)):
+                resolver.push_assignments([Assignment(node.variable, i)])
+                result.extend(resolve_primitives(node.children, resolver, path + (("for", repr(node.modifiers)),)))
+                resolver.pop_assignments()
+        elif node.name == "assign":
+            resolver.push_assignments(node.arguments)
+            result.extend(resolve_primitives(node.children, resolver, path))
+            resolver.pop_assignments()
+        else:
+            result.extend(resolve_primitives(node.children, resolver, path + (node.name,)))
+
+    return result
+
+
+def contains_calculation(node):
+    if isinstance(node, (UnresolvedCalculation, Variable)):
+        return True
+    elif isinstance(node, Statement):
+        return contains_calculation(node.arguments) or contains_calculation(node.modifiers or [])
+    elif isinstance(node, (Scope, ForLoop)):
+        return contains_calculation(getattr(node, 'arguments', [])) or contains_calculation(node.children)
+    elif isinstance(node, list):
+        return any(contains_calculation(child) for child in node)
+    elif hasattr(node, 'value'):
+        return contains_calculation(node.value)
+    return False
+
+
+class TestAstOptimizer(unittest.TestCase):
+    def parse(self, source):
+        return get_backend(ParserBackend.RecursiveDescent).parse_string(source, ParseContext())
+
+    def test_loop_folding(self):
+        parser = FcadParser(os.path.abspath(file_dir + '/../test/data/complex_example.fcad'))
+        ast, error = parser.parse()
+        if error:
+            self.fail(error)
+        before = repr(ast)
+
+        optimizer = AstOptimizer(parser.symtab)
+        result = optimizer.optimize(ast)
+
+        self.assertEqual(repr(ast), before)
+        self.assertEqual(resolve_primitives(result), resolve_primitives(ast))
+        self.assertTrue(isinstance(result[0].children[1].children[0], ForLoop), "loop was unrolled")
+        self.assertEqual(len(resolve_primitives(result)), 10)
+
+    def test_loop_invariant(self):
+        ast = self.parse("""
+            union() { for (k = [0:2]) { translate(x * 2 + k, 0) circle(x + 1); } }
+            for (i = [0:0]) { circle(1); }
+        """)
+        scope = Scope("assign", [Assignment("x", 4)], ast, [])
+        optimizer = AstOptimizer()
+        result = optimizer.optimize([scope])
+
+        loop = result[0].children[0]
+        self.assertEqual(len(result), 1)
+        self.assertEqual(loop.children[0].arguments, [5])
+        self.assertEqual(loop.children[0].modifiers[0].arguments[1], 0)
+        self.assertTrue(contains_calculation(loop.children[0].modifiers[0].arguments))
+        self.assertEqual(resolve_primitives(result), resolve_primitives([scope]))
+        self.assertEqual(optimizer.report.hoisted, 2)
+        self.assertEqual(optimizer.report.flattened, 2)
+
+    def test_nested_loop_variable(self):
+        ast = self.parse("for (i = [0:3]) { for (j = [0:i]) { translate(i * 10 + j, i * i) circle(r=j + 1); } }")
+        result = AstOptimizer().optimize(ast)
+
+        self.assertEqual(resolve_primitives(result), resolve_primitives(ast))
+        self.assertEqual(len(resolve_primitives(ast)), 3)
+
+    def test_deduplicate(self):
+        ast = self.parse("""
+            union() { circle(1); circle(1); translate(1, 0) circle(1); for (i = [0:3]) { rect(2, 2); } }
+            difference() { circle(1); circle(1); rect(1, 1); rect(1, 1); }
+        """)
+        optimizer = AstOptimizer()
+        union, difference = optimizer.optimize(ast)
+
+        self.assertEqual([structural_key(child) for child in union.children],
+                         [structural_key(child) for child in (ast[0].children[0], ast[0].children[2], ast[0].children[3])])
+        self.assertEqual(len(difference.children), 3)
+        self.assertEqual(optimizer.report.duplicates, 2)
+
+    def test_globals(self):
+        parser = FcadParser(os.path.abspath(file_dir + '/../test/data/simple_calculation.fcad'))
+        parser.parse()
+        ast = [Statement(StatementType.Primitive, "circle", [UnresolvedCalculation([Variable("myGreatCalculation"), 2, "*"])], [])]
+
+        result = AstOptimizer(parser.symtab).optimize(ast)
+        self.assertEqual(result[0].arguments, [6])
+
+
+if __name__ == '__main__':
+    unittest.main()
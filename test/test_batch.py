@@ -0,0 +1,105 @@
+from __future__ import print_function
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from shapely.geometry import Polygon
+
+from src import batch
+from src.cadfileparser import FcadParser
+from src.geometrygenerator import GeometryGenerator
+from test.test_dxfGenerator import ezdxf, ring_area
+
+import unittest
+
+file_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+class TestBatch(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+
+    def tearDown(self):
+        sys.stdout.close()
+        sys.stdout = self.stdout
+        shutil.rmtree(self.directory)
+
+    def test_find_inputs(self):
+        data = os.path.join(file_dir, "data")
+        filenames = batch.find_inputs([data, os.path.join(data, "rect.fcad"), os.path.join(data, "loop*")])
+
+        self.assertEqual(len(filenames), len([name for name in os.listdir(data) if name.endswith(".fcad")]))
+        self.assertTrue(filenames.index(os.path.join(data, "rect.fcad")) > 0)
+
+    def test_render(self):
+        inputs = [os.path.join(file_dir, "data", name) for name in ("difference.fcad", "loop.fcad", "simple_use.fcad")]
+        summary = os.path.join(self.directory, "summary.json")
+
+        for workers in ("1", "2"):
+            output = os.path.join(self.directory, "out" + workers)
+            result = batch.main(inputs + ["-o", output, "-f", "svg", "-f", "dxf", "-j", workers, "--summary", summary])
+            self.assertEqual(result, 1)
+
+            with open(summary) as f:
+                files = json.load(f)["files"]
+            self.assertEqual([entry["file"] for entry in files], inputs)
+            self.assertEqual([entry["error"] is None for entry in files], [True, True, False])
+
+            self.assertEqual(sorted(os.listdir(output)), ["difference.dxf", "difference.svg", "loop.dxf", "loop.svg"])
+            with open(os.path.join(output, "loop.dxf")) as f:
+                self.assertEqual(f.read().count("POLYLINE"), 10)
+
+        self.assertTrue("PySide" not in sys.modules)
+
+    def test_output_collisions(self):
+        inputs = []
+        for name in ("a", "b"):
+            os.mkdir(os.path.join(self.directory, name))
+            inputs.append(os.path.join(self.directory, name, "part.fcad"))
+            shutil.copy(os.path.join(file_dir, "data", "rect.fcad"), inputs[-1])
+
+        output = os.path.join(self.directory, "out")
+        self.assertEqual(batch.find_collisions(inputs, output, ["svg", "dxf"]),
+                         [os.path.join(output, "part.dxf"), os.path.join(output, "part.svg")])
+        self.assertEqual(batch.find_collisions(inputs, None, ["svg"]), [])
+
+        stderr = sys.stderr
+        sys.stderr = sys.stdout
+        try:
+            self.assertRaises(SystemExit, batch.main, inputs + ["-o", output, "-j", "1"])
+        finally:
+            sys.stderr = stderr
+        self.assertFalse(os.path.exists(output))
+
+        # without -o every file is written next to its input
+        self.assertEqual(batch.main(inputs + ["-j", "1"]), 0)
+        self.assertTrue(os.path.isfile(os.path.join(self.directory, "a", "part.svg")))
+
+    @unittest.skipUnless(ezdxf is not None, "needs ezdxf")
+    def test_dxf_read_back(self):
+        filename = os.path.join(file_dir, "data", "loop.fcad")
+        ast, error = FcadParser(filename).parse()
+        geometry = GeometryGenerator(*batch.SCREEN_SIZE).generate_geometry(ast)
+        expected = sorted(Polygon(ring).area for polygon in geometry.geoms
+                          for ring in [polygon.exterior] + list(polygon.interiors))
+
+        for options in ([], ["--circles"]):
+            output = os.path.join(self.directory, "circles" if options else "polylines")
+            self.assertEqual(batch.main([filename, "-o", output, "-f", "dxf", "-j", "1"] + options), 0)
+
+            document = ezdxf.readfile(os.path.join(output, "loop.dxf"))
+            self.assertEqual(document.audit().errors, [])
+            areas = sorted(ring_area([(vertex.dxf.location[0], vertex.dxf.location[1]) for vertex in entity.vertices],
+                                     [vertex.dxf.bulge for vertex in entity.vertices])
+                           for entity in document.modelspace().query("POLYLINE"))
+            self.assertEqual(len(areas), len(expected))
+            for area, polygon_area in zip(areas, expected):
+                self.assertTrue(abs(area - polygon_area) < 0.005 * polygon_area, (area, polygon_area))
+
+
+if __name__ == '__main__':
+    unittest.main()
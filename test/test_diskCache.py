@@ -0,0 +1,141 @@
+from __future__ import print_function
+import multiprocessing
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+
+from shapely.geometry import Point
+
+from src.cadfileparser import FcadParser, ParserBackend, parse_result_to_plain, parse_result_from_plain
+from src.diskcache import DiskCache
+from src.subtreecache import SubtreeCache
+
+import unittest
+
+file_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+def write_entries(path, worker):
+    cache = DiskCache(path)
+    for i in range(50):
+        cache.store_geometry(cache.key("entry", worker, i), Point(worker, i).buffer(1))
+    cache.close()
+
+
+class TestDiskCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, "cache", "cache.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_geometry(self):
+        cache = DiskCache(self.path)
+        geom = Point(1.5, 2.25).buffer(3).difference(Point(1.5, 2.25).buffer(1))
+        cache.store_geometry(cache.key("a"), geom)
+
+        loaded = DiskCache(self.path).load_geometry(cache.key("a"))
+        self.assertEqual(list(loaded.exterior.coords), list(geom.exterior.coords))
+        self.assertEqual(len(loaded.interiors), 1)
+        self.assertIsNone(cache.load_geometry(cache.key("b")))
+
+    def test_eviction(self):
+        cache = DiskCache(self.path, max_size=10000)
+        for i in range(20):
+            cache.store(cache.key(i), b"x" * 1000)
+
+        # the oldest entries went first and the cache shrank below its size
+        self.assertLessEqual(cache.size(), 10000)
+        self.assertIsNone(cache.load(cache.key(0)))
+        self.assertIsNotNone(cache.load(cache.key(19)))
+        self.assertEqual(cache.size(), 1000 * len(cache))
+
+    def test_clear(self):
+        cache = DiskCache(self.path)
+        cache.store(cache.key("a"), b"data")
+
+        # a new cache connects on its first use, clear() included
+        cleared = DiskCache(self.path)
+        cleared.clear()
+        self.assertEqual(len(cleared), 0)
+        self.assertEqual(cleared.size(), 0)
+
+        # as if forked, the child process opens a connection of its own, and so does every thread
+        connection = cleared.connection
+        cleared._local.pid = -1
+        with cleared.transaction():
+            pass
+        self.assertFalse(cleared.connection is connection)
+
+        sizes = []
+        thread = threading.Thread(target=lambda: sizes.append(cleared.size()))
+        thread.start()
+        thread.join()
+        self.assertEqual(sizes, [0])
+
+    def test_concurrent_writers(self):
+        DiskCache(self.path).close()
+        workers = [multiprocessing.Process(target=write_entries, args=(self.path, worker)) for worker in range(4)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+            self.assertEqual(worker.exitcode, 0)
+
+        cache = DiskCache(self.path)
+        self.assertEqual(len(cache), 4 * 50)
+        self.assertAlmostEqual(cache.load_geometry(cache.key("entry", 3, 49)).centroid.y, 49)
+
+    def test_subtree_cache(self):
+        created = []
+
+        def create():
+            created.append(1)
+            return Point(0, 0).buffer(5)
+
+        SubtreeCache(16, DiskCache(self.path)).get(("scope", 1), create)
+        # a new process only has the disk cache
+        geom = SubtreeCache(16, DiskCache(self.path)).get(("scope", 1), create)
+        self.assertEqual(len(created), 1)
+        self.assertAlmostEqual(geom.area, Point(0, 0).buffer(5).area)
+
+    def test_parse_result(self):
+        filename = os.path.join(file_dir, "data", "complex_example.fcad")
+        expected, error = FcadParser(filename, ParserBackend.RecursiveDescent).parse()
+
+        cache = DiskCache(self.path)
+        for i in range(2):
+            parser = FcadParser(filename, ParserBackend.RecursiveDescent, disk_cache=cache)
+            result, error = parser.parse()
+            self.assertIsNone(error)
+            self.assertEqual(repr(result), repr(expected))
+
+        self.assertEqual((cache.hits, cache.misses), (1, 1))
+
+        # entries that aren't plain data, like the pickles of older versions, are parsed again and replaced
+        key = cache.key("ast", ParserBackend.RecursiveDescent, "pickled")
+        cache.store(key, pickle.dumps(expected, 2))
+        self.assertIsNone(cache.load_data(key))
+        cache.store_data(key, ["list", ["os.system", "echo"]])
+        self.assertRaises(ValueError, parse_result_from_plain, cache.load_data(key))
+
+    def test_plain_parse_result(self):
+        path = os.path.join(file_dir, "data")
+        for name in sorted(os.listdir(path)):
+            for backend in (ParserBackend.PyParsing, ParserBackend.RecursiveDescent):
+                parser = FcadParser(os.path.join(path, name), backend)
+                expected, error = parser.parse()
+                result, symtab = parse_result_from_plain(parse_result_to_plain(expected, parser.symtab))
+
+                self.assertEqual(repr(result), repr(expected), name)
+                self.assertEqual([(entry.name, entry.kind, entry.parent, repr(entry.value), entry.parameters)
+                                  for entry in symtab.table],
+                                 [(entry.name, entry.kind, entry.parent, repr(entry.value), entry.parameters)
+                                  for entry in parser.symtab.table], name)
+
+
+if __name__ == '__main__':
+    unittest.main()
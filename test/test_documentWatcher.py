@@ -0,0 +1,70 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import time
+
+from src.documentwatcher import DocumentWatcher, Inotify
+
+import unittest
+
+
+class TestDocumentWatcher(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = self.write("main.fcad", "circle(1);")
+        self.count = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def write(self, name, content):
+        filename = os.path.join(self.directory, name)
+        with open(filename, "w") as f:
+            f.write(content)
+        return filename
+
+    def changed(self):
+        self.count += 1
+
+    def wait_for(self, count, timeout=5):
+        end = time.time() + timeout
+        while self.count < count and time.time() < end:
+            time.sleep(0.01)
+        # a bit longer, so extra calls would show up as well
+        time.sleep(0.2)
+        return self.count
+
+    def check_watcher(self, polling):
+        watcher = DocumentWatcher(self.filename, self.changed, polling=polling, interval=0.05)
+        watcher.monitor()
+        try:
+            self.write("main.fcad", "circle(2);")
+            self.assertEqual(self.wait_for(1), 1)
+
+            # neither the same content nor other files in the directory count
+            self.write("main.fcad", "circle(2);")
+            self.write("other.fcad", "circle(3);")
+
+            # editors saving through a temporary file that replaces the document
+            os.rename(self.write("main.fcad.tmp", "circle(4);"), self.filename)
+            self.assertEqual(self.wait_for(2), 2)
+
+            used = self.write("used.fcad", "x = 1;")
+            watcher.set_documents([self.filename, used])
+            self.write("used.fcad", "x = 2;")
+            self.assertEqual(self.wait_for(3), 3)
+        finally:
+            watcher.stop_monitor()
+        self.assertEqual(watcher.thread, None)
+
+    def test_polling(self):
+        self.check_watcher(True)
+
+    @unittest.skipUnless(Inotify.is_available(), "needs inotify")
+    def test_inotify(self):
+        self.check_watcher(False)
+
+
+if __name__ == '__main__':
+    unittest.main()
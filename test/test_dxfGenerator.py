@@ -0,0 +1,169 @@
+from __future__ import print_function
+import math
+import os
+import shutil
+import tempfile
+
+from shapely.geometry import Point, Polygon, LineString, GeometryCollection, box
+
+from src import vectorized
+from src.dxfgenerator import DxfGenerator
+
+import unittest
+
+try:
+    import ezdxf
+except ImportError:
+    ezdxf = None
+
+
+def read_entities(filename):
+    """Entities of the ENTITIES section as (type, [(code, value), ...]). The VERTEX entities of a POLYLINE
+       are part of it, each starting with ("0", "VERTEX"), its SEQEND is left out.
+    """
+    with open(filename) as f:
+        lines = f.read().split("\n")
+    pairs = list(zip(lines[0::2], lines[1::2]))
+    start = pairs.index(("2", "ENTITIES")) + 1
+    end = pairs.index(("0", "ENDSEC"), start)
+
+    entities = []
+    for code, value in pairs[start:end]:
+        if (code, value) == ("0", "VERTEX"):
+            entities[-1][1].append((code, value))
+        elif code == "0":
+            entities.append((value, []))
+        else:
+            entities[-1][1].append((code, value))
+    return [entity for entity in entities if entity[0] != "SEQEND"]
+
+
+def ring_area(points, bulges):
+    """Area enclosed by a polyline whose segments may be arcs, counterclockwise positive."""
+    area = 0.0
+    for (x0, y0), (x1, y1), bulge in zip(points, points[1:] + points[:1], bulges):
+        area += (x0 * y1 - x1 * y0) / 2.0
+        if bulge:
+            # the circular segment between the chord and the arc, on the left of the chord for positive bulges
+            angle = 4.0 * math.atan(abs(bulge))
+            radius = math.hypot(x1 - x0, y1 - y0) / (2.0 * math.sin(angle / 2.0))
+            area += math.copysign(radius ** 2 / 2.0 * (angle - math.sin(angle)), bulge)
+    return abs(area)
+
+
+def vertices(groups):
+    """(x, y, bulge) of every vertex of a POLYLINE."""
+    result = []
+    for code, value in groups:
+        if (code, value) == ("0", "VERTEX"):
+            result.append([None, None, 0.0])
+        elif not result:
+            # the groups of the POLYLINE itself
+            continue
+        elif code == "10":
+            result[-1][0] = float(value)
+        elif code == "20":
+            result[-1][1] = float(value)
+        elif code == "42":
+            result[-1][2] = float(value)
+    return [tuple(vertex) for vertex in result]
+
+
+class TestDxfGenerator(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "out.dxf")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_polylines(self):
+        DxfGenerator().write(GeometryCollection([box(0, 0, 10, 5), LineString([(0, 0), (1, 2)])]), self.filename)
+        entities = read_entities(self.filename)
+
+        self.assertEqual([entity for entity, groups in entities], ["POLYLINE", "POLYLINE"])
+        self.assertEqual(dict(entities[0][1])["70"], "1")
+        self.assertEqual(dict(entities[1][1])["70"], "0")
+        # the y axis is flipped, the closing point of the rectangle is left to the closed flag
+        self.assertEqual(vertices(entities[0][1]), [(10, 0, 0), (10, -5, 0), (0, -5, 0), (0, 0, 0)])
+        self.assertEqual(vertices(entities[1][1]), [(0, 0, 0), (1, -2, 0)])
+
+    @unittest.skipUnless(vectorized.is_available(), "needs numpy and shapely 2")
+    def test_circles(self):
+        holes = [Point(10 + i * 20, 10).buffer(4, 16) for i in range(5)]
+        panel = Polygon([(0, 0), (100, 0), (100, 20), (0, 20)], [hole.exterior.coords for hole in holes])
+        DxfGenerator(circles=True).write(panel, self.filename)
+        entities = read_entities(self.filename)
+
+        self.assertEqual([entity for entity, groups in entities], ["POLYLINE"] + ["CIRCLE"] * 5)
+        self.assertEqual(len(vertices(entities[0][1])), 4)
+        for i, (entity, groups) in enumerate(entities[1:]):
+            values = dict((code, float(value)) for code, value in groups if code != "8")
+            self.assertAlmostEqual(values["10"], 10 + i * 20)
+            self.assertAlmostEqual(values["20"], -10)
+            self.assertAlmostEqual(values["40"], 4)
+
+        # without circles every ring stays a polyline
+        DxfGenerator().write(panel, self.filename)
+        self.assertEqual([entity for entity, groups in read_entities(self.filename)], ["POLYLINE"] * 6)
+
+    @unittest.skipUnless(vectorized.is_available(), "needs numpy and shapely 2")
+    def test_arcs(self):
+        notched = box(0, 0, 20, 10).difference(Point(20, 5).buffer(3, 16))
+        rounded = box(0, 0, 20, 10).union(Point(20, 5).buffer(5, 16))
+        lens = Point(0, 0).buffer(5, 16).union(Point(6, 0).buffer(5, 16))
+        DxfGenerator(circles=True).write(GeometryCollection([notched, rounded, lens]), self.filename)
+        entities = read_entities(self.filename)
+
+        # a half circle cut out clockwise, one added counterclockwise
+        notch = vertices(entities[0][1])
+        self.assertEqual(len(notch), 6)
+        self.assertEqual(notch[0][:2], (20, -8))
+        self.assertAlmostEqual(notch[0][2], -1)
+        self.assertEqual(notch[1], (20, -2, 0))
+
+        bulge = vertices(entities[1][1])
+        self.assertEqual(len(bulge), 4)
+        self.assertEqual(bulge[0][:2], (20, -10))
+        self.assertAlmostEqual(bulge[0][2], 1)
+
+        # the outer arcs of the overlapping circles end at their last points before the intersections,
+        # 360 - 2 * 56.25 degrees with 16 segments per quarter
+        arcs = [vertex for vertex in vertices(entities[2][1]) if vertex[2]]
+        self.assertEqual(len(arcs), 2)
+        for arc in arcs:
+            self.assertAlmostEqual(math.degrees(4 * math.atan(arc[2])), 247.5)
+
+    @unittest.skipUnless(ezdxf is not None, "needs ezdxf")
+    def test_read_back(self):
+        panel = Polygon([(0, 0), (100, 0), (100, 20), (0, 20)],
+                        [Point(10 + i * 20, 10).buffer(4, 16).exterior.coords for i in range(5)])
+        notched = box(0, 200, 20, 210).difference(Point(20, 205).buffer(3, 16))
+        lens = Point(0, 100).buffer(5, 16).union(Point(6, 100).buffer(5, 16))
+        geometry = GeometryCollection([panel, notched, lens])
+        expected = sorted(Polygon(ring).area for polygon in geometry.geoms
+                          for ring in [polygon.exterior] + list(polygon.interiors))
+
+        for circles in (False, True):
+            DxfGenerator(circles=circles).write(geometry, self.filename)
+            document = ezdxf.readfile(self.filename)
+            self.assertEqual(document.audit().errors, [])
+
+            areas = []
+            for entity in document.modelspace():
+                if entity.dxftype() == "CIRCLE":
+                    areas.append(math.pi * entity.dxf.radius ** 2)
+                else:
+                    self.assertEqual(entity.dxftype(), "POLYLINE")
+                    self.assertTrue(entity.is_closed)
+                    points = [(vertex.dxf.location[0], vertex.dxf.location[1]) for vertex in entity.vertices]
+                    areas.append(ring_area(points, [vertex.dxf.bulge for vertex in entity.vertices]))
+
+            # circles and arcs differ a little from the points approximating them
+            self.assertEqual(len(areas), len(expected))
+            for area, polygon_area in zip(sorted(areas), expected):
+                self.assertTrue(abs(area - polygon_area) < 0.005 * polygon_area, (area, polygon_area))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,12 +1,31 @@
 from __future__ import print_function
 import os
 
-from src.cadfileparser import FcadParser, StatementType, Assignment
+from src.cadfileparser import FcadParser, StatementType, Assignment, ParserBackend, SymbolTable, SemanticException, KINDS, \
+    enable_packrat, ForLoop, ParseContext, get_backend, StatementCache, split_statements, \
+    used_files
 
+import shutil
+import tempfile
+import threading
 import unittest
 
+from pyparsing import ParserElement
+
 file_dir = os.path.dirname(os.path.realpath(__file__))
 
+
+def packrat_state():
+    """What ParserElement.enablePackrat changes, it has no counterpart to switch packrat off again."""
+    return dict((name, ParserElement.__dict__[name]) for name in ("_packratEnabled", "packrat_cache", "_parse"))
+
+
+def restore_packrat_state(state):
+    for name, value in state.items():
+        setattr(ParserElement, name, value)
+    ParserElement.resetCache()
+
+
 class TestFcadParser(unittest.TestCase):
     def test_primitive_assignment(self):
         filename = os.path.abspath(file_dir + '/../test/data/primitive.fcad')
@@ -29,6 +48,166 @@ class TestFcadParser(unittest.TestCase):
         self.assertTrue(result[1].name == 'circle', "unexpected token name '" + result[1].name + "'")
         self.assertTrue(result[1].arguments[0] == 2, "unexpected argument value '" + str(result[1].arguments[0]) + "'")
 
+    def test_shared_grammar(self):
+        filename = os.path.abspath(file_dir + '/../test/data/simple_assign.fcad')
+        first = FcadParser(filename)
+        second = FcadParser(filename)
+        self.assertTrue(first.backend is second.backend, "grammar is rebuilt for every parser")
+
+        for parser in (first, second, first):
+            result, error = parser.parse()
+            if error:
+                self.fail(error)
+            self.assertTrue(parser.symtab.get_value('var1', 'GLOBAL_VAR', None) == 5)
+
+    def test_concurrent_parse(self):
+        filenames = [os.path.abspath(file_dir + '/../test/data/' + name) for name in ('complex_example.fcad', 'variable_assign.fcad', 'loop.fcad')]
+        expected = dict((filename, repr(FcadParser(filename).parse())) for filename in filenames)
+        results = []
+
+        def worker(filename):
+            for i in range(5):
+                results.append((filename, repr(FcadParser(filename).parse())))
+
+        threads = [threading.Thread(target=worker, args=(filename,)) for filename in filenames]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertTrue(len(results) == 15)
+        for filename, result in results:
+            self.assertTrue(result == expected[filename], "concurrent parse of '" + filename + "' differs")
+
+    def test_parenthesized_calculation(self):
+        filename = os.path.abspath(file_dir + '/../test/data/math.fcad')
+        parser = FcadParser(filename)
+
+        result, error = parser.parse()
+        if error:
+            self.fail(error)
+
+        expected = {'prio1': 10, 'prio2': 1, 'prio3': 0, 'mult_prio': 30, 'division3': 2.5, 'division4': 1.6}
+        for name, value in expected.items():
+            actual = parser.symtab.get_value(name, 'GLOBAL_VAR', None)
+            self.assertAlmostEqual(actual, value, msg="unexpected value '" + str(actual) + "' of '" + name + "'")
+
+    def test_packrat(self):
+        path = file_dir + '/../test/data/'
+        filenames = [os.path.abspath(path + file) for file in sorted(os.listdir(path))]
+        expected = [repr(FcadParser(filename).parse()) for filename in filenames]
+
+        # the tests after this one parse without packrat again
+        self.addCleanup(restore_packrat_state, packrat_state())
+        enable_packrat()
+        self.assertTrue(ParserElement._packratEnabled)
+
+        for filename, before in zip(filenames, expected):
+            self.assertTrue(repr(FcadParser(filename).parse()) == before, "packrat parse of '" + filename + "' differs")
+
+    def test_lazy_for_loop(self):
+        source = "n = 100000; translate(1, 2) for (i = [0:n]) { for (j = [i:i + 3]) { circle(r=j); } }"
+
+        for backend in (ParserBackend.PyParsing, ParserBackend.RecursiveDescent):
+            result = get_backend(backend).parse_string(source, ParseContext())
+
+            self.assertEqual(len(result), 1)
+            self.assertTrue(isinstance(result[0], ForLoop))
+            self.assertEqual(result[0].variable, "i")
+            self.assertEqual(result[0].modifiers[0].name, "translate")
+            self.assertEqual(len(result[0].indices()), 100000)
+            self.assertTrue(isinstance(result[0].children[0], ForLoop))
+            self.assertEqual(list(result[0].children[0].indices(5, 8)), [5, 6, 7])
+
+    def test_split_statements(self):
+        source = "use lib; a = 1; // comment\n translate(a, 2) union() { circle(r=a); rect(1, [2]); } for (i = [0:3]) { circle(i); }"
+        statements = [source[start:end] for start, end in split_statements(source)]
+
+        self.assertEqual(statements, ["use lib; a = 1;", "translate(a, 2) union() { circle(r=a); rect(1, [2]); }",
+                                      "for (i = [0:3]) { circle(i); }"])
+        self.assertEqual(split_statements("circle(1)); rect(1, 2);"), None)
+
+    def test_incremental_parse(self):
+        versions = ["a = 2; b = a * 3; circle(b); rect(a, 1); translate(1, 2) circle(c);",
+                    "a = 5; b = a * 3; circle(b); rect(a, 1); translate(1, 2) circle(c);",
+                    "c = 1; a = 5; b = a * 3; circle(b); rect(a, 1); translate(1, 2) circle(c);",
+                    "c = 1; a = 5; b = a * 3; circle(b); rect(a, 1); translate(1, 2) circle(c); a = 3;",
+                    "a = 5; b = a * 3; circle(b); rect(a, 1); translate(1, 2) circle(c);"]
+        # statements parsed again per version, the ones reading a changed or new global variable included
+        expected_misses = [5, 4, 2, 1, 1]
+        directory = tempfile.mkdtemp()
+        filename = os.path.join(directory, "edit.fcad")
+
+        try:
+            for backend in (ParserBackend.PyParsing, ParserBackend.RecursiveDescent):
+                cache = StatementCache()
+                for source, misses in zip(versions, expected_misses):
+                    with open(filename, "w") as f:
+                        f.write(source)
+
+                    full = FcadParser(filename, backend)
+                    expected = full.parse()
+                    incremental = FcadParser(filename, backend, statement_cache=cache)
+                    before = cache.misses
+
+                    self.assertEqual(repr(incremental.parse()), repr(expected))
+                    self.assertEqual([(e.name, repr(e.value)) for e in incremental.symtab.table],
+                                     [(e.name, repr(e.value)) for e in full.symtab.table])
+                    self.assertEqual(cache.misses - before, misses)
+        finally:
+            shutil.rmtree(directory)
+
+    def test_used_files(self):
+        self.assertEqual(used_files(file_dir + '/data/simple_use.fcad'), [os.path.join(file_dir, 'data', 'simple_assign.fcad')])
+        self.assertEqual(used_files(file_dir + '/data/loop.fcad'), [])
+
+        directory = tempfile.mkdtemp()
+        try:
+            # used files are followed, missing ones and cycles are skipped
+            for name, source in (("main", "use a; use missing; circle(1);"), ("a", "use b; x = 1;"), ("b", "use main; use a; y = 2;")):
+                with open(os.path.join(directory, name + ".fcad"), "w") as f:
+                    f.write(source)
+            self.assertEqual(used_files(os.path.join(directory, "main.fcad")),
+                             [os.path.join(os.path.realpath(directory), name + ".fcad") for name in ("a", "b")])
+        finally:
+            shutil.rmtree(directory)
+
+class TestSymbolTable(unittest.TestCase):
+    def test_insertion_order(self):
+        symtab = SymbolTable()
+        for i in range(100):
+            symtab.insert_global_var("var%d" % (99 - i), i)
+
+        self.assertEqual([entry.name for entry in symtab.table], ["var%d" % (99 - i) for i in range(100)])
+        self.assertEqual(symtab.get_value("var0", KINDS.GLOBAL_VAR, None), 99)
+        self.assertFalse(symtab.contains("var0", KINDS.PARAMETER, None))
+        self.assertRaises(SemanticException, symtab.insert_global_var, "var0", 1)
+
+    def test_parameters(self):
+        symtab = SymbolTable()
+        symtab.insert_module("plate")
+        symtab.insert_parameter("width", "plate")
+        symtab.insert_parameter("height", "plate")
+
+        self.assertEqual(symtab.table[0].parameters, ["width", "height"])
+        self.assertTrue(symtab.contains("width", KINDS.PARAMETER, "plate"))
+        self.assertFalse(symtab.contains("width", KINDS.PARAMETER, None))
+
+    def test_nested_scopes(self):
+        symtab = SymbolTable()
+        symtab.insert_global_var("a", 1)
+
+        outer = symtab.create_scope()
+        outer.insert_loop_var("i", 1)
+        inner = outer.create_scope()
+        inner.insert_loop_var("i", 2)
+
+        self.assertEqual(inner.get_value("i", KINDS.LOOP_VAR, None), 2)
+        self.assertEqual(outer.get_value("i", KINDS.LOOP_VAR, None), 1)
+        self.assertEqual(inner.get_value("a", KINDS.GLOBAL_VAR, None), 1)
+        self.assertFalse(symtab.contains("i", KINDS.LOOP_VAR, None))
+        self.assertTrue(inner.outer is outer)
+
 def create_parse_test(path, file):
     def test(self):
         filename = os.path.abspath(path + file)
@@ -41,11 +220,31 @@ def create_parse_test(path, file):
         if error: self.fail(error)
     return test
 
+def create_backend_test(path, file):
+    def test(self):
+        filename = os.path.abspath(path + file)
+        reference = FcadParser(filename, ParserBackend.PyParsing)
+        reference_result, reference_error = reference.parse()
+
+        parser = FcadParser(filename, ParserBackend.RecursiveDescent)
+        result, error = parser.parse()
+
+        if error: self.fail(error)
+        self.assertTrue(reference_error is None, reference_error)
+        self.assertEqual(repr(result), repr(reference_result))
+        self.assertEqual([(entry.name, repr(entry.value)) for entry in parser.symtab.table],
+                         [(entry.name, repr(entry.value)) for entry in reference.symtab.table])
+    return test
+
 path = file_dir + '/../test/data/'
 for file in os.listdir(path):
     test_name = 'test %s' % file
     test = create_parse_test(path, file)
     setattr(TestFcadParser, test_name, test)
 
+    test_name = 'test backends %s' % file
+    test = create_backend_test(path, file)
+    setattr(TestFcadParser, test_name, test)
+
 if __name__ == '__main__':
     unittest.main()
\ No newline at end of file
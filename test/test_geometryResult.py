@@ -0,0 +1,46 @@
+from __future__ import print_function
+
+from shapely.geometry import Point, LineString, MultiPolygon, GeometryCollection
+
+from src import vectorized
+from src.geometryresult import GeometryResult, ring_buffers
+
+import unittest
+
+
+class TestGeometryResult(unittest.TestCase):
+    def test_buffers(self):
+        holed = Point(0, 0).buffer(10, 4).difference(Point(3, 0).buffer(2, 4)).difference(Point(-4, 0).buffer(2, 4))
+        geom = MultiPolygon([holed, Point(30, 0).buffer(5, 4)])
+        result = GeometryResult(geom)
+        coordinates, offsets, exteriors = result.buffers()
+
+        self.assertEqual(len(result), 4)
+        self.assertEqual(list(exteriors), [True, False, False, True])
+        self.assertEqual([tuple(point) for point in coordinates[offsets[3]:offsets[4]]],
+                         list(geom.geoms[1].exterior.coords))
+        self.assertEqual([[tuple(point) for point in ring] for ring in result.rings(interiors=False)],
+                         [list(holed.exterior.coords), list(geom.geoms[1].exterior.coords)])
+
+        # the array version builds the same buffers as the plain one
+        expected = ring_buffers(geom)
+        if vectorized.is_available():
+            self.assertTrue(vectorized.is_array(coordinates))
+            self.assertTrue(coordinates.flags["C_CONTIGUOUS"])
+        self.assertEqual([tuple(point) for point in coordinates], expected[0])
+        self.assertEqual(list(offsets), expected[1])
+        self.assertEqual(list(exteriors), expected[2])
+
+    def test_lines_and_empty(self):
+        result = GeometryResult(GeometryCollection([Point(0, 0).buffer(1, 1), LineString([(0, 0), (1, 1)])]))
+        self.assertEqual(list(result.exteriors), [True, True])
+        self.assertEqual([tuple(point) for point in list(result.rings())[1]], [(0.0, 0.0), (1.0, 1.0)])
+
+        for empty in (GeometryResult(None), GeometryResult(MultiPolygon())):
+            self.assertFalse(empty)
+            self.assertEqual(len(empty), 0)
+            self.assertEqual(list(empty.rings()), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+from __future__ import print_function
+
+from shapely.geometry import Point, MultiPoint
+
+from src import affinematrix
+from src.primitivecache import PrimitiveCache, create_circle_outline, create_rect_outline
+
+import unittest
+
+
+class TestPrimitiveCache(unittest.TestCase):
+    def test_lru(self):
+        cache = PrimitiveCache(2)
+        created = []
+
+        def create(key):
+            return lambda: created.append(key) or key
+
+        for key in ("a", "b", "a", "c", "b", "a"):
+            cache.get(key, create(key))
+
+        # "b" was the least recently used entry when "c" came in
+        self.assertEqual(created, ["a", "b", "c", "b", "a"])
+        self.assertEqual((cache.hits, cache.misses), (1, 5))
+        self.assertEqual(list(cache.entries.keys()), ["b", "a"])
+
+        cache.clear()
+        self.assertEqual((len(cache), cache.hits, cache.misses), (0, 0, 0))
+
+    def test_identical_output(self):
+        cached = PrimitiveCache()
+        uncached = PrimitiveCache(0)
+        instances = [(x * 12.5 - 300, y * 7.3 + 0.1) for x in range(40) for y in range(25)]
+
+        for cache in (cached, uncached):
+            for x, y in instances:
+                placement = affinematrix.translation(x, y)
+
+                circle = affinematrix.transform(cache.get(("circle", 10, 128), lambda: create_circle_outline(10, 128)), placement)
+                self.assertEqual(list(circle.exterior.coords), list(Point(x, y).buffer(10, 128).exterior.coords))
+
+                rect = affinematrix.transform(cache.get(("rect", 3, 4.5), lambda: create_rect_outline(3, 4.5)), placement)
+                expected = MultiPoint([(x, y), (x, y + 4.5), (x + 3, y + 4.5), (x + 3, y)]).convex_hull
+                self.assertEqual(list(rect.exterior.coords), list(expected.exterior.coords))
+
+        self.assertEqual((cached.hits, cached.misses), (2 * len(instances) - 2, 2))
+        self.assertEqual((len(uncached), uncached.hits, uncached.misses), (0, 0, 2 * len(instances)))
+
+
+if __name__ == '__main__':
+    unittest.main()
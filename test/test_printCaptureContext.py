@@ -0,0 +1,61 @@
+from __future__ import print_function
+import sys
+import threading
+
+try:
+    from cStringIO import StringIO
+except ImportError:
+    from io import StringIO
+
+from src.printcapturecontext import PrintCaptureContext
+
+import unittest
+
+
+class TestPrintCaptureContext(unittest.TestCase):
+    def test_nested(self):
+        stdout = sys.stdout
+        with PrintCaptureContext() as outer:
+            print("a")
+            with PrintCaptureContext() as inner:
+                print("b")
+            print("c")
+
+        self.assertEqual(outer, ["a", "c"])
+        self.assertEqual(inner, ["b"])
+        self.assertTrue(sys.stdout is stdout)
+
+    def test_threads(self):
+        stdout = sys.stdout
+        sys.stdout = console = StringIO()
+        started, printed = threading.Event(), threading.Event()
+        captures = {}
+
+        def render():
+            with PrintCaptureContext() as capture:
+                started.set()
+                print("render")
+                printed.wait(5)
+            captures["render"] = capture
+
+        try:
+            thread = threading.Thread(target=render)
+            thread.start()
+            started.wait(5)
+            # printed on this thread while the render captures its own output
+            print("outside")
+            with PrintCaptureContext() as capture:
+                print("gui")
+            printed.set()
+            thread.join()
+            self.assertTrue(sys.stdout is console)
+        finally:
+            sys.stdout = stdout
+
+        self.assertEqual(console.getvalue(), "outside\n")
+        self.assertEqual(capture, ["gui"])
+        self.assertEqual(captures["render"], ["render"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,115 @@
+from __future__ import print_function
+import json
+import os
+import shutil
+import sys
+import tempfile
+
+from src import batch, profiling
+from src.cadfileparser import FcadParser
+from src.geometrygenerator import GeometryGenerator
+
+import unittest
+
+file_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+class TestProfiling(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.timer = profiling.timer
+
+    def tearDown(self):
+        profiling.disable_profiling()
+        profiling.timer = self.timer
+        shutil.rmtree(self.directory)
+
+    def test_disabled_by_default(self):
+        @profiling.profiled("square")
+        def square(x):
+            """docstring"""
+            return x * x
+
+        self.assertEqual(square(3), 9)
+        self.assertEqual(square.__doc__, "docstring")
+        self.assertEqual(profiling.get_report(), {"timers": {}, "counters": {}})
+        self.assertEqual(profiling.take_samples(), None)
+
+    def test_self_time(self):
+        # a clock that advances by one on every reading
+        ticks = iter(range(100))
+        profiling.timer = lambda: next(ticks)
+
+        @profiling.profiled("inner")
+        def inner():
+            return 1
+
+        @profiling.profiled("outer")
+        def outer(count):
+            with profiling.timed("block"):
+                pass
+            return sum(inner() for i in range(count))
+
+        profiling.enable_profiling()
+        self.assertEqual(outer(3), 3)
+        profiling.count("things", 2)
+
+        report = profiling.get_report()
+        self.assertEqual(report["counters"], {"things": 2})
+        self.assertEqual(sorted(report["timers"].keys()), ["block", "inner", "outer"])
+        self.assertEqual(report["timers"]["inner"]["count"], 3)
+        self.assertEqual(report["timers"]["inner"]["total"], 3)
+        self.assertEqual(report["timers"]["inner"]["p50"], 1)
+        self.assertEqual(report["timers"]["outer"]["total"], 9)
+        self.assertEqual(report["timers"]["outer"]["self"], 5)
+
+    def test_percentiles(self):
+        summary = profiling.summarize([float(i) for i in range(100, 0, -1)])
+        self.assertEqual((summary["min"], summary["p50"], summary["p90"], summary["p99"], summary["max"]),
+                         (1, 50, 90, 99, 100))
+        self.assertEqual(profiling.summarize([2.0])["p99"], 2.0)
+
+    def test_generate(self):
+        profiling.enable_profiling(per_node=True)
+        ast, error = FcadParser(os.path.join(file_dir, "data", "loop.fcad")).parse()
+        GeometryGenerator(800, 600).generate(ast)
+
+        report = profiling.get_report()
+        timers = report["timers"]
+        self.assertEqual(timers["FcadParser.parse"]["count"], 1)
+        self.assertEqual(timers["GeometryGenerator.create_difference"]["count"], 1)
+        self.assertTrue(timers["GeometryGenerator.create_scope"]["total"] >= timers["GeometryGenerator.create_difference"]["self"])
+        self.assertTrue("ArgumentParser.parse" in timers)
+        self.assertTrue("UnresolvedTermResolver.calculate" in timers)
+
+        # both unions, labelled by their path in the program
+        self.assertEqual(report["nodes"]["GeometryGenerator.create_scope difference[0]"]["count"], 1)
+        self.assertEqual(report["nodes"]["GeometryGenerator.create_scope difference[0]/union[1]"]["count"], 1)
+
+    def test_batch(self):
+        inputs = [os.path.join(file_dir, "data", name) for name in ("difference.fcad", "loop.fcad")]
+        report_filename = os.path.join(self.directory, "profile.json")
+
+        stdout = sys.stdout
+        sys.stdout = open(os.devnull, "w")
+        try:
+            for workers in ("1", "2"):
+                # cached subtrees aren't generated again, forked workers would inherit the generator of the first run
+                batch._worker.clear()
+                result = batch.main(inputs + ["-o", self.directory, "-j", workers, "--profile", report_filename,
+                                              "--profile-nodes"])
+                self.assertEqual(result, 0)
+                self.assertFalse(profiling.is_profiling_enabled())
+
+                with open(report_filename) as f:
+                    report = json.load(f)
+                self.assertEqual(report["timers"]["FcadParser.parse"]["count"], 2)
+                self.assertEqual(report["timers"]["SvgGenerator.write"]["count"], 2)
+                self.assertTrue(inputs[1] + ": GeometryGenerator.create_scope difference[0]" in report["nodes"])
+        finally:
+            sys.stdout.close()
+            sys.stdout = stdout
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+from __future__ import print_function
+import threading
+
+from src.cadfileparser import get_backend, ParseContext, ParserBackend
+from src.geometrygenerator import GeometryGenerator, GenerationCancelled
+from src.renderscheduler import RenderScheduler
+
+import unittest
+
+
+class TestRenderScheduler(unittest.TestCase):
+    def setUp(self):
+        self.renders = []
+        self.results = []
+        self.done = threading.Event()
+
+    def finished(self, result):
+        self.results.append(result)
+        self.done.set()
+
+    def test_debounce(self):
+        scheduler = RenderScheduler(lambda cancelled: self.renders.append(1) or len(self.renders), self.finished, delay=0.1)
+        try:
+            # a burst of requests before and after starting leads to one render
+            for i in range(5):
+                scheduler.request()
+            scheduler.start()
+            scheduler.request()
+            scheduler.request()
+
+            self.assertTrue(self.done.wait(5))
+            self.assertEqual(self.results, [1])
+            self.assertEqual(len(self.renders), 1)
+        finally:
+            scheduler.stop(5)
+
+    def test_cancel_stale(self):
+        running = threading.Event()
+        proceed = threading.Event()
+
+        def render(cancelled):
+            self.renders.append(cancelled)
+            if len(self.renders) == 1:
+                running.set()
+                proceed.wait(5)
+                if cancelled():
+                    raise GenerationCancelled()
+            return len(self.renders)
+
+        scheduler = RenderScheduler(render, self.finished, delay=0)
+        scheduler.start()
+        try:
+            scheduler.request()
+            self.assertTrue(running.wait(5))
+            self.assertTrue(scheduler.is_busy())
+
+            # the newer request makes the running render stale, only its own result arrives
+            scheduler.request()
+            self.assertTrue(self.renders[0]())
+            proceed.set()
+
+            self.assertTrue(self.done.wait(5))
+            self.assertEqual(self.results, [2])
+        finally:
+            scheduler.stop(5)
+        self.assertFalse(scheduler.thread.is_alive())
+
+    def test_generation_cancelled(self):
+        # the loop body is a scope, so the loop is expanded one iteration at a time
+        ast = get_backend(ParserBackend.RecursiveDescent).parse_string(
+            "for (i = [0:20]) { difference() { translate(i * 3, 0) circle(2); circle(1); } }", ParseContext())
+        generator = GeometryGenerator(800, 600)
+
+        calls = []
+        self.assertRaises(GenerationCancelled, generator.generate, ast, lambda: calls.append(1) or len(calls) > 3)
+        self.assertEqual(len(calls), 4)
+
+        # nothing half finished is left behind
+        expected = GeometryGenerator(800, 600).generate(ast).geometry
+        self.assertTrue(generator.generate(ast).geometry.equals(expected))
+
+
+if __name__ == '__main__':
+    unittest.main()
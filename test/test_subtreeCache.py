@@ -0,0 +1,49 @@
+from __future__ import print_function
+
+from src.cadfileparser import get_backend, ParseContext, ParserBackend
+from src.subtreecache import SubtreeHasher, split_chunks
+
+import unittest
+
+
+class TestSubtreeCache(unittest.TestCase):
+    def parse(self, source):
+        return get_backend(ParserBackend.RecursiveDescent).parse_string(source, ParseContext())
+
+    def test_digests(self):
+        first = self.parse("union() { translate(1, 2) circle(3); rect(4, 5); }")
+        second = self.parse("union() { translate(1, 2) circle(3); rect(4, 5); }")
+        changed = self.parse("union() { translate(1, 2) circle(3); rect(4, 6); }")
+        hasher = SubtreeHasher()
+
+        self.assertEqual(hasher.digest(first[0]), hasher.digest(second[0]))
+        self.assertNotEqual(hasher.digest(first[0]), hasher.digest(changed[0]))
+        self.assertEqual(hasher.digest(first[0].children[0]), hasher.digest(changed[0].children[0]))
+
+    def test_free_variables(self):
+        ast = self.parse("for (i = [0:n]) { translate(i * d, 0) circle(r); }"
+                         "assign(r = 2) { circle(r + s); }")
+        hasher = SubtreeHasher()
+
+        self.assertEqual(hasher.free_variables(ast[0]), frozenset(["n", "d", "r"]))
+        self.assertEqual(hasher.free_variables(ast[0].children[0]), frozenset(["i", "d", "r"]))
+        self.assertEqual(hasher.free_variables(ast[1]), frozenset(["s"]))
+
+    def test_chunks_after_insertion(self):
+        source = "".join("translate(%d, 0) circle(1);" % i for i in range(200))
+        inserted = "rect(1, 1);" + source
+        hasher = SubtreeHasher()
+
+        def chunks(nodes):
+            return [tuple(hasher.digest(node) for node in chunk) for chunk in split_chunks(nodes, [hasher.digest(node) for node in nodes])]
+
+        before = chunks(self.parse(source))
+        after = chunks(self.parse(inserted))
+
+        # only the chunk the new operand went into differs
+        self.assertGreater(len(before), 2)
+        self.assertEqual(before[1:], after[1:])
+
+
+if __name__ == '__main__':
+    unittest.main()
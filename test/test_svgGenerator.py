@@ -0,0 +1,68 @@
+from __future__ import print_function
+import os
+import shutil
+import tempfile
+import xml.etree.ElementTree as ElementTree
+
+from shapely.geometry import Point, MultiPolygon, LineString, GeometryCollection
+
+from src import svggenerator
+from src.geometryresult import GeometryResult
+from src.svggenerator import SvgGenerator
+
+import unittest
+
+
+def read_paths(filename):
+    return [element.get("d") for element in ElementTree.parse(filename).getroot().iter("{http://www.w3.org/2000/svg}path")]
+
+
+def absolute_points(data):
+    """Points of an svg path made of one move command followed by implicit lines."""
+    relative = data[0] == "m"
+    values = [float(value) for value in data[1:].rstrip("Zz").split()]
+    points = [(values[0], values[1])]
+    for x, y in zip(values[2::2], values[3::2]):
+        points.append((round(points[-1][0] + x, 6), round(points[-1][1] + y, 6)) if relative else (x, y))
+    return points
+
+
+class TestSvgGenerator(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.filename = os.path.join(self.directory, "out.svg")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_paths(self):
+        holed = Point(400, 300).buffer(10, 2).difference(Point(400, 300).buffer(3, 1))
+        SvgGenerator().write(GeometryCollection([holed, LineString([(0, 0), (10.25, -0.0001)])]), self.filename)
+
+        self.assertEqual(read_paths(self.filename), [
+            "M407.071 292.929 400 290 392.929 292.929 390 300 392.929 307.071 400 310 407.071 307.071 410 300Z",
+            "M400 303 397 300 400 297 403 300Z",
+            "M0 0 10.25 0"])
+
+    def test_relative(self):
+        geom = MultiPolygon([Point(i * 7.3, i * 0.77).buffer(3.3, 8) for i in range(200)])
+        svggenerator.BLOCK_SIZE, block_size = 100, svggenerator.BLOCK_SIZE
+
+        try:
+            for precision in (0, 2, 4):
+                absolute = os.path.join(self.directory, "absolute.svg")
+                SvgGenerator(precision=precision).write(GeometryResult(geom), absolute)
+                SvgGenerator(precision=precision, relative=True).write(GeometryResult(geom), self.filename)
+
+                # both describe the same rounded outlines, the relative one in fewer characters
+                expected = [[(round(x, precision), round(y, precision)) for x, y in polygon.exterior.coords[:-1]]
+                            for polygon in geom.geoms]
+                self.assertEqual([absolute_points(data) for data in read_paths(absolute)], expected)
+                self.assertEqual([absolute_points(data) for data in read_paths(self.filename)], expected)
+                self.assertLess(os.path.getsize(self.filename), os.path.getsize(absolute))
+        finally:
+            svggenerator.BLOCK_SIZE = block_size
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+from __future__ import print_function
+import os
+
+from src import tracing
+from src.cadfileparser import FcadParser, ParseContext, SemanticException, get_grammar
+
+import unittest
+
+file_dir = os.path.dirname(os.path.realpath(__file__))
+
+
+class TestTracing(unittest.TestCase):
+    def tearDown(self):
+        tracing.disable_tracing()
+
+    def test_disabled_by_default(self):
+        tracing.disable_tracing()
+        filename = os.path.abspath(file_dir + '/../test/data/complex_example.fcad')
+
+        result, error = FcadParser(filename).parse()
+        if error:
+            self.fail(error)
+
+        self.assertFalse(get_grammar().tracing_enabled)
+        self.assertEqual(tracing.get_trace_events(), [])
+
+    def test_ring_buffer(self):
+        tracing.enable_tracing(16)
+        filename = os.path.abspath(file_dir + '/../test/data/complex_example.fcad')
+
+        parser = FcadParser(filename)
+        self.assertTrue(parser.backend.tracing_enabled)
+
+        result, error = parser.parse()
+        if error:
+            self.fail(error)
+
+        events = tracing.get_trace_events()
+        self.assertEqual(len(events), 16)
+        self.assertEqual(events[-1].name, "parse_result")
+        self.assertTrue(any(event.name == "for_loop_scope_action" for event in events))
+        self.assertEqual(len(tracing.format_trace(events)), 16)
+
+    def test_failed_action(self):
+        tracing.enable_tracing()
+
+        self.assertRaises(SemanticException, get_grammar().parse_string, "a = 1; a = 2;", ParseContext())
+
+        events = tracing.get_trace_events()
+        self.assertEqual(events[-1].name, "assign_action_failed")
+        self.assertTrue(isinstance(events[-1].data, SemanticException))
+
+        tracing.clear_trace()
+        self.assertEqual(tracing.get_trace_events(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
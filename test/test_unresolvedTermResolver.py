@@ -0,0 +1,53 @@
+from __future__ import print_function
+
+from src.cadfileparser import get_backend, ParseContext, ParserBackend, SemanticException, Assignment
+from src.unresolvedtermresolver import UnresolvedTermResolver
+
+import unittest
+
+
+class TestUnresolvedTermResolver(unittest.TestCase):
+    def parse(self, source):
+        return get_backend(ParserBackend.RecursiveDescent).parse_string(source, ParseContext())
+
+    def test_loop_calculations(self):
+        ast = self.parse("offset = 3; for (i = [0:5]) { translate(i * 2 + offset, (i - 1) ^ 2 / 4) circle(r=i + 1); }")
+        resolver = UnresolvedTermResolver()
+
+        loop = ast[0]
+        statement = loop.children[0]
+        x, y = statement.modifiers[0].arguments
+        radius = statement.arguments[0].value
+
+        for i in loop.indices():
+            before = repr(statement)
+
+            resolver.push_assignments([Assignment(loop.variable, i)])
+            self.assertEqual(resolver.calculate(x), i * 2 + 3)
+            self.assertEqual(resolver.calculate(y), (i - 1) ** 2 / 4)
+            self.assertEqual(resolver.calculate(radius), i + 1)
+            resolver.pop_assignments()
+
+            self.assertEqual(repr(statement), before)
+
+    def test_compiled_once(self):
+        calculation = self.parse("circle(x * 2 - 1);")[0].arguments[0]
+        self.assertTrue(calculation.compile() is calculation.compile())
+        self.assertEqual(calculation.compile()(lambda name: {"x": 4}[name]), 7)
+
+    def test_shadowing(self):
+        calculation = self.parse("circle(x * 10 + y);")[0].arguments[0]
+        resolver = UnresolvedTermResolver()
+
+        resolver.push_assignments([Assignment("x", 1), Assignment("y", 2)])
+        resolver.push_assignments([Assignment("x", 3)])
+        self.assertEqual(resolver.calculate(calculation), 32)
+        resolver.pop_assignments()
+        self.assertEqual(resolver.calculate(calculation), 12)
+        resolver.pop_assignments()
+
+        self.assertRaises(SemanticException, resolver.calculate, calculation)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+from __future__ import print_function
+
+from shapely import affinity
+from shapely.geometry import Point, MultiPoint
+
+from src import vectorized
+
+import unittest
+
+
+@unittest.skipUnless(vectorized.is_available(), "numpy and shapely 2 required")
+class TestVectorized(unittest.TestCase):
+    def assertSameCoordinates(self, geoms, expected):
+        self.assertEqual(len(geoms), len(expected))
+        for geom, other in zip(geoms, expected):
+            self.assertEqual(geom.geom_type, other.geom_type)
+            for a, b in zip(geom.exterior.coords, other.exterior.coords):
+                self.assertAlmostEqual(a[0], b[0], places=9)
+                self.assertAlmostEqual(a[1], b[1], places=9)
+
+    def test_primitives(self):
+        radius = vectorized.numpy.array([1.0, 2.0, 3.0])
+        circles = vectorized.create_circles(5, 6, radius, 8, 3)
+        self.assertSameCoordinates(circles, [Point(5, 6).buffer(r, 8) for r in (1, 2, 3)])
+        self.assertSameCoordinates(vectorized.create_circles(5, 6, 2, 8, 3), [Point(5, 6).buffer(2, 8)] * 3)
+
+        rects = vectorized.create_rects(1, 2, radius, 4, 3)
+        self.assertSameCoordinates(rects, [MultiPoint([(1, 2), (1, 6), (1 + w, 6), (1 + w, 2)]).convex_hull for w in (1, 2, 3)])
+
+    def test_transform(self):
+        angles = vectorized.numpy.array([0.0, 30.0, 90.0])
+        geoms = vectorized.create_rects(0, 0, 2, 1, 3)
+        expected = [affinity.scale(affinity.rotate(affinity.translate(geom, 3, 4), angle, Point(1, 1)), 2, 3)
+                    for geom, angle in zip(list(geoms), angles)]
+
+        matrices = vectorized.compose(vectorized.rotation_matrices(angles, 1, 1, False, 3), vectorized.translation_matrices(3, 4, 3))
+        geoms = vectorized.transform(geoms, matrices)
+        geoms = vectorized.transform(geoms, vectorized.scale_matrices(2, 3, geoms))
+
+        self.assertSameCoordinates(geoms, expected)
+
+    def test_outlines(self):
+        angles = vectorized.numpy.array([0.0, 30.0, 90.0])
+        matrices = vectorized.compose(vectorized.rotation_matrices(angles, 1, 1, False, 3), vectorized.translation_matrices(3, 4, 3))
+        outlines = vectorized.circle_outlines(5, 6, 2, 8, 3)
+        self.assertTrue(vectorized.is_outlines(outlines))
+        self.assertTrue(vectorized.circle_outlines(5, 6, 0, 8, 3) is None)
+
+        # kept as outlines through a scale, the result is the same as with polygons all the way
+        outlines = vectorized.transform(outlines, matrices)
+        outlines = vectorized.transform(outlines, vectorized.scale_matrices(2, 3, outlines))
+        geoms = vectorized.transform(vectorized.create_circles(5, 6, 2, 8, 3), matrices)
+        geoms = vectorized.transform(geoms, vectorized.scale_matrices(2, 3, geoms))
+
+        self.assertSameCoordinates(vectorized.to_geometries(outlines), geoms)
+        self.assertTrue(vectorized.to_geometries(geoms) is geoms)
+
+    def test_punch_holes(self):
+        part = Point(0, 0).buffer(10).difference(Point(5, 0).buffer(1))
+        holes = [Point(-5, 0).buffer(1), Point(0, 5).buffer(1)]
+
+        result = vectorized.punch_holes(part, holes)
+        self.assertEqual(len(result.interiors), 3)
+        self.assertAlmostEqual(result.area, part.difference(holes[0]).difference(holes[1]).area)
+        self.assertTrue(vectorized.punch_holes(part, [Point(9.5, 0).buffer(1)]) is None)
+        self.assertTrue(vectorized.punch_holes(part, [result]) is None)
+
+    def test_nested_order(self):
+        # for (i = [0:2]) { a; for (j = [0:3]) { b; } }
+        bindings = vectorized.nest_bindings([], 1, "i", 0, 2)
+        outer = vectorized.nest_keys(vectorized.root_keys(), 2, 4)
+        inner = vectorized.nest_keys(outer + 1, 3, 1)
+        bindings = vectorized.nest_bindings(bindings, 2, "j", 0, 3)
+
+        self.assertEqual([list(values) for name, values in bindings], [[0, 0, 0, 1, 1, 1], [0, 1, 2, 0, 1, 2]])
+        self.assertEqual(list(outer), [0, 4])
+        self.assertEqual(list(inner), [1, 2, 3, 5, 6, 7])
+
+
+if __name__ == '__main__':
+    unittest.main()
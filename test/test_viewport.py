@@ -0,0 +1,68 @@
+from __future__ import print_function
+
+from shapely.geometry import Point, LineString, MultiPolygon, GeometryCollection, box
+
+from src.geometryresult import GeometryResult
+from src.viewport import Viewport, RingIndex, LEVEL_TOLERANCES
+
+import unittest
+
+
+class TestViewport(unittest.TestCase):
+    def test_zoom_and_pan(self):
+        viewport = Viewport()
+        viewport.zoom_at(100, 50, 4)
+
+        # the point under the cursor stays in place
+        self.assertEqual(viewport.to_screen(100, 50), (100, 50))
+        self.assertEqual(viewport.to_drawing(*viewport.to_screen(7, 3)), (7, 3))
+        self.assertEqual(viewport.pixel_size(), 0.25)
+
+        viewport.pan(20, -8)
+        self.assertEqual(viewport.visible_area(0, 0, 400, 200), (70, 39.5, 170, 89.5))
+
+        viewport.reset()
+        self.assertEqual(viewport.visible_area(0, 0, 400, 200), (0, 0, 400, 200))
+
+
+class TestRingIndex(unittest.TestCase):
+    def setUp(self):
+        # a row of holed squares
+        squares = [box(i * 10, 0, i * 10 + 8, 8).difference(Point(i * 10 + 4, 4).buffer(2, 16)) for i in range(20)]
+        self.result = GeometryResult(MultiPolygon(squares))
+        self.index = RingIndex(self.result)
+
+    def test_visible(self):
+        # each square and its hole
+        self.assertEqual(len(self.index), 40)
+        self.assertEqual(self.index.bounds[6], [30, 0, 38, 8])
+        self.assertEqual(self.index.bounds[7], [32, 2, 36, 6])
+        self.assertEqual(self.index.visible((25, -5, 41.5, 1)), [4, 6, 8])
+        self.assertEqual(self.index.visible((33, 3, 34, 4)), [6, 7])
+        self.assertEqual(self.index.visible((0, 20, 100, 30)), [])
+
+        # lines are drawn as well
+        index = RingIndex(GeometryResult(GeometryCollection([box(0, 0, 8, 8), LineString([(20, 0), (30, 5)])])))
+        self.assertEqual(index.visible((25, 0, 26, 1)), [1])
+        self.assertEqual(index.outline(0, 1), [(20, 0), (30, 5)])
+
+    def test_levels(self):
+        self.assertEqual(self.index.level_for(0.01), 0)
+        self.assertEqual(self.index.level_for(1), LEVEL_TOLERANCES.index(0.5))
+        self.assertEqual(self.index.level_for(1000), len(LEVEL_TOLERANCES) - 1)
+        self.assertTrue(self.index.is_tiny(0, 10))
+        self.assertFalse(self.index.is_tiny(0, 1))
+
+        circles = RingIndex(GeometryResult(MultiPolygon([Point(i * 10, 0).buffer(4, 32) for i in range(5)])))
+        original = circles.outline(0, 2)
+        self.assertEqual(original, list(Point(20, 0).buffer(4, 32).exterior.coords))
+
+        # coarser levels have fewer points, all of them taken from the original outline
+        sizes = [len(circles.outline(level, 2)) for level in range(len(LEVEL_TOLERANCES))]
+        self.assertEqual(sorted(sizes, reverse=True), sizes)
+        self.assertTrue(sizes[-1] < sizes[0])
+        self.assertTrue(set(circles.outline(4, 2)) <= set(original))
+
+
+if __name__ == '__main__':
+    unittest.main()